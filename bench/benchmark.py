@@ -0,0 +1,203 @@
+"""
+批处理流程基准测试：python -m sub0_2_1_5 benchmark [选项]（或 python -m bench.benchmark [选项]）
+用确定的替身程序（bench/standin_tool.py）代替 ffmpeg / ffprobe / FontForge / Spp2Pgs，
+替身程序与样本生成函数也供 tests/ 下的测试使用
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sub0_2_1_5 import SubtitleEngine, configure_logging
+
+STANDIN_TOOLS = ("ffmpeg", "ffprobe", "fontforge", "Spp2Pgs")
+STANDIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "standin_tool.py")
+
+
+def build_font(path, family, glyphs):
+    """生成确定的 TrueType 字体（每个字形是一个矩形）作为附件字体样本"""
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+    chars = [0x4E00 + i for i in range(glyphs)]
+    order = [".notdef"] + [f"uni{c:04X}" for c in chars]
+    outlines = {}
+    for i, name in enumerate(order):
+        pen = TTGlyphPen(None)
+        pen.moveTo((50, 0))
+        pen.lineTo((50, 700 - i % 300))
+        pen.lineTo((450, 700 - i % 300))
+        pen.lineTo((450, 0))
+        pen.closePath()
+        outlines[name] = pen.glyph()
+    fb = FontBuilder(1000, isTTF=True)
+    fb.setupGlyphOrder(order)
+    fb.setupCharacterMap({c: f"uni{c:04X}" for c in chars})
+    fb.setupGlyf(outlines)
+    fb.setupHorizontalMetrics({name: (500, 50) for name in order})
+    fb.setupHorizontalHeader(ascent=800, descent=-200)
+    fb.setupNameTable({"familyName": family, "styleName": "Regular"})
+    fb.setupOS2()
+    fb.setupPost()
+    fb.save(path)
+
+
+def install_standins(root, fonts=(), subs=2, lines=20, sup_bytes=1024, latency=None, calls_log=None):
+    """
+    在 root 下生成替身程序的配置与启动脚本（仅 POSIX），返回 (bin 目录, 配置文件路径)
+    调用方需要把 bin 目录放到 PATH 最前面，并把 SUBEXP_BENCH_CONFIG 设为配置文件路径
+    :param fonts: [{"subset": 子集字体名, "name": 原字体名, "file": 字体文件}]，作为每个视频的附件
+    :param calls_log: 给出时替身程序把每次调用记录到该文件（JSON Lines），测试用
+    """
+    bin_dir = os.path.join(root, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    config = {"latency_ms": latency or {}, "subs": subs, "lines": lines, "sup_bytes": sup_bytes,
+              "fonts": list(fonts), "calls_log": calls_log}
+    config_path = os.path.join(root, "standin_config.json")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False)
+    for name in STANDIN_TOOLS:
+        path = os.path.join(bin_dir, name)
+        with open(path, "w", encoding="utf-8", newline="\n") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{STANDIN_SCRIPT}" {name} "$@"\n')
+        os.chmod(path, 0o755)
+    return bin_dir, config_path
+
+
+def benchmark_main(argv=None):
+    """
+    基准测试：生成合成视频、ASS 与字体样本，运行真实的探测与批处理流程（load_files + run_batch），
+    报告 文件/秒、各阶段耗时与随并行数的扩展情况
+    给出 --baseline 时与之前保存的 --json 结果比较，文件/秒下降超过 --tolerance 时返回 1（可用于 CI）
+    """
+    parser = argparse.ArgumentParser(prog="sub0_2_1_5 benchmark", description="批处理流程基准测试（不需要真实媒体工具）")
+    parser.add_argument("--videos", type=int, default=16, help="合成视频数量（默认 16）")
+    parser.add_argument("--subs", type=int, default=2, help="每个视频的字幕轨道数（默认 2）")
+    parser.add_argument("--fonts", type=int, default=3, help="每个视频的字体附件数（默认 3）")
+    parser.add_argument("--glyphs", type=int, default=300, help="每个字体样本的字形数（默认 300）")
+    parser.add_argument("--lines", type=int, default=2000, help="每个字幕轨道的行数（默认 2000）")
+    parser.add_argument("--sup-bytes", type=int, default=256 * 1024, help="替身生成的 SUP 大小（默认 256 KB）")
+    parser.add_argument("--latency", default="ffmpeg=20,ffprobe=10,fontforge=30,spp2pgs=50",
+                        help="各替身程序的固定延迟（毫秒），如 ffmpeg=20,ffprobe=10")
+    parser.add_argument("--workers", default="1,2,4", help="依次测试的并行视频数（默认 1,2,4）")
+    parser.add_argument("--scenarios", default="ass/封装字体,ass/子集合并,srt/无处理,sup/无处理",
+                        help="格式/字体处理方式组合，逗号分隔")
+    parser.add_argument("--json", help="把结果写入 JSON 文件（可作为之后的 --baseline）")
+    parser.add_argument("--baseline", help="与之前的 --json 结果比较")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的文件/秒下降比例（默认 0.25）")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录")
+    args = parser.parse_args(argv)
+
+    if os.name == "nt":
+        # 替身程序的启动脚本是 sh 脚本，Windows 的 CreateProcess 只能按名称启动 .exe
+        print("❌ 基准测试的替身程序需要 POSIX 系统（Linux / macOS）")
+        return 2
+
+    latency = {}
+    for item in filter(None, args.latency.split(",")):
+        tool, _, ms = item.partition("=")
+        latency[tool.strip().lower()] = float(ms)
+    workers_list = [int(w) for w in args.workers.split(",") if w.strip()]
+    scenarios = [tuple(item.strip().split("/", 1)) for item in args.scenarios.split(",") if item.strip()]
+
+    root = tempfile.mkdtemp(prefix="subs_bench_")
+    try:
+        # --- 样本：字体、配置与替身程序 ---
+        fonts = []
+        for i in range(args.fonts):
+            subset = f"BENCH{i:03d}X"
+            path = os.path.join(root, f"{subset}.ttf")
+            build_font(path, subset, args.glyphs)
+            fonts.append({"subset": subset, "name": f"Bench Sans {i}", "file": path})
+        bin_dir, config_path = install_standins(root, fonts, args.subs, args.lines, args.sup_bytes, latency)
+        os.environ["SUBEXP_BENCH_CONFIG"] = config_path
+        os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+
+        video_dir = os.path.join(root, "videos")
+        os.makedirs(video_dir)
+        paths = []
+        for i in range(args.videos):
+            path = os.path.join(video_dir, f"Bench.S01E{i + 1:02d}.mp4")
+            with open(path, "wb") as f:
+                f.write(bytes(range(256)) * 64)  # 非 Matroska，走 ffmpeg 流程
+            paths.append(path)
+
+        # --- 运行：同一个引擎依次运行各组合，每次输出到新目录 ---
+        results = []
+        configure_logging("WARNING", console=False)  # 只保留警告与错误，不输出到终端，避免日志 I/O 计入耗时
+        engine = SubtitleEngine(journal_name="benchmark")
+        engine.close()
+        engine.probe_cache = engine.output_manifest = engine.journal = None  # 每次都完整运行
+        engine.base_dir = Path(root)  # 不使用程序目录下的真实工具
+        engine.spp2pgs_exe = Path(bin_dir) / "Spp2Pgs"
+        engine.tracer.enabled = True  # 各阶段耗时来自跟踪 span，不导出文件
+        for subfmt, font_mode in scenarios:
+            base_rate = None
+            for workers in workers_list:
+                engine.tracer.reset()
+                engine.files.clear()
+                engine.max_workers = workers
+                outdir = os.path.join(root, "out", f"{subfmt}_{font_mode}_{workers}")
+                os.makedirs(outdir)
+
+                t0 = time.perf_counter()
+                records, _ = engine.load_files(paths)
+                selected = [(record.fullpath, record.filename) for record in records]
+                engine.run_batch(subfmt, selected, outdir, font_mode)
+                wall = time.perf_counter() - t0
+
+                batch = engine.batch_results()
+                rate = len(paths) / wall
+                base_rate = base_rate or rate
+                results.append({
+                    "scenario": f"{subfmt}/{font_mode}", "workers": workers, "wall": wall,
+                    "files_per_sec": rate, "speedup": rate / base_rate,
+                    "outputs": sum(len(outputs) for _, _, outputs in batch),
+                    "failed": sum(1 for _, status, _ in batch if status != "success"),
+                    "stages": {name: {"seconds": total, "calls": count}
+                               for name, (count, total, _) in engine.last_trace_stats.items()},
+                })
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+        else:
+            print(f"临时目录已保留: {root}")
+
+    # --- 报告 ---
+    print(f"{args.videos} 个视频 × {args.subs} 轨道 × {args.fonts} 字体，延迟 {latency}")
+    print(f"{'组合':<16}{'并行':>4}{'耗时(s)':>9}{'文件/秒':>9}{'加速比':>7}{'输出':>6}{'失败':>5}")
+    for r in results:
+        print(f"{r['scenario']:<16}{r['workers']:>4}{r['wall']:>9.2f}{r['files_per_sec']:>9.2f}"
+              f"{r['speedup']:>7.2f}{r['outputs']:>6}{r['failed']:>5}")
+    print("\n各阶段累计耗时（秒，多线程时为各线程之和）/ 调用次数：")
+    for r in results:
+        stages = ", ".join(f"{name}={st['seconds']:.2f}/{st['calls']}" for name, st in r["stages"].items())
+        print(f"  {r['scenario']} ×{r['workers']}: {stages}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+    ok = all(r["failed"] == 0 for r in results)
+    if not ok:
+        print("❌ 有视频未能成功处理")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = {(r["scenario"], r["workers"]): r for r in json.load(f)["results"]}
+        for r in results:
+            base = baseline.get((r["scenario"], r["workers"]))
+            if base and r["files_per_sec"] < base["files_per_sec"] * (1 - args.tolerance):
+                print(f"❌ 性能回退: {r['scenario']} ×{r['workers']} "
+                      f"{base['files_per_sec']:.2f} → {r['files_per_sec']:.2f} 文件/秒")
+                ok = False
+        if ok:
+            print("✅ 未发现性能回退")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(benchmark_main(sys.argv[1:]))
@@ -0,0 +1,87 @@
+"""
+基准测试与测试用的替身程序：按工具名（ffmpeg / ffprobe / fontforge / Spp2Pgs）模拟对应工具的输入输出
+用法：python standin_tool.py <工具名> <参数...>（由 bench.benchmark.install_standins 生成的启动脚本调用）
+固定延迟与输出内容由 SUBEXP_BENCH_CONFIG 指向的 JSON 配置决定，结果完全确定
+"""
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+cfg = json.load(open(os.environ["SUBEXP_BENCH_CONFIG"], encoding="utf-8"))
+tool = sys.argv[1].lower()  # 启动脚本传入的工具名
+args = sys.argv[2:]
+if cfg.get("calls_log"):  # 测试用：每次调用追加一行 [工具名, 参数...]
+    with open(cfg["calls_log"], "a", encoding="utf-8") as f:
+        f.write(json.dumps([tool] + args, ensure_ascii=False) + "\n")
+sys.stdout.reconfigure(encoding="utf-8")
+time.sleep(cfg["latency_ms"].get(tool, 0) / 1000)
+fonts = cfg["fonts"]
+
+
+def ts(sec):
+    return f"{int(sec // 3600)}:{int(sec % 3600 // 60):02d}:{sec % 60:05.2f}"
+
+
+def ass_text():
+    lines = ["[Script Info]", "ScriptType: v4.00+", "PlayResX: 1920", "PlayResY: 1080"]
+    lines += [f"; Font Subset: {f['subset']} - {f['name']}" for f in fonts]
+    lines += ["", "[V4+ Styles]",
+              "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, "
+              "Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+              "Alignment, MarginL, MarginR, MarginV, Encoding"]
+    faces = [f["subset"] for f in fonts] or ["Arial"]  # 没有附件字体时使用系统字体名
+    lines += [f"Style: S{i},{face},60,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,2,0,"
+              f"2,10,10,10,1" for i, face in enumerate(faces)]
+    lines += ["", "[Events]", "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text"]
+    for i in range(cfg["lines"]):
+        lines.append(f"Dialogue: 0,{ts(i * 2)},{ts(i * 2 + 1.5)},S{i % len(faces)},,0,0,0,,"
+                     f"{{\\fn{faces[i % len(faces)]}}}第 {i} 行字幕 benchmark line")
+    return "\n".join(lines) + "\n"
+
+
+def srt_text():
+    return "".join(f"{i + 1}\n00:00:{i % 60:02d},000 --> 00:00:{i % 60:02d},500\nline {i}\n\n" for i in range(cfg["lines"]))
+
+
+if tool == "ffprobe":
+    streams = [{"index": 0, "codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080,
+                "r_frame_rate": "24000/1001"}]
+    for i in range(cfg["subs"]):
+        streams.append({"index": len(streams), "codec_type": "subtitle", "codec_name": "ass",
+                        "tags": {"language": ("chi", "eng")[i % 2]}})
+    for f in fonts:
+        streams.append({"index": len(streams), "codec_type": "attachment", "codec_name": "ttf",
+                        "tags": {"filename": f["subset"] + ".ttf", "mimetype": "font/ttf"}})
+    print(json.dumps({"streams": streams}))
+
+elif tool == "ffmpeg":
+    if "-dump_attachment:t" in args:
+        for f in fonts:
+            shutil.copyfile(f["file"], os.path.join(os.getcwd(), f["subset"] + ".ttf"))
+    outputs = [a for a in args[args.index("-i") + 2:]
+               if os.path.splitext(a)[1].lower() in (".ass", ".ssa", ".srt", ".vtt", ".sup", ".sub")]
+    for out in outputs:
+        ext = os.path.splitext(out)[1].lower()
+        if ext in (".ass", ".ssa"):
+            open(out, "w", encoding="utf-8").write(ass_text())
+        elif ext in (".srt", ".vtt"):
+            open(out, "w", encoding="utf-8").write(srt_text())
+        else:
+            open(out, "wb").write(b"\0" * cfg["sup_bytes"])
+    if not outputs:
+        sys.stderr.write("At least one output file must be specified\n")
+        sys.exit(1)
+
+elif tool == "fontforge":
+    script = open(args[args.index("-script") + 1], encoding="utf-8").read()
+    output = re.search(r'output_file = r"(.*)"', script).group(1)
+    inputs = [p for p in re.findall(r'r"(.*?)"', script.split("output_file")[0]) if os.path.exists(p)]
+    shutil.copyfile(inputs[0], output)
+    print(f"✅ 字体保存成功: {output}")
+
+elif tool == "spp2pgs":
+    open(args[-1], "wb").write(b"\0" * cfg["sup_bytes"])
+    print("Encoding successfully completed.")
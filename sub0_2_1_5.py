@@ -1,25 +1,50 @@
 import os
 import re
+import asyncio
 import threading
+import queue
 import subprocess
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-from tkinterdnd2 import TkinterDnD, DND_FILES
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, as_completed
+try:
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox
+except ImportError:  # 无图形界面的 Python 只能使用命令行模式
+    tk = ttk = filedialog = messagebox = None
 import shutil
 import tempfile
 import glob
+import locale
 import sys
 import json
-import winreg
+import time
+import sqlite3
+import io
+import mmap
+import zlib
+import argparse
+import contextlib
+import collections
+import functools
+import logging
+import logging.handlers
+import atexit
+import select
+import struct
 from pathlib import Path
 import ctypes
-from fontTools.ttLib import TTFont
-from pypinyin import lazy_pinyin
+import ctypes.util
+# fontTools / pypinyin 在首次处理字体时才导入（pypinyin 的词典导入较慢且占用大量内存），不拖慢窗口启动
 
 # =======================
-# DPI 设置
+# DPI 设置（仅图形界面启动时调用，命令行模式不加载 Windows 接口）
 # =======================
-if sys.platform == "win32":
+MONITOR_DEFAULTTONEAREST = 2
+MDT_EFFECTIVE_DPI = 0
+
+
+def enable_dpi_awareness():
+    if sys.platform != "win32":
+        return
     try:
         # Per-monitor DPI awareness
         ctypes.windll.shcore.SetProcessDpiAwareness(2)
@@ -29,14 +54,13 @@ if sys.platform == "win32":
         except Exception:
             pass
 
-shcore = ctypes.windll.shcore
-user32 = ctypes.windll.user32
-MONITOR_DEFAULTTONEAREST = 2
-MDT_EFFECTIVE_DPI = 0
-
 
 def get_monitor_dpi(hwnd):
     """返回窗口所在显示器的缩放系数"""
+    if sys.platform != "win32":
+        return 1.0
+    shcore = ctypes.windll.shcore
+    user32 = ctypes.windll.user32
     hmon = user32.MonitorFromWindow(hwnd, MONITOR_DEFAULTTONEAREST)
     dpiX = ctypes.c_uint()
     dpiY = ctypes.c_uint()
@@ -44,26 +68,1668 @@ def get_monitor_dpi(hwnd):
     return dpiX.value / 96  # 96 DPI 为 100% 缩放
 
 
-class SubtitleExtractorApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("批量字幕提取工具")
-        # 获取 DPI 缩放比例
-        self.scale = get_monitor_dpi(self.root.winfo_id())
-        # 初始化总表格
-        self.font_name_registry = {}  # { "字体文件名": {nameID: {platformID: string, ...}, ... } }
+# =======================
+# 日志：按级别过滤，最近的日志保存在有界环形缓冲（图形界面日志面板读取），文件由后台线程写入
+# =======================
+logger = logging.getLogger("SubtitleExporter")
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
 
-        # 动态设置窗口大小
-        base_width, base_height = 600, 400
-        self.root.geometry(f"{int(base_width * self.scale)}x{int(base_height * self.scale)}")
-        self.root.minsize(width=int(550 * self.scale), height=int(200 * self.scale))
-        self.files = []  # 存储(全路径, 文件名)
-        self.items = {}  # item_id: (checked, fullpath, filename)
-        self.original_files = []  # 用来存储原始文件名，便于还原
-        self.renamed_files = []  # 用来保存重命名后的文件与原始文件的映射
 
-        # 文件列表字段顺序
-        self.file_fields = ["fullpath", "filename", "checked", "width", "height", "fps", "probe_info"]
+def log_level_of(msg):
+    """未指定级别的日志按前缀推断：❌/💥 为错误，⚠️ 为警告，其余为信息"""
+    if msg.startswith(("❌", "💥")):
+        return logging.ERROR
+    if msg.startswith("⚠️"):
+        return logging.WARNING
+    return logging.INFO
+
+
+class LogRingBuffer(logging.Handler):
+    """
+    最近日志的有界环形缓冲：超出容量的旧日志直接丢弃，内存占用与导入/处理的文件数量无关
+    每条日志带递增序号，读取方记住上次读到的序号，只取新增部分
+    """
+
+    def __init__(self, capacity=5000):
+        super().__init__(logging.DEBUG)
+        self._entries = collections.deque(maxlen=capacity)  # (序号, 级别, 文本)
+        self._seq = 0
+        self.setFormatter(logging.Formatter("%(asctime)s %(message)s", "%H:%M:%S"))
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self._seq += 1  # emit 由 Handler.handle 在 self.lock 内调用
+        self._entries.append((self._seq, record.levelno, line))
+
+    def since(self, seq):
+        """返回 (最新序号, [(级别, 文本), ...])：序号大于 seq 且仍在缓冲中的日志"""
+        with self.lock:
+            new = []
+            for entry in reversed(self._entries):
+                if entry[0] <= seq:
+                    break
+                new.append(entry[1:])
+            new.reverse()
+            return self._seq, new
+
+
+_log_handlers = []  # configure_logging 安装的处理器，重复调用时先移除
+_log_listener = None
+
+
+def configure_logging(level="INFO", log_file=None, console=True, ring_capacity=5000):
+    """
+    配置日志输出，可重复调用（后一次的设置替换前一次）：
+    - console：输出到 stderr（命令行/监视模式），图形界面不输出到控制台
+    - log_file：写入文件（按 10 MB 轮换，保留 3 个），格式化与磁盘写入在后台线程进行，不阻塞处理线程
+    - 始终保留一个容量为 ring_capacity 的环形缓冲，返回该缓冲
+    调试级别未启用时，logger.debug 的参数不会被格式化
+    """
+    global _log_listener
+    for handler in _log_handlers:
+        logger.removeHandler(handler)
+    _log_handlers.clear()
+    if _log_listener is not None:
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.close()
+        _log_listener = None
+
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+
+    ring = LogRingBuffer(ring_capacity)
+    _log_handlers.append(ring)
+    if console:
+        stream = logging.StreamHandler(sys.stderr)
+        stream.setFormatter(logging.Formatter("%(message)s"))
+        _log_handlers.append(stream)
+    if log_file:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=10 * 1024 * 1024, backupCount=3, encoding="utf-8", delay=True)
+        except OSError as e:
+            logger.warning(f"⚠️ 无法写入日志文件 {log_file}: {e}")
+        else:
+            file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s [%(threadName)s] %(message)s"))
+            records = queue.SimpleQueue()
+            _log_listener = logging.handlers.QueueListener(records, file_handler)
+            _log_listener.start()
+            _log_handlers.append(logging.handlers.QueueHandler(records))
+    for handler in _log_handlers:
+        logger.addHandler(handler)
+    return ring
+
+
+@atexit.register
+def _stop_log_listener():
+    """退出前把文件日志队列中剩余的记录写完"""
+    if _log_listener is not None:
+        _log_listener.stop()
+
+
+class MatroskaReader:
+    """
+    纯 Python 的 Matroska(EBML) 读取器，基于 mmap 按需访问文件：
+    - 通过 SeekHead 直接定位 Info / Tracks / Cues / Tags 等顶级元素
+    - 读取文本字幕时，Cues 完整覆盖字幕轨道则直接跳到字幕块；
+      否则遍历 Cluster，依据 SimpleBlock / BlockGroup 的尺寸字段跳过音视频数据，不读取其负载
+    """
+
+    # EBML / Matroska 元素 ID
+    ID_EBML = 0x1A45DFA3
+    ID_DOCTYPE = 0x4282
+    ID_SEGMENT = 0x18538067
+    ID_SEEKHEAD = 0x114D9B74
+    ID_SEEK = 0x4DBB
+    ID_SEEKID = 0x53AB
+    ID_SEEKPOSITION = 0x53AC
+    ID_INFO = 0x1549A966
+    ID_TIMECODESCALE = 0x2AD7B1
+    ID_TRACKS = 0x1654AE6B
+    ID_TRACKENTRY = 0xAE
+    ID_TRACKNUMBER = 0xD7
+    ID_TRACKUID = 0x73C5
+    ID_TRACKTYPE = 0x83
+    ID_CODECID = 0x86
+    ID_CODECPRIVATE = 0x63A2
+    ID_LANGUAGE = 0x22B59C
+    ID_DEFAULTDURATION = 0x23E383
+    ID_CONTENTENCODINGS = 0x6D80
+    ID_CONTENTENCODING = 0x6240
+    ID_CONTENTENCODINGORDER = 0x5031
+    ID_CONTENTENCODINGSCOPE = 0x5032
+    ID_CONTENTENCODINGTYPE = 0x5033
+    ID_CONTENTCOMPRESSION = 0x5034
+    ID_CONTENTCOMPALGO = 0x4254
+    ID_CONTENTCOMPSETTINGS = 0x4255
+    ID_CLUSTER = 0x1F43B675
+    ID_TIMECODE = 0xE7
+    ID_SIMPLEBLOCK = 0xA3
+    ID_BLOCKGROUP = 0xA0
+    ID_BLOCK = 0xA1
+    ID_BLOCKDURATION = 0x9B
+    ID_CUES = 0x1C53BB6B
+    ID_CUEPOINT = 0xBB
+    ID_CUETRACKPOSITIONS = 0xB7
+    ID_CUETRACK = 0xF7
+    ID_CUECLUSTERPOSITION = 0xF1
+    ID_CUERELATIVEPOSITION = 0xF0
+    ID_TAGS = 0x1254C367
+    ID_TAG = 0x7373
+    ID_TARGETS = 0x63C0
+    ID_TAGTRACKUID = 0x63C5
+    ID_SIMPLETAG = 0x67C8
+    ID_TAGNAME = 0x45A3
+    ID_TAGSTRING = 0x4487
+    ID_ATTACHMENTS = 0x1941A469
+    ID_ATTACHEDFILE = 0x61A7
+    ID_FILENAME = 0x466E
+    ID_FILEMIMETYPE = 0x4660
+    ID_FILEDATA = 0x465C
+
+    # ffmpeg 只为这些类型的轨道创建流（用于把 ffprobe 的流序号对应到 TrackEntry）
+    FFMPEG_STREAM_TRACK_TYPES = (0x01, 0x02, 0x11, 0x21)
+    # TrackType -> ffprobe codec_type（其余类型不检查）
+    FFMPEG_CODEC_TYPES = {0x01: "video", 0x02: "audio", 0x11: "subtitle"}
+
+    # 文本字幕 CodecID -> ffprobe codec_name
+    TEXT_CODECS = {
+        "S_TEXT/ASS": "ass",
+        "S_ASS": "ass",
+        "S_TEXT/SSA": "ssa",
+        "S_SSA": "ssa",
+        "S_TEXT/UTF8": "subrip",
+        "S_TEXT/ASCII": "subrip",
+    }
+
+    # 与 ffmpeg 导出后的筛选规则一致，只保留这些扩展名的附件
+    FONT_EXTENSIONS = (".ttf", ".otf")
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        if hasattr(mmap, "MADV_RANDOM"):
+            # 只访问元素头和字幕块，关闭预读避免把跳过的音视频数据读进来
+            self._mm.madvise(mmap.MADV_RANDOM)
+
+        try:
+            self._parse_segment()
+        except Exception:
+            self.close()
+            raise
+
+    @staticmethod
+    def is_matroska(path):
+        """只检查 EBML 魔数，用于决定是否尝试原生读取"""
+        try:
+            with open(path, "rb") as f:
+                return f.read(4) == b"\x1a\x45\xdf\xa3"
+        except OSError:
+            return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    # ----------------- EBML 基础读取 -----------------
+    def _read_vint(self, pos, keep_marker=False):
+        """读取 EBML 变长整数，返回 (值, 字节数)；keep_marker=True 时用于读取元素 ID"""
+        first = self._mm[pos]
+        if first == 0:
+            raise RuntimeError(f"无效的 EBML 变长整数 @0x{pos:X}")
+        length = 9 - first.bit_length()
+        value = first if keep_marker else first & ((1 << (8 - length)) - 1)
+        for b in self._mm[pos + 1:pos + length]:
+            value = (value << 8) | b
+        return value, length
+
+    def _element_header(self, pos):
+        """返回 (元素ID, 数据起始位置, 数据长度)；未知长度返回 None"""
+        eid, id_len = self._read_vint(pos, keep_marker=True)
+        size, size_len = self._read_vint(pos + id_len)
+        if size == (1 << (7 * size_len)) - 1:
+            size = None
+        return eid, pos + id_len + size_len, size
+
+    def _children(self, start, end):
+        """遍历 [start, end) 内的子元素，只读取元素头，按尺寸字段跳过数据"""
+        end = min(end, len(self._mm))
+        pos = start
+        while pos < end:
+            eid, data, size = self._element_header(pos)
+            if size is None:
+                raise RuntimeError(f"不支持未知长度的元素 0x{eid:X}")
+            if data + size > end:
+                break  # 文件被截断
+            yield eid, data, size
+            pos = data + size
+
+    def _uint(self, data, size):
+        return int.from_bytes(self._mm[data:data + size], "big")
+
+    def _string(self, data, size):
+        return self._mm[data:data + size].rstrip(b"\x00").decode("utf-8", errors="ignore")
+
+    # ----------------- 头部解析 -----------------
+    def _parse_segment(self):
+        eid, data, size = self._element_header(0)
+        if eid != self.ID_EBML:
+            raise RuntimeError("不是 Matroska 文件")
+        doctype = ""
+        for cid, cdata, csize in self._children(data, data + size):
+            if cid == self.ID_DOCTYPE:
+                doctype = self._string(cdata, csize)
+        if doctype not in ("matroska", "webm"):
+            raise RuntimeError(f"不支持的 DocType: {doctype}")
+
+        eid, data, size = self._element_header(data + size)
+        if eid != self.ID_SEGMENT:
+            raise RuntimeError("缺少 Segment 元素")
+        self._segment_start = data
+        self._segment_end = len(self._mm) if size is None else min(data + size, len(self._mm))
+
+        # 顶级元素位置：先顺序读到第一个 Cluster（之前的元素都很小），再由 SeekHead 补全文件末尾的 Cues/Tags
+        self._positions = {}
+        self._seekheads = set()
+        pos = self._segment_start
+        while pos < self._segment_end:
+            eid, data, size = self._element_header(pos)
+            self._positions.setdefault(eid, pos)
+            if eid == self.ID_SEEKHEAD:
+                self._parse_seekhead(pos)
+            if eid == self.ID_CLUSTER or size is None:
+                break
+            pos = data + size
+
+        self.timecode_scale = 1000000
+        info = self._element_at(self.ID_INFO)
+        if info:
+            for cid, cdata, csize in self._children(*info):
+                if cid == self.ID_TIMECODESCALE:
+                    self.timecode_scale = self._uint(cdata, csize)
+
+        self.tracks = []
+        tracks = self._element_at(self.ID_TRACKS)
+        if tracks:
+            for cid, cdata, csize in self._children(*tracks):
+                if cid == self.ID_TRACKENTRY:
+                    self.tracks.append(self._parse_track_entry(cdata, csize))
+        self._tracks_by_number = {t["number"]: t for t in self.tracks}
+
+    def _parse_seekhead(self, pos):
+        if pos in self._seekheads:
+            return
+        self._seekheads.add(pos)
+        eid, data, size = self._element_header(pos)
+        for cid, cdata, csize in self._children(data, data + size):
+            if cid != self.ID_SEEK:
+                continue
+            seek_id = seek_pos = None
+            for sid, sdata, ssize in self._children(cdata, cdata + csize):
+                if sid == self.ID_SEEKID:
+                    seek_id = self._uint(sdata, ssize)
+                elif sid == self.ID_SEEKPOSITION:
+                    seek_pos = self._segment_start + self._uint(sdata, ssize)
+            if seek_id is None or seek_pos is None or seek_pos >= self._segment_end:
+                continue
+            self._positions.setdefault(seek_id, seek_pos)
+            if seek_id == self.ID_SEEKHEAD:
+                self._parse_seekhead(seek_pos)
+
+    def _element_at(self, eid):
+        """按 SeekHead/顺序扫描得到的位置定位顶级元素，返回 (数据起始, 数据结束)"""
+        pos = self._positions.get(eid)
+        if pos is None:
+            return None
+        found, data, size = self._element_header(pos)
+        if found != eid or size is None:
+            return None
+        return data, data + size
+
+    def _parse_track_entry(self, data, size):
+        track = {
+            "number": 0,
+            "uid": 0,
+            "type": 0,
+            "codec_id": "",
+            "codec_private": b"",
+            "language": "eng",
+            "default_duration": None,
+            "encodings": [],
+        }
+        for cid, cdata, csize in self._children(data, data + size):
+            if cid == self.ID_TRACKNUMBER:
+                track["number"] = self._uint(cdata, csize)
+            elif cid == self.ID_TRACKUID:
+                track["uid"] = self._uint(cdata, csize)
+            elif cid == self.ID_TRACKTYPE:
+                track["type"] = self._uint(cdata, csize)
+            elif cid == self.ID_CODECID:
+                track["codec_id"] = self._string(cdata, csize)
+            elif cid == self.ID_CODECPRIVATE:
+                track["codec_private"] = self._mm[cdata:cdata + csize]
+            elif cid == self.ID_LANGUAGE:
+                track["language"] = self._string(cdata, csize)
+            elif cid == self.ID_DEFAULTDURATION:
+                track["default_duration"] = self._uint(cdata, csize)
+            elif cid == self.ID_CONTENTENCODINGS:
+                track["encodings"] = self._parse_content_encodings(cdata, csize)
+        return track
+
+    def _parse_content_encodings(self, data, size):
+        encodings = []
+        for cid, cdata, csize in self._children(data, data + size):
+            if cid != self.ID_CONTENTENCODING:
+                continue
+            enc = {"order": 0, "scope": 1, "type": 0, "algo": 0, "settings": b""}
+            for eid, edata, esize in self._children(cdata, cdata + csize):
+                if eid == self.ID_CONTENTENCODINGORDER:
+                    enc["order"] = self._uint(edata, esize)
+                elif eid == self.ID_CONTENTENCODINGSCOPE:
+                    enc["scope"] = self._uint(edata, esize)
+                elif eid == self.ID_CONTENTENCODINGTYPE:
+                    enc["type"] = self._uint(edata, esize)
+                elif eid == self.ID_CONTENTCOMPRESSION:
+                    for zid, zdata, zsize in self._children(edata, edata + esize):
+                        if zid == self.ID_CONTENTCOMPALGO:
+                            enc["algo"] = self._uint(zdata, zsize)
+                        elif zid == self.ID_CONTENTCOMPSETTINGS:
+                            enc["settings"] = self._mm[zdata:zdata + zsize]
+            encodings.append(enc)
+        # 解码时从 ContentEncodingOrder 最大的开始
+        encodings.sort(key=lambda e: e["order"], reverse=True)
+        return encodings
+
+    def _decode(self, track, data, scope):
+        """还原 ContentEncoding（zlib / 头部剥离），scope: 1=帧数据 2=CodecPrivate"""
+        for enc in track["encodings"]:
+            if not enc["scope"] & scope:
+                continue
+            if enc["type"] != 0:
+                raise RuntimeError("不支持加密的轨道")
+            if enc["algo"] == 0:
+                data = zlib.decompress(data)
+            elif enc["algo"] == 3:
+                data = enc["settings"] + data
+            else:
+                raise RuntimeError(f"不支持的压缩算法: {enc['algo']}")
+        return data
+
+    # ----------------- 轨道与数据块 -----------------
+    def _stream_tracks(self):
+        return [t for t in self.tracks if t["type"] in self.FFMPEG_STREAM_TRACK_TYPES and t["codec_id"]]
+
+    def stream_track(self, stream_index):
+        """按 ffmpeg 的建流规则，把 ffprobe 的流序号对应到 TrackEntry"""
+        streams = self._stream_tracks()
+        if 0 <= stream_index < len(streams):
+            return streams[stream_index]
+        return None
+
+    def probe_tracks(self, streams):
+        """
+        按建流规则把 ffprobe 的流（不含附件）逐个对应到 TrackEntry，返回 { 流序号: TrackEntry }
+        流的数量、序号、类型或语言与轨道不一致（ffmpeg 跳过或增加了流）时返回 None，调用方应改用 ffmpeg
+        """
+        tracks = self._stream_tracks()
+        if len(tracks) != len(streams):
+            return None
+        mapping = {}
+        for position, (stream, track) in enumerate(zip(sorted(streams, key=lambda s: s.get("index", -1)), tracks)):
+            if stream.get("index") != position:
+                return None
+            codec_type = self.FFMPEG_CODEC_TYPES.get(track["type"])
+            if codec_type and stream.get("codec_type") != codec_type:
+                return None
+            # ffmpeg 不为 und 设置 language 标签
+            if stream.get("tags", {}).get("language") != (None if track["language"] == "und" else track["language"]):
+                return None
+            mapping[position] = track
+        return mapping
+
+    def _read_block(self, eid, data, size, wanted):
+        """解析 SimpleBlock/BlockGroup，非目标轨道只读取轨道号即跳过；返回 (轨道号, 相对时间, 时长, 数据)"""
+        duration = None
+        if eid == self.ID_BLOCKGROUP:
+            block = None
+            for cid, cdata, csize in self._children(data, data + size):
+                if cid == self.ID_BLOCK:
+                    track, _ = self._read_vint(cdata)
+                    if track not in wanted:
+                        return None
+                    block = (cdata, csize)
+                elif cid == self.ID_BLOCKDURATION:
+                    duration = self._uint(cdata, csize)
+            if block is None:
+                return None
+            data, size = block
+
+        track, n = self._read_vint(data)
+        if track not in wanted:
+            return None
+        rel_timecode = int.from_bytes(self._mm[data + n:data + n + 2], "big", signed=True)
+        flags = self._mm[data + n + 2]
+        if flags & 0x06:
+            raise RuntimeError("不支持 lacing 的字幕块")
+        return track, rel_timecode, duration, self._mm[data + n + 3:data + size]
+
+    def _cluster_timecode(self, cluster_pos, cache):
+        if cluster_pos not in cache:
+            eid, data, size = self._element_header(cluster_pos)
+            if eid != self.ID_CLUSTER or size is None:
+                raise RuntimeError(f"Cues 指向的位置不是 Cluster @0x{cluster_pos:X}")
+            timecode = 0
+            for cid, cdata, csize in self._children(data, data + size):
+                if cid == self.ID_TIMECODE:
+                    timecode = self._uint(cdata, csize)
+                    break
+            cache[cluster_pos] = (timecode, data)
+        return cache[cluster_pos]
+
+    def _frame_counts(self):
+        """读取 mkvmerge 写入的统计标签 {TrackUID: NUMBER_OF_FRAMES}"""
+        counts = {}
+        tags = self._element_at(self.ID_TAGS)
+        if not tags:
+            return counts
+        for cid, cdata, csize in self._children(*tags):
+            if cid != self.ID_TAG:
+                continue
+            uids = []
+            frames = None
+            for tid, tdata, tsize in self._children(cdata, cdata + csize):
+                if tid == self.ID_TARGETS:
+                    uids += [self._uint(d, s) for i, d, s in self._children(tdata, tdata + tsize)
+                             if i == self.ID_TAGTRACKUID]
+                elif tid == self.ID_SIMPLETAG:
+                    name = value = None
+                    for sid, sdata, ssize in self._children(tdata, tdata + tsize):
+                        if sid == self.ID_TAGNAME:
+                            name = self._string(sdata, ssize)
+                        elif sid == self.ID_TAGSTRING:
+                            value = self._string(sdata, ssize)
+                    if name == "NUMBER_OF_FRAMES" and value and value.isdigit():
+                        frames = int(value)
+            if frames is not None:
+                for uid in uids:
+                    counts[uid] = frames
+        return counts
+
+    def _cued_blocks(self, wanted):
+        """
+        返回 Cues 中各目标轨道的块位置 [(Cluster 位置, 相对位置)]；
+        只有当 Cues 条目数与统计标签的帧数一致（覆盖全部字幕块）时才返回，否则返回 None
+        """
+        cues = self._element_at(self.ID_CUES)
+        if not cues:
+            return None
+        found = {number: set() for number in wanted}
+        for cid, cdata, csize in self._children(*cues):
+            if cid != self.ID_CUEPOINT:
+                continue
+            for pid, pdata, psize in self._children(cdata, cdata + csize):
+                if pid != self.ID_CUETRACKPOSITIONS:
+                    continue
+                track = cluster = relative = None
+                for tid, tdata, tsize in self._children(pdata, pdata + psize):
+                    if tid == self.ID_CUETRACK:
+                        track = self._uint(tdata, tsize)
+                    elif tid == self.ID_CUECLUSTERPOSITION:
+                        cluster = self._segment_start + self._uint(tdata, tsize)
+                    elif tid == self.ID_CUERELATIVEPOSITION:
+                        relative = self._uint(tdata, tsize)
+                if track in found and cluster is not None and relative is not None:
+                    found[track].add((cluster, relative))
+
+        counts = self._frame_counts()
+        for number in wanted:
+            if counts.get(self._tracks_by_number[number]["uid"]) != len(found[number]):
+                return None
+        return found
+
+    def read_subtitle_packets(self, track_numbers):
+        """
+        读取指定轨道的全部数据块
+        :return: {轨道号: [(开始 ns, 时长 ns, 数据 bytes), ...]}，按开始时间排序
+        """
+        wanted = set(track_numbers)
+        raw = {number: [] for number in wanted}
+
+        cued = self._cued_blocks(wanted)
+        if cued is not None:
+            # Cues 完整：直接跳到每个字幕块，不碰 Cluster 内的其他数据
+            clusters = {}
+            for number, blocks in cued.items():
+                for cluster_pos, relative in sorted(blocks):
+                    timecode, cluster_data = self._cluster_timecode(cluster_pos, clusters)
+                    eid, data, size = self._element_header(cluster_data + relative)
+                    block = self._read_block(eid, data, size, wanted)
+                    if block is None:
+                        raise RuntimeError(f"Cues 指向的位置不是轨道 {number} 的数据块")
+                    raw[block[0]].append((timecode + block[1], block[2], block[3]))
+        else:
+            # 遍历 Cluster：只读取元素头，按尺寸字段跳过音视频块
+            pos = self._positions.get(self.ID_CLUSTER)
+            while pos is not None and pos < self._segment_end:
+                eid, data, size = self._element_header(pos)
+                if size is None:
+                    raise RuntimeError("不支持未知长度的 Cluster")
+                if eid == self.ID_CLUSTER:
+                    timecode = 0
+                    for cid, cdata, csize in self._children(data, data + size):
+                        if cid == self.ID_TIMECODE:
+                            timecode = self._uint(cdata, csize)
+                        elif cid in (self.ID_SIMPLEBLOCK, self.ID_BLOCKGROUP):
+                            block = self._read_block(cid, cdata, csize, wanted)
+                            if block:
+                                raw[block[0]].append((timecode + block[1], block[2], block[3]))
+                pos = data + size
+
+        packets = {}
+        for number, blocks in raw.items():
+            track = self._tracks_by_number[number]
+            items = []
+            for timecode, duration, data in blocks:
+                start = max(timecode, 0) * self.timecode_scale
+                if duration is not None:
+                    duration *= self.timecode_scale
+                else:
+                    duration = track["default_duration"] or 0
+                items.append((start, duration, self._decode(track, data, 1)))
+            items.sort(key=lambda p: p[0])
+            packets[number] = items
+        return packets
+
+    # ----------------- 附件 -----------------
+    def attachments(self):
+        """
+        列出 Attachments 中的 AttachedFile，不读取文件数据
+        :return: [{"name", "mime", "size", "offset"}]，offset 为 FileData 在文件中的绝对位置
+        """
+        entries = []
+        attachments = self._element_at(self.ID_ATTACHMENTS)
+        if not attachments:
+            return entries
+        for cid, cdata, csize in self._children(*attachments):
+            if cid != self.ID_ATTACHEDFILE:
+                continue
+            entry = {"name": "", "mime": "", "size": 0, "offset": None}
+            for fid, fdata, fsize in self._children(cdata, cdata + csize):
+                if fid == self.ID_FILENAME:
+                    entry["name"] = self._string(fdata, fsize)
+                elif fid == self.ID_FILEMIMETYPE:
+                    entry["mime"] = self._string(fdata, fsize)
+                elif fid == self.ID_FILEDATA:
+                    entry["offset"] = fdata
+                    entry["size"] = fsize
+            if entry["name"] and entry["offset"] is not None:
+                entries.append(entry)
+        return entries
+
+    def font_attachments(self):
+        return [e for e in self.attachments() if os.path.splitext(e["name"])[1].lower() in self.FONT_EXTENSIONS]
+
+    def attachment_data(self, entry):
+        """返回附件数据的 memoryview（直接引用 mmap，不复制），需在 close() 前用 with 释放"""
+        return memoryview(self._mm)[entry["offset"]:entry["offset"] + entry["size"]]
+
+    def write_attachment(self, entry, path):
+        """把附件数据直接从 mmap 切片写入文件"""
+        with self.attachment_data(entry) as data, open(path, "wb") as f:
+            f.write(data)
+
+    # ----------------- 字幕重建 -----------------
+    @staticmethod
+    def _ass_time(ns):
+        cs = (ns + 5000000) // 10000000
+        h, cs = divmod(cs, 360000)
+        m, cs = divmod(cs, 6000)
+        s, cs = divmod(cs, 100)
+        return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
+
+    @staticmethod
+    def _srt_time(ns):
+        ms = (ns + 500000) // 1000000
+        h, ms = divmod(ms, 3600000)
+        m, ms = divmod(ms, 60000)
+        s, ms = divmod(ms, 1000)
+        return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+    def _build_ass(self, track, packets):
+        """CodecPrivate 头部 + 按 ReadOrder 排序的 Dialogue 行"""
+        header = self._decode(track, track["codec_private"], 2).decode("utf-8-sig", errors="ignore")
+        newline = "\r\n" if "\r\n" in header else "\n"
+        header = header.rstrip("\r\n\x00 ")
+        if "[events]" not in header.lower():
+            header += (newline * 2 + "[Events]" + newline +
+                       "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text")
+
+        events = []
+        for start, duration, data in packets:
+            # 块数据：ReadOrder, Layer, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+            fields = data.decode("utf-8", errors="ignore").rstrip("\r\n\x00").split(",", 8)
+            if len(fields) < 9:
+                continue
+            try:
+                read_order = int(fields[0])
+            except ValueError:
+                read_order = len(events)
+            events.append((read_order, f"Dialogue: {fields[1]},{self._ass_time(start)},"
+                                       f"{self._ass_time(start + duration)},{','.join(fields[2:])}"))
+        events.sort(key=lambda e: e[0])
+        return header + newline + "".join(line + newline for _, line in events)
+
+    def _build_srt(self, packets):
+        entries = []
+        for i, (start, duration, data) in enumerate(packets, 1):
+            text = data.decode("utf-8", errors="ignore").rstrip("\r\n\x00")
+            entries.append(f"{i}\n{self._srt_time(start)} --> {self._srt_time(start + duration)}\n{text}\n\n")
+        return "".join(entries)
+
+    def export_text_tracks(self, outputs):
+        """
+        一次读取导出多个文本字幕轨道
+        :param outputs: {轨道号: 输出路径}
+        """
+        for number in outputs:
+            track = self._tracks_by_number.get(number)
+            if not track or track["codec_id"] not in self.TEXT_CODECS:
+                raise RuntimeError(f"轨道 {number} 不是文本字幕")
+
+        packets = self.read_subtitle_packets(outputs)
+        for number, outpath in outputs.items():
+            track = self._tracks_by_number[number]
+            if self.TEXT_CODECS[track["codec_id"]] == "subrip":
+                text = self._build_srt(packets[number])
+            else:
+                text = self._build_ass(track, packets[number])
+            with open(outpath, "w", encoding="utf-8", newline="") as f:
+                f.write(text)
+
+
+class AsyncProcessRunner:
+    """
+    基于 asyncio 的子进程层：所有 ffmpeg / ffprobe / FontForge / Spp2Pgs 子进程都在同一个后台事件循环中运行。
+    - 按工具限制并发数量，超出的进程在事件循环中排队，不占用线程
+    - 流式读取 stdout/stderr（可逐行回调），每个进程可单独设置超时
+    - cancel_all() 取消所有排队和运行中的进程（运行中的进程会被结束）
+    """
+
+    def __init__(self, limits=None, default_limit=4):
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._semaphores = {}
+        self._futures = set()
+        self._futures_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        """首次使用时才启动后台事件循环线程"""
+        with self._loop_lock:
+            if self._loop is None:
+                if os.name == "nt":
+                    loop = asyncio.ProactorEventLoop()  # Windows 下子进程需要 Proactor
+                else:
+                    loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="process-runner", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _semaphore(self, tool):
+        # 只在事件循环线程中创建，兼容旧版 asyncio 的事件循环绑定
+        if tool not in self._semaphores:
+            self._semaphores[tool] = asyncio.Semaphore(self.limits.get(tool, self.default_limit))
+        return self._semaphores[tool]
+
+    @staticmethod
+    async def _pump(stream, chunks, callback):
+        """分块读取输出；有回调时按行（\\n 或 \\r）回调，避免超长进度行触发 StreamReader 的行长度限制"""
+        pending = b""
+        while True:
+            data = await stream.read(65536)
+            if not data:
+                break
+            if chunks is not None:
+                chunks.append(data)
+            if callback:
+                pending += data
+                *lines, pending = re.split(rb"\r\n|\r|\n", pending)
+                for line in lines:
+                    callback(line.decode("utf-8", errors="ignore"))
+        if callback and pending:
+            callback(pending.decode("utf-8", errors="ignore"))
+
+    async def run(self, tool, cmd, timeout=None, cwd=None, merge_stderr=False, capture=True,
+                  on_stdout=None, on_stderr=None):
+        """
+        在事件循环中运行子进程
+        :param tool: 工具名（ffmpeg / ffprobe / fontforge / spp2pgs），用于并发限制
+        :param timeout: 超时秒数，超时后结束进程并抛出 subprocess.TimeoutExpired
+        :param merge_stderr: 把 stderr 合并到 stdout
+        :param capture: 是否在内存中保留输出；只需逐行回调时可关闭
+        :return: subprocess.CompletedProcess（stdout/stderr 为 bytes）
+        """
+        kwargs = {}
+        if os.name == "nt":
+            kwargs["creationflags"] = subprocess.CREATE_NO_WINDOW
+
+        async with self._semaphore(tool):
+            proc = await asyncio.create_subprocess_exec(
+                *[str(c) for c in cmd],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT if merge_stderr else subprocess.PIPE,
+                cwd=cwd,
+                **kwargs
+            )
+            out_chunks = [] if capture else None
+            err_chunks = [] if capture and not merge_stderr else None
+            tasks = [self._pump(proc.stdout, out_chunks, on_stdout)]
+            if not merge_stderr:
+                tasks.append(self._pump(proc.stderr, err_chunks, on_stderr))
+            try:
+                await asyncio.wait_for(asyncio.gather(*tasks, proc.wait()), timeout)
+            except asyncio.TimeoutError:
+                self._kill(proc)
+                await proc.wait()
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            except asyncio.CancelledError:
+                self._kill(proc)
+                await proc.wait()
+                raise
+
+        return subprocess.CompletedProcess(
+            cmd, proc.returncode,
+            b"".join(out_chunks) if out_chunks is not None else b"",
+            b"".join(err_chunks) if err_chunks is not None else b""
+        )
+
+    @staticmethod
+    def _kill(proc):
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+
+    def submit(self, tool, cmd, cancel_event=None, **kwargs):
+        """
+        从任意线程提交子进程，立即返回 concurrent.futures.Future
+        :param cancel_event: threading.Event，已设置时不再启动进程；先设置事件再调用 cancel_all，
+                             可保证取消期间刚提交的进程也会被取消
+        """
+        if cancel_event is not None and cancel_event.is_set():
+            raise CancelledError()
+        future = asyncio.run_coroutine_threadsafe(self.run(tool, cmd, **kwargs), self._ensure_loop())
+        with self._futures_lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+        if cancel_event is not None and cancel_event.is_set():
+            future.cancel()
+        return future
+
+    def _forget(self, future):
+        with self._futures_lock:
+            self._futures.discard(future)
+
+    def run_sync(self, tool, cmd, **kwargs):
+        """阻塞等待子进程结束，供线程池中的同步代码使用"""
+        return self.submit(tool, cmd, **kwargs).result()
+
+    def cancel_all(self):
+        """取消所有排队和运行中的子进程"""
+        with self._futures_lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+
+
+def _cache_dir(base_dir):
+    """探测缓存、导出清单、批处理日志与日志文件的目录：优先放在用户缓存目录，取不到时放在程序目录"""
+    if os.name == "nt":
+        root = os.environ.get("LOCALAPPDATA")
+    else:
+        root = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(root, "SubtitleExporter") if root else os.path.join(str(base_dir), "cache")
+
+
+class SqliteStore:
+    """
+    单表 SQLite 存储的公共部分（ProbeCache / OutputManifest）
+    - 一个连接（WAL）由锁串行化，各线程共用
+    - 子类给出 TABLE、COLUMNS（建表的列定义）、SCHEMA_VERSION 与默认文件名 FILENAME；
+      表结构版本变化时旧表直接丢弃重建
+    """
+
+    TABLE = ""
+    COLUMNS = ""
+    SCHEMA_VERSION = 1  # 表结构变化时递增
+    FILENAME = ""
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            self._conn.execute(f"DROP TABLE IF EXISTS {self.TABLE}")
+            self._conn.execute(f"PRAGMA user_version={self.SCHEMA_VERSION}")
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE} ({self.COLUMNS})")
+
+    @classmethod
+    def default_path(cls, base_dir):
+        return os.path.join(_cache_dir(base_dir), cls.FILENAME)
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.TABLE}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ProbeCache(SqliteStore):
+    """
+    持久化的 ffprobe 结果缓存
+    - 键为 绝对路径 + 文件大小 + mtime_ns（及探测范围），文件被修改后自动失效
+    - probe JSON 用 zlib 压缩存储，总大小超过 max_bytes 时按最近使用时间淘汰
+    """
+
+    TABLE = "probe"
+    COLUMNS = ("path TEXT, scope TEXT, size INTEGER, mtime_ns INTEGER, "
+               "data BLOB, nbytes INTEGER, last_used REAL, PRIMARY KEY (path, scope)")
+    SCHEMA_VERSION = 2
+    FILENAME = "probe_cache.sqlite3"
+
+    def __init__(self, db_path, max_bytes=64 * 1024 * 1024):
+        super().__init__(db_path)
+        self.max_bytes = max_bytes
+
+    def get(self, path, st, scope="full"):
+        """
+        :param st: 调用方已取得的 os.stat 结果
+        :param scope: 探测范围（full / lean），不同范围的结果分开缓存
+        :return: 缓存的 probe 字典，未命中或已过期时返回 None
+        """
+        key = self._key(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM probe WHERE path=? AND scope=? AND size=? AND mtime_ns=?",
+                (key, scope, st.st_size, st.st_mtime_ns)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE probe SET last_used=? WHERE path=? AND scope=?", (time.time(), key, scope))
+        try:
+            return json.loads(zlib.decompress(row[0]))
+        except (zlib.error, ValueError):
+            return None
+
+    def put(self, path, st, info, scope="full"):
+        """保存 probe 结果（st 必须是探测前取得的 stat，保证探测期间文件被修改时不会写入错误的键）"""
+        data = zlib.compress(json.dumps(info, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO probe (path, scope, size, mtime_ns, data, nbytes, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self._key(path), scope, st.st_size, st.st_mtime_ns, data, len(data), time.time())
+            )
+            self._evict()
+
+    def _evict(self):
+        """总大小超过上限时，按最近使用时间从旧到新删除，直到降到上限的 90%"""
+        total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM probe").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        victims = []
+        for key, scope, nbytes in self._conn.execute("SELECT path, scope, nbytes FROM probe ORDER BY last_used"):
+            if total <= target:
+                break
+            victims.append((key, scope))
+            total -= nbytes
+        self._conn.executemany("DELETE FROM probe WHERE path=? AND scope=?", victims)
+
+
+class OutputManifest(SqliteStore):
+    """
+    已导出字幕的清单，用于重复运行时跳过仍然有效的轨道
+    - 键为 源文件 + 轨道序号 + 目标（格式与输出目录）
+    - 记录源文件大小/mtime_ns、影响输出内容的选项（字体处理方式、头部修正等）以及输出文件的大小/mtime_ns
+    - 源文件被修改、选项不同、输出文件被删除或改动时视为过期
+    """
+
+    TABLE = "outputs"
+    COLUMNS = ("source TEXT, stream INTEGER, target TEXT, options TEXT, src_size INTEGER, src_mtime_ns INTEGER, "
+               "outpath TEXT, out_size INTEGER, out_mtime_ns INTEGER, fonts_dir TEXT, "
+               "PRIMARY KEY (source, stream, target)")
+    SCHEMA_VERSION = 1
+    FILENAME = "outputs.sqlite3"
+
+    @staticmethod
+    def target(subfmt, outdir):
+        return f"{subfmt}|{os.path.normcase(os.path.abspath(outdir)) if outdir else ''}"
+
+    def lookup(self, source, st, stream, target, options):
+        """
+        :param st: 源文件的 os.stat 结果
+        :return: 仍然有效的输出文件路径，没有记录或已过期时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT outpath, out_size, out_mtime_ns, fonts_dir FROM outputs "
+                "WHERE source=? AND stream=? AND target=? AND options=? AND src_size=? AND src_mtime_ns=?",
+                (self._key(source), stream, target, options, st.st_size, st.st_mtime_ns)
+            ).fetchone()
+        if row is None:
+            return None
+        outpath, out_size, out_mtime_ns, fonts_dir = row
+        try:
+            out_st = os.stat(outpath)
+        except OSError:
+            return None
+        if (out_st.st_size, out_st.st_mtime_ns) != (out_size, out_mtime_ns):
+            return None
+        if fonts_dir and not os.path.isdir(fonts_dir):
+            return None
+        return outpath
+
+    def put(self, source, st, entries, fonts_dir=None):
+        """
+        记录一个视频的输出（在字体封装等后处理完成后调用）
+        :param st: 处理开始前取得的源文件 stat，处理期间源文件被修改时记录自然失效
+        :param entries: [(轨道序号, 目标, 选项, 输出路径), ...]
+        """
+        rows = []
+        for stream, target, options, outpath in entries:
+            try:
+                out_st = os.stat(outpath)
+            except OSError:
+                continue
+            rows.append((self._key(source), stream, target, options, st.st_size, st.st_mtime_ns,
+                         outpath, out_st.st_size, out_st.st_mtime_ns, fonts_dir))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO outputs (source, stream, target, options, src_size, src_mtime_ns, "
+                "outpath, out_size, out_mtime_ns, fonts_dir) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+class ProbeSummary:
+    """
+    常驻内存的精简探测结果：各轨道的 index/codec_type/codec_name/语言、附件 (文件名, MIME) 与视频尺寸帧率
+    完整 ffprobe JSON 只保存在探测缓存中，需要时用 SubtitleExtractorApp.load_full_probe 读取
+    """
+    __slots__ = ("streams", "attachments", "width", "height", "fps")
+
+    STREAM_FIELDS = ("index", "codec_type", "codec_name")
+
+    def __init__(self, streams=(), attachments=(), width="", height="", fps=""):
+        self.streams = list(streams)  # [{index, codec_type, codec_name, tags: {language}}]，与 ffprobe 流结构一致
+        self.attachments = list(attachments)
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+    @classmethod
+    def from_probe(cls, info):
+        summary = cls()
+        for stream in info.get("streams", []):
+            tags = stream.get("tags", {})
+            codec_type = stream.get("codec_type")
+            if codec_type == "attachment":
+                summary.attachments.append((tags.get("filename", ""), tags.get("mimetype", "")))
+                continue
+            compact = {field: stream[field] for field in cls.STREAM_FIELDS if field in stream}
+            if "language" in tags:
+                compact["tags"] = {"language": tags["language"]}
+            summary.streams.append(compact)
+
+            if codec_type == "video" and summary.width == "":
+                summary.width = stream.get("width", "")
+                summary.height = stream.get("height", "")
+                r_frame_rate = stream.get("r_frame_rate", "")
+                if r_frame_rate and r_frame_rate != "0/0":
+                    num, den = map(int, r_frame_rate.split("/"))
+                    if den != 0:
+                        summary.fps = round(num / den, 3)
+        return summary
+
+    def subtitle_streams(self):
+        return [stream for stream in self.streams if stream.get("codec_type") == "subtitle"]
+
+    def __repr__(self):
+        return (f"ProbeSummary({len(self.streams)} streams, {len(self.attachments)} attachments, "
+                f"{self.width}x{self.height}@{self.fps})")
+
+
+class FileRecord:
+    """文件列表中的一行：路径、文件名、勾选状态、显示用宽高帧率（可编辑）与精简探测结果"""
+    __slots__ = ("fullpath", "filename", "checked", "width", "height", "fps", "probe")
+
+    def __init__(self, fullpath, filename=None, checked=True, width="", height="", fps="", probe=None):
+        self.fullpath = fullpath
+        self.filename = filename if filename is not None else os.path.basename(fullpath)
+        self.checked = checked
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.probe = probe  # ProbeSummary
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self):
+        return f"FileRecord({self.fullpath!r}, checked={self.checked}, {self.width}x{self.height}@{self.fps})"
+
+
+class FileRegistry:
+    """
+    按路径索引的文件列表（保持导入顺序），Treeview 与批处理都从这里读取
+    - 按路径查找、勾选切换、字段更新均为 O(1)，同时维护已勾选数量
+    - 导入线程与主线程可同时访问，遍历时返回快照
+    - 每次变更通知订阅者：("add", [记录]) / ("update", [记录]) / ("remove", [路径]) / ("clear", None)，
+      批量勾选通知 ("refresh", None) 而不逐条列出记录；回调在发生变更的线程中调用（锁外）
+    """
+
+    def __init__(self):
+        self._records = {}  # { fullpath: FileRecord }，dict 保持插入顺序
+        self._ordered = None  # 按序号访问时使用的记录列表，增删后重新生成
+        self._checked_count = 0
+        self._lock = threading.RLock()
+        self._listeners = []
+
+    def subscribe(self, callback):
+        """callback(kind, payload)"""
+        self._listeners.append(callback)
+
+    def _emit(self, kind, payload):
+        for callback in self._listeners:
+            callback(kind, payload)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __bool__(self):
+        return bool(self._records)
+
+    def __contains__(self, path):
+        return path in self._records
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._records.values()))
+
+    def __repr__(self):
+        return f"FileRegistry({list(self)!r})"
+
+    def get(self, path):
+        return self._records.get(path)
+
+    def slice(self, start, stop):
+        """按导入顺序取第 start~stop 条记录（虚拟列表只取可见部分）"""
+        with self._lock:
+            if self._ordered is None:
+                self._ordered = list(self._records.values())
+            return self._ordered[start:stop]
+
+    def add(self, record):
+        """添加记录，路径已存在时返回 False"""
+        return bool(self.add_many([record]))
+
+    def add_many(self, records):
+        """批量添加记录（只通知一次），返回实际添加的记录，已存在的路径被跳过"""
+        added = []
+        with self._lock:
+            for record in records:
+                if record.fullpath in self._records:
+                    continue
+                self._records[record.fullpath] = record
+                self._checked_count += bool(record.checked)
+                added.append(record)
+            if added:
+                self._ordered = None
+        if added:
+            self._emit("add", added)
+        return added
+
+    def remove(self, paths):
+        """删除多个路径，返回实际删除的记录"""
+        removed = []
+        with self._lock:
+            for path in paths:
+                record = self._records.pop(path, None)
+                if record is not None:
+                    self._checked_count -= bool(record.checked)
+                    removed.append(record)
+            if removed:
+                self._ordered = None
+        if removed:
+            self._emit("remove", [record.fullpath for record in removed])
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._ordered = None
+            self._checked_count = 0
+        self._emit("clear", None)
+
+    def update(self, path, **fields):
+        """更新指定路径的字段，路径不存在时返回 None"""
+        with self._lock:
+            record = self._records.get(path)
+            if record is None:
+                return None
+            if "checked" in fields:
+                self._set_checked(record, fields.pop("checked"))
+            for field, value in fields.items():
+                setattr(record, field, value)
+        self._emit("update", [record])
+        return record
+
+    def _set_checked(self, record, checked):
+        checked = bool(checked)
+        if record.checked != checked:
+            self._checked_count += 1 if checked else -1
+            record.checked = checked
+
+    def toggle(self, path):
+        """切换勾选状态，返回记录（路径不存在时返回 None）"""
+        with self._lock:
+            record = self._records.get(path)
+            if record is None:
+                return None
+            self._set_checked(record, not record.checked)
+        self._emit("update", [record])
+        return record
+
+    def set_all_checked(self, checked):
+        """全选/全不选：只修改模型并发出一次 refresh 通知"""
+        with self._lock:
+            for record in self._records.values():
+                record.checked = bool(checked)
+            self._checked_count = len(self._records) if checked else 0
+        self._emit("refresh", None)
+
+    def all_checked(self):
+        return bool(self._records) and self._checked_count == len(self._records)
+
+    def checked(self):
+        """按导入顺序返回已勾选的记录"""
+        with self._lock:
+            return [record for record in self._records.values() if record.checked]
+
+
+VIDEO_EXTENSIONS = (".mkv", ".mka", ".mk3d", ".mp4", ".m4v", ".mov", ".m2ts", ".ts", ".avi", ".webm")
+
+
+class FolderWatcher:
+    """
+    监视目录中新出现或被改写的视频文件（含子目录）
+    - Linux 使用 inotify，其它系统或 inotify 不可用时定时扫描目录
+    - 文件大小与修改时间连续 settle 秒没有变化（下载/复制已完成）才由 poll() 返回
+    - 只在调用 poll() 的线程中使用
+    """
+
+    # inotify 事件掩码
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, dirs, extensions=VIDEO_EXTENSIONS, settle=5.0, poll_interval=2.0, include_existing=False,
+                 use_inotify=True):
+        self.dirs = [os.path.abspath(d) for d in dirs]
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self._pending = {}  # { 路径: (大小, mtime_ns, 最后一次变化的时间) }
+        self._snapshot = {}  # 轮询模式：上一次扫描的 { 路径: (大小, mtime_ns) }
+        self._next_scan = 0.0
+        self._fd = None
+        self._libc = None
+        self._watches = {}  # inotify：{ wd: 目录 }
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self._init_inotify()
+            except OSError as e:
+                logger.warning(f"⚠️ inotify 不可用，改为定时扫描: {e}")
+                self._fd = None
+
+        existing = self._scan()
+        if include_existing:
+            for path, sig in existing.items():
+                self._touch(path, sig)
+        if self._fd is None:
+            self._snapshot = existing
+            self._next_scan = time.monotonic() + self.poll_interval
+
+    @property
+    def mode(self):
+        return "inotify" if self._fd is not None else "polling"
+
+    def _init_inotify(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self._fd = fd
+        for root in self.dirs:
+            self._add_watch_tree(root)
+
+    def _add_watch_tree(self, root):
+        for dirpath, _, _ in os.walk(root):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), self.WATCH_MASK)
+            if wd < 0:
+                logger.warning(f"⚠️ 无法监视目录 {dirpath}: {os.strerror(ctypes.get_errno())}")
+                continue
+            self._watches[wd] = dirpath
+
+    def _wanted(self, path):
+        return os.path.splitext(path)[1].lower() in self.extensions
+
+    def _scan(self):
+        files = {}
+        for root in self.dirs:
+            for dirpath, _, filenames in os.walk(root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    if not self._wanted(path):
+                        continue
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    files[path] = (st.st_size, st.st_mtime_ns)
+        return files
+
+    def _touch(self, path, sig=None):
+        """文件有变化：重新开始稳定计时"""
+        if sig is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._pending.pop(path, None)
+                return
+            sig = (st.st_size, st.st_mtime_ns)
+        self._pending[path] = (sig[0], sig[1], time.monotonic())
+
+    def _read_events(self, timeout):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, _, length = struct.unpack_from("iIII", data, offset)
+            name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b"\0"))
+            offset += 16 + length
+            if mask & self.IN_Q_OVERFLOW:
+                # 事件队列溢出：重新扫描全部目录，按有变化处理
+                for path, sig in self._scan().items():
+                    self._touch(path, sig)
+                continue
+            if mask & self.IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    # 新建或移入的子目录：加入监视，并把其中已有的文件当作新文件
+                    self._add_watch_tree(path)
+                    for dirpath, _, filenames in os.walk(path):
+                        for fname in filenames:
+                            if self._wanted(fname):
+                                self._touch(os.path.join(dirpath, fname))
+            elif self._wanted(path):
+                self._touch(path)
+
+    def poll(self, timeout=1.0):
+        """等待最多 timeout 秒，返回已经稳定、可以处理的文件路径列表"""
+        if self._fd is not None:
+            self._read_events(timeout)
+        else:
+            now = time.monotonic()
+            if now < self._next_scan:
+                time.sleep(min(timeout, self._next_scan - now))
+            if time.monotonic() >= self._next_scan:
+                current = self._scan()
+                for path, sig in current.items():
+                    if self._snapshot.get(path) != sig:
+                        self._touch(path, sig)
+                self._snapshot = current
+                self._next_scan = time.monotonic() + self.poll_interval
+
+        ready = []
+        now = time.monotonic()
+        for path, (size, mtime_ns, changed_at) in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._pending[path]  # 已被删除或移走
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self._pending[path] = (st.st_size, st.st_mtime_ns, now)
+            elif st.st_size > 0 and now - changed_at >= self.settle:
+                del self._pending[path]
+                ready.append(path)
+        return sorted(ready)
+
+    def pending(self):
+        """尚未稳定、还没有返回过的文件"""
+        return sorted(self._pending)
+
+    def requeue(self, paths):
+        """把上次退出时未处理完的文件重新加入等待列表（重新开始稳定计时）"""
+        for path in paths:
+            if self._wanted(path):
+                self._touch(path)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class BatchJournal:
+    """
+    批处理日志（追加写入的 JSON Lines，每条记录写入后立即 fsync），程序崩溃或断电后用于恢复
+    - start / video_start / stream / video_done / temp / keep / end 记录批次进度与创建的临时资源
+    - recover() 读取上一批次：没有 end 记录说明批次中途退出
+    - 崩溃或超时的视频记入失败次数（quarantine.json），达到 quarantine_after 次后隔离，源文件被修改后自动解除
+    - 各视频线程并行写入记录，写入与 quarantine.json 的读改写由同一把锁串行化
+    """
+
+    def __init__(self, directory, name="batch", quarantine_after=2):
+        self.directory = str(directory)
+        self.path = os.path.join(self.directory, f"{name}.jsonl")
+        self.quarantine_path = os.path.join(self.directory, "quarantine.json")
+        self.quarantine_after = quarantine_after
+        self._lock = threading.Lock()
+        self._file = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def fingerprint(path):
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def recover(self):
+        """
+        读取上一批次的记录；上一批次已正常结束或没有记录时返回 None，否则返回
+        {"params": 批次参数, "done": {路径: video_done 记录}, "unfinished": [已开始未完成的路径],
+         "temps": [未保留的临时路径]}
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return None
+        params, done, started, temps, keep = None, {}, set(), [], set()
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break  # 最后一行可能只写了一半
+            ev = entry.get("ev")
+            if ev == "start":
+                params = entry.get("params")
+            elif ev == "video_start":
+                started.add(entry["path"])
+            elif ev == "video_done":
+                done[entry["path"]] = entry
+            elif ev == "temp":
+                temps.append(entry["path"])
+            elif ev == "keep":
+                keep.add(entry["path"])
+            elif ev == "end":
+                return None
+        if params is None:
+            return None
+        return {"params": params, "done": done, "unfinished": sorted(started - set(done)),
+                "temps": [p for p in temps if p not in keep]}
+
+    def begin(self, params):
+        """开始新批次：覆盖上一批次的记录"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.path, "w", encoding="utf-8")
+        self.record("start", params=params)
+
+    def record(self, ev, **fields):
+        with self._lock:
+            if self._file is None:
+                return
+            fields["ev"] = ev
+            self._file.write(json.dumps(fields, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def end(self, cancelled=False):
+        self.record("end", cancelled=cancelled)
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _load_failures(self):
+        try:
+            with open(self.quarantine_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_failures(self, failures):
+        tmp = self.quarantine_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(failures, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.quarantine_path)
+
+    def add_failure(self, path, reason):
+        """记录一次崩溃/超时，返回该文件（当前版本）的累计失败次数"""
+        try:
+            fp = self.fingerprint(path)
+        except OSError:
+            return 0
+        with self._lock:
+            failures = self._load_failures()
+            entry = failures.get(path)
+            if not entry or entry.get("fingerprint") != fp:
+                entry = {"fingerprint": fp, "count": 0}
+            entry["count"] += 1
+            entry["reason"] = reason
+            failures[path] = entry
+            self._save_failures(failures)
+            return entry["count"]
+
+    def clear_failures(self, paths=None):
+        """成功处理后清除失败记录；paths 为 None 时解除全部隔离"""
+        with self._lock:
+            failures = self._load_failures()
+            if paths is None:
+                changed = bool(failures)
+                failures = {}
+            else:
+                changed = any(failures.pop(p, None) for p in paths)
+            if changed:
+                self._save_failures(failures)
+
+    def quarantined(self, path):
+        """已隔离时返回最后一次失败的原因，否则返回 None（源文件被修改后不再隔离）"""
+        with self._lock:
+            entry = self._load_failures().get(path)
+        if not entry or entry["count"] < self.quarantine_after:
+            return None
+        try:
+            if self.fingerprint(path) != entry["fingerprint"]:
+                return None
+        except OSError:
+            return None
+        return entry.get("reason") or "多次失败"
+
+
+class Tracer:
+    """
+    阶段计时（span）：记录每个阶段与子进程的起止时间，可导出为 Chrome trace_event JSON
+    （chrome://tracing 或 Perfetto 打开）并汇总为表格
+    - 关闭时 span() 直接返回共享的空上下文，几乎没有开销
+    - span 记录在结束时加锁追加，线程池中的各线程可以同时计时
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._events = []  # [(名称, 标签, 线程 id, 线程名, 开始 ns, 结束 ns)]
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+
+    def span(self, name, **tags):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, tags)
+
+    def _add(self, name, tags, start, end):
+        thread = threading.current_thread()
+        with self._lock:
+            self._events.append((name, tags, thread.ident, thread.name, start, end))
+
+    def reset(self):
+        with self._lock:
+            self._events = []
+            self._origin = time.perf_counter_ns()
+
+    def aggregate(self):
+        """{ 名称: [次数, 累计秒数, 最长秒数] }"""
+        with self._lock:
+            events = list(self._events)
+        stats = {}
+        for name, _, _, _, start, end in events:
+            st = stats.setdefault(name, [0, 0.0, 0.0])
+            dur = (end - start) / 1e9
+            st[0] += 1
+            st[1] += dur
+            st[2] = max(st[2], dur)
+        return stats
+
+    def summary(self):
+        """按累计耗时排序的汇总表（并行时累计耗时是各线程之和，可能超过总耗时）"""
+        stats = self.aggregate()
+        lines = [f"{'阶段':<36}{'次数':>6}{'累计(s)':>10}{'平均(ms)':>10}{'最长(ms)':>10}"]
+        for name, (count, total, longest) in sorted(stats.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<36}{count:>6}{total:>10.2f}{total / count * 1000:>10.1f}{longest * 1000:>10.1f}")
+        return "\n".join(lines)
+
+    def export_chrome(self, path):
+        """导出为 Chrome trace_event 格式（完整事件 ph=X，时间单位微秒）"""
+        with self._lock:
+            events, origin = list(self._events), self._origin
+        pid = os.getpid()
+        trace, threads = [], {}
+        for name, tags, tid, thread_name, start, end in events:
+            threads[tid] = thread_name
+            trace.append({"name": name, "cat": "process" if name.startswith("proc:") else "stage", "ph": "X",
+                          "ts": (start - origin) / 1000, "dur": (end - start) / 1000, "pid": pid, "tid": tid,
+                          "args": tags})
+        trace += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}}
+                  for tid, thread_name in threads.items()]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "tags", "start")
+
+    def __init__(self, tracer, name, tags):
+        self.tracer = tracer
+        self.name = name
+        self.tags = tags
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.tags["error"] = exc_type.__name__
+        self.tracer._add(self.name, self.tags, self.start, time.perf_counter_ns())
+        return False
+
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def traced(name, video_arg=None):
+    """
+    引擎方法装饰器：启用跟踪时把整个调用记为一个 span，标签取自当前批处理线程的视频与轨道
+    :param video_arg: 视频路径所在的位置参数序号，给出时用它作为 video 标签（调用时线程上还没有视频信息）
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            if not self.tracer.enabled:
+                return fn(self, *args, **kwargs)
+            tags = self._trace_tags()
+            if video_arg is not None and len(args) > video_arg:
+                tags["video"] = os.path.basename(args[video_arg])
+            with self.tracer.span(name, **tags):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class BatchCancelled(BaseException):
+    """
+    批处理被用户取消
+    继承 BaseException，轨道级的 except Exception 不会把取消当作普通失败吞掉，finally 中的清理照常执行
+    """
+
+
+class SubtitleEngine:
+    """
+    字幕提取引擎：探测、字幕轨道导出、字体还原/封装/合并与 SUP 生成，不依赖 Tk
+    图形界面（SubtitleExtractorApp）与命令行模式（cli_main）共用同一套逻辑
+    """
+
+    def __init__(self, journal_name="batch", trace_path=None):
+        # 初始化总表格
+        self.font_name_registry = {}  # { "字体文件名": {nameID: {platformID: string, ...}, ... } }
+        self.files = FileRegistry()  # 文件列表：{ 全路径: FileRecord }
 
         # 定义源 codec 与目标字幕文件格式对应关系
         self.codec_to_subfmt = {
@@ -77,6 +1743,71 @@ class SubtitleExtractorApp:
             'mov_text': 'srt'  # MP4 内嵌字幕，导出为 SRT
         }
 
+        # 位图字幕无法直接编码为文本字幕，单次解复用时交给逐轨道回退逻辑
+        self.bitmap_sub_codecs = {'hdmv_pgs_subtitle', 'dvd_subtitle', 'dvb_subtitle', 'xsub'}
+
+        # 单次解复用：每个视频只运行一次 ffmpeg，一次读取输出所有字幕轨道
+        self.single_pass_demux = True
+
+        # 并行处理的视频数量（大部分时间在等待 ffmpeg/FontForge 子进程，按 CPU 数量设置上限）
+        self.max_workers = max(1, min(8, os.cpu_count() or 1))
+        # 所有视频共享的轨道级线程池大小（格式转换、头部修正、字体还原/封装、SUP 生成）
+        self.max_stream_workers = max(1, os.cpu_count() or 1)
+
+        # 导入时并行探测的文件数量
+        self.probe_workers = 8
+
+        # 批处理行状态：{ 全路径: 状态标签 }，Treeview 的 iid 就是全路径，只推送有变化的行
+        self._row_status = {}
+        self._row_status_lock = threading.Lock()
+        self._dirty_rows = set()  # 状态有变化、等待界面刷新的行，同一行多次变化只刷新最后一次
+        self._batch_outputs = {}  # { 全路径: [生成的字幕文件] }，命令行模式输出结果时使用
+        self._batch_errors = []  # 本批次的错误，批次结束后汇总显示，不在处理中途弹窗
+        self._state_lock = threading.Lock()  # 保护错误列表与临时目录登记
+
+        # 批处理暂停/取消：暂停时不再开始新的视频和轨道（正在运行的不受影响），取消时结束正在运行的子进程
+        self._batch_cancel = threading.Event()
+        self._batch_resume = threading.Event()
+        self._batch_resume.set()
+        self._batch_thread = threading.local()  # 标记批处理线程，只有这些线程的子进程受取消控制
+        self._batch_temp_dirs = set()  # 本批次创建的临时目录，取消时统一删除
+        self._batch_timeouts = set()  # 本批次有子进程超时的视频
+        self._batch_uptodate = set()  # 本批次中所有轨道都已是最新、整体跳过的视频
+
+        # 阶段计时：trace_path（或环境变量 SUBEXP_TRACE）给出时启用，每批结束后导出 Chrome trace 并输出汇总表
+        self.trace_path = trace_path or os.environ.get("SUBEXP_TRACE")
+        self.tracer = Tracer(enabled=bool(self.trace_path))
+        self.last_trace_stats = {}  # 上一批次的 { 阶段: [次数, 累计秒数, 最长秒数] }
+
+        # 子进程超时（秒）：卡死的进程被结束，对应视频记一次失败
+        self.process_timeouts = {"ffmpeg": 3600, "ffprobe": 120, "fontforge": 600, "spp2pgs": 3600}
+
+        # 子进程层：按工具限制同时运行的子进程数量，其余在事件循环中排队
+        self.process_runner = AsyncProcessRunner(limits={
+            "ffmpeg": self.max_stream_workers,
+            "ffprobe": self.probe_workers,
+            "fontforge": 2,
+            "spp2pgs": 2,
+        })
+
+        # Spp2Pgs 临时注册字体的引用计数，并行生成 SUP 时避免一个任务卸载另一个任务仍在使用的字体
+        self._font_env_lock = threading.Lock()
+        self._font_env_refs = {}  # { 注册名: [字体路径, 引用数] }
+
+        # 字幕提取引擎："native" 优先用内置 Matroska 读取器导出文本字幕，无法处理时回退 ffmpeg；"ffmpeg" 始终调用 ffmpeg
+        self.subtitle_engine = "native"
+
+        # 当前批次是否修正 ASS 头部（开始提取时从界面选项读取）
+        self.batch_ass_fix = False
+
+        # 精简探测：ffprobe 只输出导出流程用到的字段（流序号/类型/编码、宽高帧率、语言及附件文件名/类型），
+        # 附件很多的文件解析更快、每行保存的数据更少；需要完整 JSON 时设为 False
+        self.lean_probe = True
+        self.lean_probe_entries = (
+            "stream=index,codec_type,codec_name,width,height,r_frame_rate"
+            ":stream_tags=language,filename,mimetype"
+        )
+
         # ==============================
         # 兼容 PyCharm + 打包后两种情况
         # ==============================
@@ -89,640 +1820,942 @@ class SubtitleExtractorApp:
 
         self.spp2pgs_exe = self.base_dir / "spp2pgs" / "Spp2Pgs.exe"
 
+        # ffprobe 结果持久化缓存：重复导入未修改的文件时只需一次 stat，无法打开时不使用缓存
+        try:
+            self.probe_cache = ProbeCache(ProbeCache.default_path(self.base_dir))
+        except (OSError, sqlite3.Error) as e:
+            self.log(f"⚠️ 无法打开探测缓存，将不使用缓存: {e}")
+            self.probe_cache = None
+
+        # 导出清单：重复运行时跳过源文件与选项都没有变化、输出仍然存在的轨道；force_rebuild 为 True 时全部重新导出
+        self.force_rebuild = False
+        try:
+            self.output_manifest = OutputManifest(OutputManifest.default_path(self.base_dir))
+        except (OSError, sqlite3.Error) as e:
+            self.log(f"⚠️ 无法打开导出清单，将始终重新导出: {e}")
+            self.output_manifest = None
+
+        # 批处理日志：中途退出后下一次运行相同参数的批次时跳过已完成的视频、清理遗留的临时目录
+        try:
+            self.journal = BatchJournal(os.path.join(_cache_dir(self.base_dir), "journal"), journal_name)
+        except OSError as e:
+            self.log(f"⚠️ 无法创建批处理日志，将不支持中断恢复: {e}")
+            self.journal = None
+
         # self.program_dir = Path(sys.executable).parent  # exe 所在目录
         # self.spp2pgs_exe = self.program_dir / "spp2pgs" / "Spp2Pgs.exe"
 
-        self.create_widgets()
+    # ✅ 静默运行子进程（Windows下隐藏控制台窗口）
+    def run_silently(self, cmd, tool=None, **kwargs):
+        """
+        静默运行命令行指令并在失败时抛出异常（经由 process_runner，受工具并发限制）
+        :param tool: 并发限制使用的工具名，默认按可执行文件名推断
+        :param kwargs: 传给 AsyncProcessRunner.run（cwd / timeout / on_stdout / on_stderr 等）
+        """
+        if tool is None:
+            tool = self._tool_name(cmd[0])
 
-    def create_widgets(self):
-        style = ttk.Style()
-        # 按钮、控件大小缩放
-        self.padx = int(10 * self.scale)
-        self.pady = int(10 * self.scale)
-        self.ipady = int(round(1 * self.scale))
-        self.scrollbar_width = int(16 * self.scale)
-        self.line_height = int(20 * self.scale)
-        self.parameter_width = int(50 * self.scale)
-        style.configure("Treeview", rowheight=self.line_height)
+        result = self._run_process(tool, cmd, **kwargs)
+        if result.returncode != 0:
+            stderr = result.stderr.decode(errors='ignore').strip()
+            raise RuntimeError(f"ffmpeg 执行失败 (code={result.returncode}):\n{stderr}")
+        return result
 
-        button_frame = tk.Frame(self.root)
-        button_frame.pack(fill=tk.X, pady=self.pady)
-        button_frame.columnconfigure(3, weight=1)  # 让按钮间隔可调整
-        button_frame.columnconfigure(4, weight=1)  # 让按钮间隔可调整
+    @staticmethod
+    def _tool_name(exe):
+        """可执行文件路径 -> 工具名（ffmpeg / ffprobe / fontforge / spp2pgs）"""
+        return os.path.splitext(os.path.basename(str(exe)))[0].lower()
 
-        self.import_btn = ttk.Button(button_frame, text="导入文件", command=self.import_files)
-        self.import_btn.grid(row=0, column=0, padx=(self.padx, self.padx), ipady=self.ipady)
+    # ✅ 自动定位 ffmpeg.exe 或系统 ffmpeg
+    def get_ffmpeg_exe(self):
+        ffmpeg_exe = os.path.join(self.base_dir, "ffmpeg", "ffmpeg.exe")
+        return ffmpeg_exe if os.path.exists(ffmpeg_exe) else "ffmpeg"
 
-        # 新增 删除按钮
-        self.delete_btn = ttk.Button(button_frame, text="删除", command=self.delete_selected, width=5)
-        self.delete_btn.grid(row=0, column=1, padx=(0, self.padx), ipady=self.ipady)
+    # ✅ 自动定位 ffprobe.exe 或系统 ffprobe
+    def get_ffprobe_exe(self):
+        ffprobe_exe = os.path.join(self.base_dir, "ffmpeg", "ffprobe.exe")
+        return ffprobe_exe if os.path.exists(ffprobe_exe) else "ffprobe"
 
-        self.clear_btn = ttk.Button(button_frame, text="清空", command=self.clear_all, width=5)
-        self.clear_btn.grid(row=0, column=2, padx=(0, self.padx), ipady=self.ipady)
+    # ✅ 替代 ffmpeg.run()
+    def silent_ffmpeg_run(self, args, **kwargs):
+        """
+        使用 subprocess 直接调用 ffmpeg，静默执行。
+        参数 args 为 ffmpeg 参数列表（不含可执行路径）。
+        """
+        ffmpeg_exe = self.get_ffmpeg_exe()
+        cmd = [ffmpeg_exe] + args
+        result = self.run_silently(cmd, **kwargs)
 
-        self.subfmt_frame = ttk.Frame(button_frame)
-        self.subfmt_frame.columnconfigure(1, weight=1)
-        self.subfmt_frame.grid(row=0, column=3, sticky="e")
-        ttk.Label(self.subfmt_frame, text="格式:").grid(row=0, column=0, padx=(0, 5), sticky="e")
-        self.subfmt_var = tk.StringVar(value="ass")
-        self.subfmt_cb = ttk.Combobox(self.subfmt_frame, textvariable=self.subfmt_var, width=5, state="readonly")
-        self.subfmt_cb.grid(row=0, column=1, padx=(0, 0), ipady=self.ipady, sticky="e")
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"❌ ffmpeg 执行失败 (code={result.returncode})\n{result.stderr.decode(errors='ignore')}"
+            )
+        return result
 
-        self.load_subtitle_formats()
+    # ✅ 替代 ffmpeg.probe()
+    def silent_ffmpeg_probe(self, filename, **kwargs):
+        """
+        使用 subprocess 调用 ffprobe 获取视频信息。
+        文件大小和修改时间未变时直接返回缓存结果，不启动 ffprobe。
+        """
+        scope = "lean" if self.lean_probe else "full"
+        st = os.stat(filename)
+        if self.probe_cache:
+            try:
+                cached = self.probe_cache.get(filename, st, scope)
+            except sqlite3.Error:
+                cached = None
+            if cached is not None:
+                return cached
 
-        self.ass_fix_var = tk.BooleanVar(value=False)
-        self.ass_fix_cb = ttk.Checkbutton(button_frame, text="清空头部", variable=self.ass_fix_var)
-        self.ass_fix_cb.grid(row=0, column=4, padx=(self.padx, 0), sticky="w")
+        ffprobe_exe = self.get_ffprobe_exe()
+        cmd = [
+            ffprobe_exe,
+            "-v", "quiet",
+            "-print_format", "json",
+        ]
+        if self.lean_probe:
+            cmd += ["-show_entries", self.lean_probe_entries]
+        else:
+            cmd += ["-show_streams", "-show_format"]
+        cmd.append(filename)
 
-        # 绑定事件：当字幕格式变化时更新 ass_fix_cb 显示状态
-        self.subfmt_cb.bind("<<ComboboxSelected>>", lambda e: self.update_ass_fix_visibility())
+        result = self.run_silently(cmd, **kwargs)
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"❌ ffprobe 执行失败 (code={result.returncode})\n{result.stderr.decode(errors='ignore')}"
+            )
 
-        # 将原来的 restore_font_cb 改为下拉栏：子集合并 / 封装字体
-        self.font_mode_var = tk.StringVar(value="封装字体")
-        self.font_mode_frame = ttk.Frame(button_frame)
-        self.font_mode_frame.grid(row=0, column=5, sticky="w")
-        ttk.Label(self.font_mode_frame, text="").grid(row=0, column=0, padx=(0, 0), sticky="e")
-        self.font_mode_cb = ttk.Combobox(self.font_mode_frame, textvariable=self.font_mode_var,
-                                         values=("封装字体", "子集合并", "字体名还原", "无处理"), width=8,
-                                         state="readonly")
-        self.font_mode_cb.grid(row=0, column=1, padx=(0, self.padx), ipady=self.ipady, sticky="w")
-
-        self.extract_btn = ttk.Button(button_frame, text="提取字幕", command=self.extract_subtitles_clicked)
-        self.extract_btn.grid(row=0, column=6, padx=(0, self.scrollbar_width), ipady=self.ipady, sticky="e")
-
-        # 初始显示状态，根据默认值判断
-        self.update_ass_fix_visibility()
-
-        # --- 把 Treeview 和 Scrollbar 放在一个 Frame 里 ---
-        tree_frame = tk.Frame(self.root)
-        tree_frame.pack(fill=tk.BOTH, expand=True, padx=(self.padx, 0), pady=(0, self.pady))
-
-        # Treeview with checkbox column
-        columns = ("Check", "filename", "width", "height", "fps")
-        self.tree = ttk.Treeview(tree_frame, columns=columns, show="headings", selectmode="extended")
-        self.tree.heading("Check", text="☑", command=self.toggle_all_selection)
-        self.tree.heading("filename", text="文件名")
-        self.tree.heading("width", text="宽度")
-        self.tree.heading("height", text="高度")
-        self.tree.heading("fps", text="刷新率")
-
-        self.tree.column("Check", width=self.line_height, anchor="center", stretch=False)
-        self.tree.column("filename", width=200)
-        self.tree.column("width", width=self.parameter_width, anchor="center", stretch=False)
-        self.tree.column("height", width=self.parameter_width, anchor="center", stretch=False)
-        self.tree.column("fps", width=self.parameter_width, anchor="center", stretch=False)
-
-        # y 方向滚动条
-        yscroll = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=yscroll.set)
-
-        # 布局：Treeview 左，纵向滚动条右
-        self.tree.grid(row=0, column=0, sticky="nsew")
-        yscroll.grid(row=0, column=1, sticky="ns")
+        info = json.loads(result.stdout.decode('utf-8', errors='ignore'))
+        if self.probe_cache:
+            try:
+                self.probe_cache.put(filename, st, info, scope)
+            except sqlite3.Error as e:
+                self.log(f"⚠️ 写入探测缓存失败: {e}")
+        return info
+
+    @traced("probe", video_arg=0)
+    def probe_file(self, path):
+        """探测单个文件，返回 (width, height, fps, ProbeSummary)，失败时各项为空"""
+        try:
+            summary = ProbeSummary.from_probe(self.silent_ffmpeg_probe(path))
+        except Exception:
+            return "", "", "", None
+        return summary.width, summary.height, summary.fps, summary
 
-        tree_frame.rowconfigure(0, weight=1)
-        tree_frame.columnconfigure(0, weight=1)
+    def load_full_probe(self, path):
+        """读取完整 ffprobe 结果：文件未修改时直接来自探测缓存，否则重新探测"""
+        return self.silent_ffmpeg_probe(path)
 
-        # 拖拽支持
-        self.tree.drop_target_register(DND_FILES)
-        self.tree.dnd_bind('<<Drop>>', lambda event: self.on_files_dropped(event))
+    def load_files(self, paths, cancel_event=None):
+        """
+        无界面导入：并行探测后一次性加入文件列表，返回 (加入的 FileRecord 列表, 探测失败的路径列表)
+        :param cancel_event: 被设置后不再开始新的探测，尚未探测的文件不出现在返回结果中
+        """
+        def probe(path):
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            return self.probe_file(path)
+
+        paths = [p for p in dict.fromkeys(paths) if os.path.isfile(p) and p not in self.files]
+        with ThreadPoolExecutor(max_workers=self.probe_workers, thread_name_prefix="probe") as pool:
+            results = list(pool.map(probe, paths))
+        records, failed = [], []
+        for path, result in zip(paths, results):
+            if result is None:
+                continue
+            width, height, fps, probe = result
+            if probe is None:
+                failed.append(path)
+                continue
+            records.append(FileRecord(path, width=width, height=height, fps=fps, probe=probe))
+        return self.files.add_many(records), failed
 
-        # 绑定点击事件处理复选框切换
-        self.tree.bind("<Button-1>", self.on_tree_click)
-        self.enable_treeview_edit(self.tree)
+    def run_batch(self, subfmt, selected_files, outdir=None, font_mode="子集合并"):
+        """
+        统一调度字幕提取（阻塞直到批次结束，图形界面在工作线程中调用）
+        :param selected_files: [(全路径, 文件名), ...]，文件须已探测并登记在 self.files 中
+        :return: {"cancelled": 是否被取消, "temp_outdir": 未指定输出目录时存放合并字体的临时目录或 None}
+        """
+        if not self.tracer.enabled:
+            return self._run_batch(subfmt, selected_files, outdir, font_mode)
+        try:
+            with self.tracer.span("batch", format=subfmt, font_mode=font_mode, videos=len(selected_files)):
+                return self._run_batch(subfmt, selected_files, outdir, font_mode)
+        finally:
+            # 跟踪覆盖上一批结束以来的全部阶段（含导入时的探测），导出后清空，长时间运行不累积
+            self.last_trace_stats = self.tracer.aggregate()
+            self.log("⏱️ 各阶段耗时：\n" + self.tracer.summary())
+            if self.trace_path:
+                try:
+                    self.tracer.export_chrome(self.trace_path)
+                    self.log(f"⏱️ 跟踪已导出: {self.trace_path}")
+                except OSError as e:
+                    self.log(f"⚠️ 导出跟踪失败: {e}")
+            self.tracer.reset()
 
-        # 绑定
-        def block_resize(event):
-            region = self.tree.identify_region(event.x, event.y)
-            # 只阻止列标题边界（separator）拖拽
-            if region == "separator":
-                return "break"
-            # 点击其他区域（row, cell, heading）正常处理
+    def _run_batch(self, subfmt, selected_files, outdir, font_mode):
+        need_merge_fonts = False
+        temp_outdir = None
+        used_temp_dir = False
+        cancelled = False
+        self._batch_cancel.clear()
+        self._batch_resume.set()
+        self._batch_temp_dirs.clear()
+        self._batch_timeouts.clear()
+        self._batch_uptodate.clear()
+        self._mark_batch_thread()
 
-        self.tree.bind("<Button-1>", block_resize, add="+")
+        # ✅ 如果 outdir 为 None，仅创建临时目录备用（但不替换 outdir）
+        if outdir is None:
+            temp_outdir = self._make_temp_dir("subs_extract_")
+            used_temp_dir = True
+            self.log(f"未指定输出目录，已创建临时目录供合并字体使用: {temp_outdir}")
 
-    def load_subtitle_formats(self):
-        formats = [
-            "ass",  # Advanced SubStation Alpha
-            "srt",  # SubRip Subtitle
-            "ssa",  # SubStation Alpha
-            # "sub",  # MicroDVD, VobSub, DVD subtitles (图片字幕但常作为subtitle格式名)
-            # "vtt",  # WebVTT
-            "sup",  # SubPicture Subtitle
-            "原格式",
-            # "lrc",
-            # "mov_text",  # QuickTime text subtitles (比如mp4里的字幕)
-            # "pgs",  # Presentation Graphic Stream (Blu-ray)
-            # "dvdsub",  # DVD subtitles (图像字幕)
-            # "xsub",  # XVid subtitles
-            # "hdmv_pgs_subtitle",  # 高清多媒体播放机PGS字幕
-            # "webvtt"  # Web Video Text Tracks (类似vtt)
-        ]
+        # --- 清空上一批次的染色（只处理带状态的行）与错误记录 ---
+        with self._row_status_lock:
+            colored = list(self._row_status)
+        with self._state_lock:
+            self._batch_errors = []
+            self._batch_outputs = {}
+        for path in colored:
+            self._set_row_status(path, None)
+
+        # 批处理日志：恢复上一批次中途退出的进度，跳过已隔离与已完成的视频
+        params = {"subfmt": subfmt, "outdir": outdir, "font_mode": font_mode, "ass_fix": self.batch_ass_fix,
+                  "force": self.force_rebuild}
+        jobs, need_merge_fonts = self._begin_journal(params, selected_files)
+        if temp_outdir:
+            self._journal("temp", path=temp_outdir)
+
+        # 并行处理视频：Fonts/<序号>_<视频名> 按原顺序编号，字体合并在全部视频完成后执行
+        workers = max(1, min(self.max_workers, len(jobs)))
+        # 轨道级任务提交到独立的共享线程池，视频线程只等待结果，不会占满彼此的线程造成死锁
+        with ThreadPoolExecutor(max_workers=self.max_stream_workers, thread_name_prefix="stream",
+                                initializer=self._mark_batch_thread) as stream_pool, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="video",
+                                   initializer=self._mark_batch_thread) as pool:
+            futures = [
+                pool.submit(self.extract_video_subtitles, seq_num, fullpath, filename, subfmt, outdir, temp_outdir,
+                            font_mode, stream_pool)
+                for seq_num, fullpath, filename in jobs
+            ]
+            for future, (_, fullpath, filename) in zip(futures, jobs):
+                try:
+                    if future.result():
+                        need_merge_fonts = True
+                except BatchCancelled:
+                    cancelled = True
+                    self._set_row_status(fullpath, None)  # 未完成的视频不染色
+                except Exception as e:
+                    self.report_error("视频处理失败", f"{filename} 错误: {e}")
+                    self._set_row_status(fullpath, "fail")
+                    if self.journal is not None:
+                        self.journal.add_failure(fullpath, f"处理异常: {e}")
+
+        if cancelled:
+            # 已完成的视频保留输出；删除本批次遗留的临时目录并卸载仍注册的临时字体
+            self._cleanup_cancelled_batch()
+            if self.journal is not None:
+                self.journal.end(cancelled=True)
+            return {"cancelled": True, "temp_outdir": None}
+
+        # 全局字体合并（所有视频都已是最新时 Fonts 根目录没有变化，不再合并）
+        all_uptodate = bool(selected_files) and len(self._batch_uptodate) == len(selected_files)
+        if all_uptodate:
+            self.log("⏭️ 所有视频的字幕都已是最新")
+        elif (font_mode == "子集合并" and subfmt != "sup") or (
+                font_mode == "子集合并" and subfmt == "原格式" and need_merge_fonts):
+            fonts_root = os.path.join(outdir or temp_outdir, "Fonts")
+            if os.path.exists(fonts_root):
+                self.merge_fonts(fonts_root)
+                self.log("📚 所有视频字体已合并到 Fonts 根目录")
 
-        self.subfmt_cb['values'] = formats
-        self.subfmt_var.set("ass")
+        if self.journal is not None:
+            self.journal.end()
+        return {"cancelled": False, "temp_outdir": temp_outdir if used_temp_dir else None}
 
-    def set_treeview_clickable(self, enabled: bool):
+    def _begin_journal(self, params, selected_files):
         """
-        控制 Treeview 是否允许点击交互。
-        关闭点击时，会屏蔽鼠标事件；
-        重新开启时，会恢复之前绑定的所有事件。
+        写入新批次的开始记录。上一批次中途退出时先删除它遗留的临时目录（含未完成视频的 Fonts/<序号>_* 目录），
+        为处理到一半的视频记一次失败；参数相同时跳过上次已完成、源文件未修改且输出仍存在的视频
+        :return: ([(序号, 全路径, 文件名), ...] 需要处理的视频, 跳过的视频中是否有待合并的字体)
         """
-        events = ["<Button-1>", "<ButtonRelease-1>", "<B1-Motion>", "<Double-1>", "<Motion>"]
-
-        if not hasattr(self, "_tree_bind_backup"):
-            self._tree_bind_backup = {}
-
-        if not enabled:
-            # 保存当前绑定函数
-            for ev in events:
-                func = self.tree.bind(ev)
-                if func:
-                    self._tree_bind_backup[ev] = func
-                # 阻止所有点击事件
-                self.tree.bind(ev, lambda e: "break")
-        else:
-            # 恢复之前保存的绑定函数
-            for ev in events:
-                if ev in self._tree_bind_backup:
-                    self.tree.bind(ev, self._tree_bind_backup[ev])
-                else:
-                    # 没有备份的事件，解除阻止
-                    self.tree.unbind(ev)
-
-    def update_ass_fix_visibility(self):
-        fmt = self.subfmt_var.get().lower()
-        if fmt in ("ass", "ssa", "原格式"):
-            self.ass_fix_cb.config(state="normal")
-            self.font_mode_cb.config(state="normal")
-        else:
-            self.ass_fix_cb.config(state="disabled")
-            self.font_mode_cb.config(state="disabled")
+        numbered = [(seq_num, fullpath, filename) for seq_num, (fullpath, filename) in enumerate(selected_files, 1)]
+        if self.journal is None:
+            return numbered, False
+
+        previous = self.journal.recover()
+        resumed = {}
+        if previous:
+            self.log("♻️ 上一批次未正常结束，正在清理并恢复进度…")
+            for path in previous["temps"]:
+                if os.path.exists(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                    self.log(f"🧹 已删除遗留的临时目录: {path}")
+            for path in previous["unfinished"]:
+                count = self.journal.add_failure(path, "处理中途退出")
+                self.log(f"⚠️ 上次处理中途退出: {os.path.basename(path)}（累计 {count} 次）")
+            if previous["params"] == params:
+                resumed = previous["done"]
+        self.journal.begin(params)
+
+        jobs, need_merge_fonts = [], False
+        for seq_num, fullpath, filename in numbered:
+            reason = self.journal.quarantined(fullpath)
+            if reason:
+                self.report_error("已隔离", f"{filename} 多次崩溃或超时（{reason}），已跳过；修改文件或解除隔离后可重试")
+                self._set_row_status(fullpath, "fail")
+                continue
+            entry = resumed.get(fullpath)
+            if entry and self._journal_entry_current(entry):
+                self.log(f"⏭️ 上次已完成，跳过: {filename}")
+                need_merge_fonts |= entry.get("merge", False)
+                self._finish_video(fullpath, entry["status"] != "success", entry["outputs"],
+                                   keep=entry.get("keep"), merge=entry.get("merge", False))
+                continue
+            jobs.append((seq_num, fullpath, filename))
+        return jobs, need_merge_fonts
 
-    # ✅ 静默运行子进程（Windows下隐藏控制台窗口）
-    def run_silently(self, cmd, **kwargs):
-        """静默运行命令行指令并在失败时抛出异常"""
-        if os.name == 'nt':  # Windows系统
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = 0  # SW_HIDE
-            kwargs['startupinfo'] = startupinfo
-
-        kwargs.setdefault('stdout', subprocess.PIPE)
-        kwargs.setdefault('stderr', subprocess.PIPE)
-        kwargs.setdefault('stdin', subprocess.DEVNULL)
-
-        result = subprocess.run(cmd, **kwargs)
-        if result.returncode != 0:
-            stderr = result.stderr.decode(errors='ignore').strip()
-            raise RuntimeError(f"ffmpeg 执行失败 (code={result.returncode}):\n{stderr}")
-        return result
+    @staticmethod
+    def _journal_entry_current(entry):
+        """日志中的 video_done 记录仍然有效：源文件未修改且输出都还在"""
+        try:
+            if BatchJournal.fingerprint(entry["path"]) != entry.get("fingerprint"):
+                return False
+        except OSError:
+            return False
+        return all(os.path.exists(p) for p in entry["outputs"])
+
+    def _journal(self, ev, **fields):
+        if self.journal is not None:
+            self.journal.record(ev, **fields)
+
+    def close(self):
+        """关闭探测缓存与导出清单（命令行/监视模式退出时调用）"""
+        for db in (self.probe_cache, self.output_manifest):
+            if db is not None:
+                db.close()
+
+    def pause(self):
+        """暂停：不再开始新的视频/轨道，已在运行的继续完成"""
+        self._batch_resume.clear()
+
+    def resume(self):
+        self._batch_resume.set()
+
+    @property
+    def paused(self):
+        return not self._batch_resume.is_set()
+
+    def cancel(self):
+        """取消：先设置取消标记再结束所有子进程，未开始的任务不再执行（可从任意线程调用）"""
+        self._batch_cancel.set()
+        self._batch_resume.set()  # 唤醒暂停中的任务，让它们在检查点退出
+        self.process_runner.cancel_all()
+
+    def batch_results(self):
+        """本批次各视频的结果：[(全路径, 状态, [生成的字幕文件])]，状态为 success/partial/fail"""
+        with self._row_status_lock:
+            statuses = dict(self._row_status)
+        with self._state_lock:
+            outputs = dict(self._batch_outputs)
+        return [(path, statuses.get(path), outputs.get(path, [])) for path in statuses]
+
+    def export_fonts(self, fonts_root, export_dir):
+        """把 fonts_root 下提取的字体复制到 export_dir/Fonts（目录不存在时回退到上级存在的目录），返回导出目录"""
+        # 如果目录不存在，则回退到上级存在的目录
+        temp_dir = export_dir
+        while not os.path.exists(temp_dir):
+            temp_dir = os.path.dirname(temp_dir)
+        export_dir = temp_dir
+        # 🟢 在导出目录中创建 Fonts 文件夹
+        export_fonts_dir = os.path.join(export_dir, "Fonts")
+        os.makedirs(export_fonts_dir, exist_ok=True)
+
+        for item in os.listdir(fonts_root):
+            src = os.path.join(fonts_root, item)
+            dst = os.path.join(export_fonts_dir, item)
+            if os.path.isdir(src):
+                shutil.copytree(src, dst, dirs_exist_ok=True)
+            else:
+                shutil.copy2(src, dst)
+        self.log(f"字体已导出到: {export_fonts_dir}")
+        return export_fonts_dir
 
-    # ✅ 自动定位 ffmpeg.exe 或系统 ffmpeg
-    def get_ffmpeg_exe(self):
-        ffmpeg_exe = os.path.join(self.base_dir, "ffmpeg", "ffmpeg.exe")
-        return ffmpeg_exe if os.path.exists(ffmpeg_exe) else "ffmpeg"
+    def _mark_batch_thread(self):
+        self._batch_thread.active = True
 
-    # ✅ 自动定位 ffprobe.exe 或系统 ffprobe
-    def get_ffprobe_exe(self):
-        ffprobe_exe = os.path.join(self.base_dir, "ffmpeg", "ffprobe.exe")
-        return ffprobe_exe if os.path.exists(ffprobe_exe) else "ffprobe"
+    def _checkpoint(self):
+        """批处理检查点：暂停时在此等待，已取消时抛出 BatchCancelled（非批处理线程中不起作用）"""
+        if not getattr(self._batch_thread, "active", False):
+            return
+        while not self._batch_resume.wait(0.2):
+            pass
+        if self._batch_cancel.is_set():
+            raise BatchCancelled()
 
-    # ✅ 替代 ffmpeg.run()
-    def silent_ffmpeg_run(self, args, **kwargs):
+    def _run_process(self, tool, cmd, **kwargs):
         """
-        使用 subprocess 直接调用 ffmpeg，静默执行。
-        参数 args 为 ffmpeg 参数列表（不含可执行路径）。
+        经由 process_runner 运行子进程；批处理线程中的子进程受取消控制，
+        被取消时抛出 BatchCancelled 而不是普通异常，避免触发各处的回退逻辑
         """
-        ffmpeg_exe = self.get_ffmpeg_exe()
-        cmd = [ffmpeg_exe] + args
-        result = self.run_silently(cmd, **kwargs)
-
-        if result.returncode != 0:
-            raise RuntimeError(
-                f"❌ ffmpeg 执行失败 (code={result.returncode})\n{result.stderr.decode(errors='ignore')}"
-            )
-        return result
-
-    # ✅ 替代 ffmpeg.probe()
-    def silent_ffmpeg_probe(self, filename, **kwargs):
+        kwargs.setdefault("timeout", self.process_timeouts.get(tool))
+        if self.tracer.enabled:
+            with self.tracer.span(f"proc:{tool}", tool=tool, **self._trace_tags()):
+                return self._run_process_untraced(tool, cmd, **kwargs)
+        return self._run_process_untraced(tool, cmd, **kwargs)
+
+    def _run_process_untraced(self, tool, cmd, **kwargs):
+        if logger.isEnabledFor(logging.DEBUG):  # 命令行只在调试级别拼接
+            logger.debug("执行命令：%s", subprocess.list2cmdline([str(c) for c in cmd]))
+        if not getattr(self._batch_thread, "active", False):
+            return self.process_runner.run_sync(tool, cmd, **kwargs)
+        try:
+            return self.process_runner.run_sync(tool, cmd, cancel_event=self._batch_cancel, **kwargs)
+        except CancelledError:
+            if self._batch_cancel.is_set():
+                raise BatchCancelled()
+            raise
+        except subprocess.TimeoutExpired:
+            # 记到当前视频上，视频结束时计入失败次数
+            self.log(f"⏱️ {tool} 超过 {kwargs['timeout']} 秒未结束，已终止")
+            video = getattr(self._batch_thread, "video", None)
+            if video:
+                with self._state_lock:
+                    self._batch_timeouts.add(video)
+            raise
+
+    def _make_temp_dir(self, prefix):
+        """创建临时目录并登记，批处理被取消时统一删除"""
+        path = tempfile.mkdtemp(prefix=prefix)
+        with self._state_lock:
+            self._batch_temp_dirs.add(path)
+        self._journal("temp", path=path)
+        return path
+
+    def _cleanup_cancelled_batch(self):
+        with self._state_lock:
+            temp_dirs, self._batch_temp_dirs = self._batch_temp_dirs, set()
+        for path in temp_dirs:
+            if os.path.exists(path):
+                shutil.rmtree(path, ignore_errors=True)
+                self.log(f"🧹 已删除临时目录: {path}")
+
+        # 正常情况下 generate_subtitles 的 finally 已卸载字体，这里兜底卸载仍登记的临时字体
+        with self._font_env_lock:
+            leftover = [(reg_name, ref[0]) for reg_name, ref in self._font_env_refs.items()]
+            for ref in self._font_env_refs.values():
+                ref[1] = 1
+        if leftover:
+            self.cleanup_environment(leftover)
+
+    @traced("video", video_arg=1)
+    def extract_video_subtitles(self, seq_num, fullpath, filename, subfmt, outdir, temp_outdir, font_mode,
+                                stream_pool=None):
         """
-        使用 subprocess 调用 ffprobe 获取视频信息。
+        处理单个视频的全部字幕轨道与字体（可在线程池中并行执行）
+        :param stream_pool: 轨道级共享线程池，各轨道并行处理后按轨道顺序汇总；为 None 时顺序执行
+        :return: 是否生成了需要最终合并的 Fonts/<序号>_<视频名> 目录
         """
-        ffprobe_exe = self.get_ffprobe_exe()
-        cmd = [
-            ffprobe_exe,
-            "-v", "quiet",
-            "-print_format", "json",
-            "-show_streams",
-            "-show_format",
-            filename
-        ]
-
-        result = self.run_silently(cmd, **kwargs)
-        if result.returncode != 0:
-            raise RuntimeError(
-                f"❌ ffprobe 执行失败 (code={result.returncode})\n{result.stderr.decode(errors='ignore')}"
-            )
-
-        return json.loads(result.stdout.decode('utf-8', errors='ignore'))
+        had_error = False
+        need_merge_fonts = False
+        self._checkpoint()  # 暂停时不开始新的视频
+        self._batch_thread.video = fullpath  # 子进程超时与跟踪标签记到这个视频上
+        self._batch_thread.stream = None
+        self._journal("video_start", path=fullpath, seq=seq_num)
+
+        # --- 开始处理前先染灰色 ---
+        self._set_row_status(fullpath, "processing")
+        generated_subs_for_video = []
+        # print(f"fullpath:{fullpath}")
+        self.log(f"分析字幕轨道：{filename}")
+        record = self.files.get(fullpath)
+        if record is None:
+            self.log(f"无法找到视频信息: {filename}，跳过")
+            self._finish_video(fullpath, True, [])
+            return False
 
-    def import_files(self):
-        paths = filedialog.askopenfilenames(title="选择视频文件")
-        if not paths:
-            return
-        # self.add_files(paths)
-        t = threading.Thread(target=self.add_files, args=(paths,))
-        t.start()
+        height = record.height
+        width = record.width
+        fps = record.fps
+        probe = record.probe  # 直接使用已存的精简 probe
+        logger.debug("文件参数：%r", record)  # 只在启用调试级别时格式化
 
-    def add_files(self, paths):
-        self.root.after(0, self.save_and_disable_buttons)
-        for p in paths:
-            p = p.strip("'\"")
-            if os.path.isfile(p) and p not in [f[0] for f in self.files]:
-                filename = os.path.basename(p)
-                width = ""
-                height = ""
-                fps = ""
-                probe_info = None
+        if not probe:
+            self.log(f"缺少 probe 信息: {filename}，跳过")
+            self._finish_video(fullpath, True, [])
+            return False
 
-                try:
-                    info = self.silent_ffmpeg_probe(p)
-                    probe_info = info  # 保存完整视频信息
-                    for stream in info.get("streams", []):
-                        if stream.get("codec_type") == "video":
-                            width = stream.get("width", "")
-                            height = stream.get("height", "")
-                            r_frame_rate = stream.get("r_frame_rate", "")
-                            if r_frame_rate and r_frame_rate != "0/0":
-                                num, den = map(int, r_frame_rate.split("/"))
-                                if den != 0:
-                                    fps = round(num / den, 3)
-                            break
-                except Exception:
-                    pass
+        subtitle_streams = probe.subtitle_streams()
+        if not subtitle_streams:
+            self.log(f"{filename} 没有字幕轨道，跳过")
+            self._finish_video(fullpath, True, [])
+            return False
 
-                # 用统一字段顺序创建 tuple
-                file_tuple = (
-                    p,  # fullpath
-                    filename,  # filename
-                    True,  # checked
-                    width,  # width
-                    height,  # height
-                    fps,  # fps
-                    probe_info  # full probe 信息
-                )
-                self.files.append(file_tuple)
-                self.original_files.append((p, filename))
-                # 安全刷新UI
-                self.root.after(0, self.refresh_tree)
+        if subfmt == "原格式":
+            detected_formats = list({s.get("codec_name", "").lower() for s in subtitle_streams})
+            self.log(f"检测到字幕格式: {detected_formats}")
 
-            else:
-                if not os.path.isfile(p):
-                    print(f"无效的文件路径: {p}")  # 如果路径无效，输出提示
-                else:
-                    print(f"文件已存在: {p}")  # 如果文件已经在列表中，输出提示
+        global_mapping = {}
+        temp_font_dir = None
 
-        self.root.after(0, self.restore_buttons_state)
-        print(self.files)
+        has_ass_ssa = any(s.get("codec_name", "").lower() in ("ass", "ssa") for s in subtitle_streams)
 
-    def clear_list(self):
-        self.files.clear()
-        self.refresh_tree()
+        stream_jobs = []
+        for stream in subtitle_streams:
+            codec_name = stream.get("codec_name", "").lower()
+            mapped = self.codec_to_subfmt.get(codec_name, codec_name)  # 映射（若无则退回 codec_name）
+            # 如果用户指定 "原格式"，就用映射后的值；否则沿用外部传进来的 subfmt
+            cur_subfmt = mapped if subfmt == "原格式" else subfmt
+            stream_jobs.append((stream, cur_subfmt))
 
-    def refresh_tree(self):
-        self.tree.delete(*self.tree.get_children())
-        for file_tuple in self.files:
-            file_info = dict(zip(self.file_fields, file_tuple))
-            checked = file_info.get("checked")
-            fullpath = file_info.get("fullpath")
-            filename = file_info.get("filename", "")
-            width = file_info.get("width", "")
-            height = file_info.get("height", "")
-            fps = file_info.get("fps", "")
-            probe_info = file_info.get("probe_info", "")
-            chk = "☑" if checked else "☐"
-            self.tree.insert("", tk.END, iid=fullpath, values=(chk, filename, width, height, fps, probe_info))
-        self.update_header_checkbox()
+        need_temp_fonts = (font_mode == "封装字体" and subfmt in ("ass", "ssa")) or subfmt == "sup" or (
+                subfmt == "原格式" and font_mode == "封装字体" and has_ass_ssa)
+        need_subset_fonts = (font_mode == "子集合并" and subfmt in ("ass", "ssa")) or (
+                font_mode == "子集合并" and subfmt == "原格式" and has_ass_ssa)
 
-    def delete_selected(self):
-        selected_items = self.tree.selection()
-        if not selected_items:
-            messagebox.showinfo("提示", "请先选中要删除的文件行")
-            return
+        # 导出清单：跳过源文件与选项都没有变化、输出仍然存在的轨道
+        # 子集合并的字体映射来自该视频的全部 ASS 轨道，只有整个视频都是最新时才跳过
+        try:
+            src_st = os.stat(fullpath)
+        except OSError:
+            src_st = None
+        uptodate = self._uptodate_outputs(fullpath, src_st, stream_jobs, outdir, font_mode)
+        if need_subset_fonts and len(uptodate) < len(stream_jobs):
+            uptodate = {}
+        uptodate_subs = list(uptodate.values())
+        if uptodate:
+            stream_jobs = [(stream, fmt) for stream, fmt in stream_jobs if stream['index'] not in uptodate]
+            self.log(f"⏭️ {filename}: {len(uptodate)} 个轨道已是最新，跳过")
+            if not stream_jobs:
+                with self._state_lock:
+                    self._batch_uptodate.add(fullpath)
+                self._finish_video(fullpath, False, uptodate_subs)
+                return False
+        produced = []  # [(轨道序号, 目标格式, 输出路径)]，视频处理完成后写入导出清单
 
-        # 删除 self.files 中对应项
-        paths_to_delete = set(selected_items)
-        self.files = [f for f in self.files if f[0] not in paths_to_delete]
+        # 附件导出目录：封装字体/SUP 使用临时目录，子集合并直接导出到 Fonts/<序号>_<视频名>
+        attachment_dir = None
+        if need_temp_fonts:
+            attachment_dir = self._make_temp_dir("sub_fonts_")
+        elif need_subset_fonts:
+            fonts_root = os.path.join(outdir or temp_outdir, "Fonts")
+            os.makedirs(fonts_root, exist_ok=True)
+            attachment_dir = os.path.join(fonts_root, f"{seq_num}_{os.path.splitext(filename)[0]}")
+            if os.path.exists(attachment_dir):
+                shutil.rmtree(attachment_dir)
+            os.makedirs(attachment_dir, exist_ok=True)
+            self._journal("temp", path=attachment_dir)  # 视频完成前中途退出时视为残留
+
+        # 原生 Matroska 引擎先导出能处理的文本轨道，其余轨道交给 ffmpeg；MP4/TS 等容器直接交给 ffmpeg
+        use_native = self.subtitle_engine == "native" and MatroskaReader.is_matroska(fullpath)
+        native = {}
+        if use_native:
+            native = self.extract_subtitles_native(fullpath, filename, stream_jobs, outdir)
+        ffmpeg_jobs = [(stream, fmt) for stream, fmt in stream_jobs if stream['index'] not in native]
+
+        # MKV 的字体附件由原生读取器直接导出，合并读取只为其他容器导出附件
+        demux_attachment_dir = attachment_dir
+        if attachment_dir and use_native:
+            demux_attachment_dir = None
+
+        # 合并读取：附件与所有字幕轨道由同一次 ffmpeg 读取完成，失败的部分各自回退到原有逻辑
+        demuxed, attachments_dumped = {}, False
+        if self.single_pass_demux and (len(ffmpeg_jobs) > 1 or demux_attachment_dir):
+            demuxed, attachments_dumped = self.demux_subtitles_single_pass(
+                fullpath, filename, ffmpeg_jobs, outdir, attachment_dir=demux_attachment_dir)
+        demuxed.update(native)
+
+        # 提前处理字体提取逻辑
+        if need_temp_fonts:
+            try:
+                temp_font_dir = self.extract_all_fonts_to_tempdir(fullpath, temp_dir=attachment_dir,
+                                                                  dumped=attachments_dumped)
+                self.log(f"临时字体目录已创建: {temp_font_dir}")
+            except Exception as e:
+                self.log(f"提取临时字体失败: {e}")
+                shutil.rmtree(attachment_dir, ignore_errors=True)
+                temp_font_dir = None
+                had_error = True
+        elif font_mode == "封装字体":
+            self.log(f"跳过封装字体：输出格式为 {subfmt}，仅在 ass/ssa 时封装字体。")
 
-        self.refresh_tree()
+        try:
+            futures = [
+                self._submit(
+                    stream_pool,
+                    self.extract_single_subtitle,
+                    fullpath=fullpath,
+                    filename=filename,
+                    stream=stream,
+                    subfmt=cur_subfmt,
+                    outdir=outdir,
+                    font_mode=font_mode,
+                    temp_font_dir=temp_font_dir,
+                    width=width,
+                    height=height,
+                    fps=fps,
+                    demuxed_path=demuxed.get(stream['index']),
+                    engine="ffmpeg"  # 原生引擎已整体尝试过
+                )
+                for stream, cur_subfmt in stream_jobs
+            ]
+            # 按轨道顺序收集结果，字体映射的合并顺序与顺序执行时一致
+            for (stream, cur_subfmt), future in zip(stream_jobs, futures):
+                try:
+                    outpath, mapping = future.result()
+                    if outpath:
+                        generated_subs_for_video.append(outpath)
+                        produced.append((stream['index'], cur_subfmt, outpath))
+                    else:
+                        had_error = True
+                    self._journal("stream", path=fullpath, index=stream['index'], output=outpath)
+                    global_mapping.update(mapping)
+                except Exception as e:
+                    # 可以记录这个流的错误，但继续处理其他流
+                    self.log(f"字幕流 {stream} 处理失败: {e}")
+                    had_error = True
+                    continue
+        finally:
+            # 无论如何，所有流处理完后都会删除缓存
+            if subfmt == "sup" and temp_font_dir:
+                shutil.rmtree(temp_font_dir)
 
-    """def ask_output_directory(self):
-        dialog = OutputDirDialog(self.root, title="字幕提取目标目录")
-        return dialog.result"""
+        self._checkpoint()  # 轨道在取消时会被当作失败收集，这里统一转为取消
 
-    def extract_subtitles_clicked(self):
-        if not self.files:
-            messagebox.showwarning("提示", "请先导入视频文件")
-            return
+        if subfmt == "sup":
+            if not had_error:
+                self._record_outputs(fullpath, src_st, produced, outdir, font_mode)
+            # --- 根据执行情况染色 ---
+            self._finish_video(fullpath, had_error, generated_subs_for_video + uptodate_subs)
+            return False  # sup字幕不需要后续处理
 
-        # ✅ 直接从 self.files 获取 fullpath、filename、height、fps
-        selected_files = []
-        for file_tuple in self.files:
-            file_info = dict(zip(self.file_fields, file_tuple))
-            if file_info.get("checked"):
-                fullpath = file_info.get("fullpath")
-                filename = file_info.get("filename")
-                selected_files.append((fullpath, filename))
+        # 处理子集字体还原逻辑（Fonts/<序号>_<视频名> 已在提取前创建）
+        if need_subset_fonts:
+            fonts_root = os.path.join(outdir or temp_outdir, "Fonts")
+            try:
+                self.extract_fonts_from_video(fullpath, fonts_root, global_mapping, seq_num,
+                                              dumped=attachments_dumped)
+                need_merge_fonts = True
+            except Exception as e:
+                self.log(f"删除字体失败: {e}")
+                had_error = True
 
-        if not selected_files:
-            messagebox.showwarning("提示", "请先勾选要提取字幕的文件")
-            return
+        # 封装字体逻辑
+        if (font_mode == "封装字体" and temp_font_dir and subfmt in ("ass", "ssa")) or (
+                subfmt == "原格式" and has_ass_ssa):
+            try:
+                ass_subs = [f for f in generated_subs_for_video if os.path.splitext(f)[1].lower() in ('.ass', '.ssa')]
+                futures = [self._submit(stream_pool, self.embed_fonts_to_ass, subfile, temp_font_dir)
+                           for subfile in ass_subs]
+                for subfile, future in zip(ass_subs, futures):
+                    try:
+                        future.result()
+                        self.log(f"字体已封装到: {os.path.basename(subfile)}")
+                    except Exception as e:
+                        self.log(f"封装字体失败: {subfile} 错误: {e}")
+                        had_error = True
+            finally:
+                try:
+                    shutil.rmtree(temp_font_dir)
+                    self.log(f"临时字体目录已删除: {temp_font_dir}")
+                except Exception as e:
+                    self.log(f"删除临时字体目录失败: {e}")
+                    had_error = True
 
-        subfmt = self.subfmt_var.get().lower()
-        if not subfmt:
-            messagebox.showerror("错误", "请选择字幕格式")
+        if not had_error:
+            self._record_outputs(fullpath, src_st, produced, outdir, font_mode,
+                                 fonts_dir=attachment_dir if need_subset_fonts else None)
+
+        # --- 根据执行情况染色 ---
+        self._finish_video(fullpath, had_error, generated_subs_for_video + uptodate_subs,
+                           keep=attachment_dir if need_subset_fonts else None, merge=need_merge_fonts)
+
+        return need_merge_fonts
+
+    def _output_options(self, fmt, font_mode):
+        """影响输出内容的选项：字体处理方式与头部修正只作用于 ASS/SSA"""
+        if fmt in ("ass", "ssa"):
+            return f"font_mode={font_mode};ass_fix={int(bool(self.batch_ass_fix))}"
+        return ""
+
+    def _uptodate_outputs(self, fullpath, src_st, stream_jobs, outdir, font_mode):
+        """返回 { 轨道序号: 输出路径 }，只包含导出清单中仍然有效的轨道"""
+        if self.force_rebuild or self.output_manifest is None or src_st is None:
+            return {}
+        uptodate = {}
+        for stream, fmt in stream_jobs:
+            outpath = self.output_manifest.lookup(fullpath, src_st, stream['index'],
+                                                  OutputManifest.target(fmt, outdir),
+                                                  self._output_options(fmt, font_mode))
+            if outpath:
+                uptodate[stream['index']] = outpath
+        return uptodate
+
+    def _record_outputs(self, fullpath, src_st, produced, outdir, font_mode, fonts_dir=None):
+        if self.output_manifest is None or src_st is None or not produced:
             return
-
-        # 使用 askyesnocancel 代替原来的 askquestion
-        choice = messagebox.askyesnocancel(
-            "字幕提取目标目录",
-            "字幕默认会被提取到各个视频所在的目录！\n选择“是”继续操作；\n选择“否”指定提取目录。"
-        )
-
-        if choice is None:
-            return  # 用户点击取消或关闭窗口
-
-        if choice:  # Yes → 原目录
-            outdir = None
-        else:  # No → 指定目录
-            outdir = filedialog.askdirectory(title="选择字幕保存目录")
-            if not outdir:  # 用户在选择目录时点了取消
-                return
-
-            # 如果目录不存在，则回退到上级存在的目录
-            temp_dir = outdir
-            while not os.path.exists(temp_dir):
-                temp_dir = os.path.dirname(temp_dir)
-            outdir = temp_dir
-
-            # 尝试创建最终目录
-            try:
-                os.makedirs(outdir, exist_ok=True)
-            except Exception as e:
-                messagebox.showerror("错误", f"无法创建目录：\n{outdir}\n\n错误信息：{e}")
+        entries = [(index, OutputManifest.target(fmt, outdir), self._output_options(fmt, font_mode), outpath)
+                   for index, fmt, outpath in produced]
+        try:
+            self.output_manifest.put(fullpath, src_st, entries, fonts_dir=fonts_dir)
+        except sqlite3.Error as e:
+            self.log(f"⚠️ 写入导出清单失败: {e}")
+
+    def _submit(self, pool, fn, *args, **kwargs):
+        """提交到线程池；pool 为 None 时立即执行并返回已完成的 Future"""
+        if pool is not None:
+            return pool.submit(self._run_for_video, getattr(self._batch_thread, "video", None), fn, *args, **kwargs)
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _run_for_video(self, video, fn, *args, **kwargs):
+        """在轨道线程中执行，子进程超时与跟踪标签能记到提交它的视频上"""
+        self._batch_thread.video = video
+        self._batch_thread.stream = None
+        return fn(*args, **kwargs)
+
+    def _trace_tags(self):
+        tags = {}
+        video = getattr(self._batch_thread, "video", None)
+        if video:
+            tags["video"] = os.path.basename(video)
+        stream = getattr(self._batch_thread, "stream", None)
+        if stream is not None:
+            tags["stream"] = stream
+        return tags
+
+    @staticmethod
+    def _video_result_status(had_error, generated_subs):
+        if had_error and not generated_subs:
+            return "fail"
+        if had_error:
+            return "partial"
+        return "success"
+
+    def _finish_video(self, fullpath, had_error, generated_subs, keep=None, merge=False):
+        """
+        记录单个视频的输出并按执行情况染色，同时写入批处理日志
+        :param keep: 该视频完成后需要保留的 Fonts/<序号>_<视频名> 目录
+        :param merge: 是否有需要最终合并的字体
+        """
+        status = self._video_result_status(had_error, generated_subs)
+        with self._state_lock:
+            self._batch_outputs[fullpath] = list(generated_subs)
+            timed_out = fullpath in self._batch_timeouts
+        if keep:
+            self._journal("keep", path=keep)
+        try:
+            fingerprint = BatchJournal.fingerprint(fullpath)
+        except OSError:
+            fingerprint = None
+        self._journal("video_done", path=fullpath, fingerprint=fingerprint, status=status,
+                      outputs=list(generated_subs), keep=keep, merge=merge)
+        if self.journal is not None:
+            if timed_out:
+                count = self.journal.add_failure(fullpath, "子进程超时")
+                self.log(f"⚠️ {os.path.basename(fullpath)} 处理超时（累计 {count} 次）")
+            elif status == "success":
+                self.journal.clear_failures([fullpath])
+        self._set_row_status(fullpath, status)
+
+    def _set_row_status(self, fullpath, status):
+        """
+        设置视频行的染色状态（可从任意线程调用）
+        行的 iid 就是全路径，无需遍历 Treeview；状态未变化时不推送，变化时标记该行，由主线程下一次刷新时合并应用
+        """
+        with self._row_status_lock:
+            if self._row_status.get(fullpath) == status:
                 return
+            if status is None:
+                self._row_status.pop(fullpath, None)
+            else:
+                self._row_status[fullpath] = status
+            self._dirty_rows.add(fullpath)
 
-        self.save_and_disable_buttons()
-        self.set_treeview_clickable(False)
-        threading.Thread(target=self.extract_subtitles_all, args=(subfmt, selected_files, outdir), daemon=True).start()
-
-    def extract_subtitles_all(self, subfmt, selected_files, outdir=None):
-        need_merge_fonts = False
-        temp_outdir = None
-        used_temp_dir = False
-        """统一调度字幕提取"""
-
-        # ✅ 如果 outdir 为 None，仅创建临时目录备用（但不替换 outdir）
-        if outdir is None:
-            temp_outdir = tempfile.mkdtemp(prefix="subs_extract_")
-            used_temp_dir = True
-            self.log(f"未指定输出目录，已创建临时目录供合并字体使用: {temp_outdir}")
-
-        # --- 清空所有 Treeview 行的染色 ---
-        for item_id in self.tree.get_children():
-            self.tree.item(item_id, tags=())
-
-        # --- 设置染色标签 ---
-        self.tree.tag_configure("success", background="#c8e6c9")  # 绿色
-        self.tree.tag_configure("partial", background="#fff9c4")  # 黄色
-        self.tree.tag_configure("fail", background="#ffcdd2")  # 红色
-        self.tree.tag_configure("processing", background="#e0e0e0")  # 灰色
-
-        for seq_num, (fullpath, filename) in enumerate(selected_files, 1):
-            had_error = False
-            item_id = None
-            for iid in self.tree.get_children():
-                if self.tree.item(iid, "values")[1] == filename:
-                    item_id = iid
-                    break
-
-            # --- 开始处理前先染灰色 ---
-            if item_id:
-                self.tree.item(item_id, tags=("processing",))
-                self.tree.update_idletasks()  # 确保立即刷新界面
-            generated_subs_for_video = []
-            # print(f"fullpath:{fullpath}")
-            self.log(f"分析字幕轨道：{filename}")
-            file_info = next((dict(zip(self.file_fields, f)) for f in self.files if f[0] == fullpath), None)
-            print(outdir)
-            if not file_info:
-                self.log(f"无法找到视频信息: {filename}，跳过")
-                if item_id:
-                    self.tree.item(item_id, tags=("fail",))
-                continue
-
-            height = file_info.get("height", 1080)
-            width = file_info.get("width", 1920)
-            fps = file_info.get("fps", 23.976)
-            probe = file_info.get("probe_info")  # 直接使用已存 probe
-            print(f"文件参数：{file_info}")
-            print(f"fullpath:{fullpath}, width:{width}, height:{height}, fps:{fps}")
-
-            if not probe:
-                self.log(f"缺少 probe 信息: {filename}，跳过")
-                if item_id:
-                    self.tree.item(item_id, tags=("fail",))
-                continue
+    def report_error(self, title, message):
+        """记录批处理错误（可从任意线程调用），批次结束后在汇总中显示"""
+        self.log(f"❌ {title}: {message}")
+        with self._state_lock:
+            self._batch_errors.append((title, message))
 
-            subtitle_streams = [s for s in probe.get('streams', []) if s.get('codec_type') == 'subtitle']
-            if not subtitle_streams:
-                self.log(f"{filename} 没有字幕轨道，跳过")
-                if item_id:
-                    self.tree.item(item_id, tags=("fail",))
+    @traced("demux_single_pass")
+    def demux_subtitles_single_pass(self, fullpath, filename, stream_jobs, outdir, attachment_dir=None):
+        """
+        单次解复用：为一个视频构建一条 ffmpeg 命令，把每个字幕轨道映射到各自的输出（copy 或转换），
+        并让解复用器丢弃视频/音频包；指定 attachment_dir 时同一次读取还会导出全部附件。
+        :param stream_jobs: [(stream, 目标格式), ...]
+        :param attachment_dir: 附件导出目录（-dump_attachment 写入工作目录）
+        :return: ({轨道 index: 已导出的文件路径}, 附件是否已导出)；SUP 目标返回供 Spp2Pgs 使用的临时 ASS。
+                 命令失败时返回 ({}, False)，交由 extract_single_subtitle 与字体步骤各自回退。
+        """
+        output_args = []
+        planned = {}
+        for stream, subfmt in stream_jobs:
+            idx = stream['index']
+            codec_name = stream.get('codec_name', '').lower()
+            original_fmt = self.codec_to_subfmt.get(codec_name)
+
+            if original_fmt == subfmt:
+                outpath = self._subtitle_outpath(fullpath, filename, stream, subfmt, outdir)
+                codec = "copy"
+            elif codec_name in self.bitmap_sub_codecs:
+                # 位图字幕转文本必然失败，保留给逐轨道回退逻辑
                 continue
+            elif subfmt == "sup":
+                # SUP 需先生成临时 ASS，每个轨道使用独立的临时目录，转换完成后由 handle_sup_conversion 清理
+                ass_temp_dir = self._make_temp_dir("ass_temp_")
+                outpath = self._subtitle_outpath(fullpath, filename, stream, "ass", ass_temp_dir)
+                codec = "ass"
+            else:
+                outpath = self._subtitle_outpath(fullpath, filename, stream, subfmt, outdir)
+                codec = subfmt
+
+            output_args += ["-map", f"0:{idx}", "-c:s", codec, outpath]
+            planned[idx] = outpath
+
+        if not planned and not attachment_dir:
+            return {}, False
+
+        cmd = [self.get_ffmpeg_exe(), "-y"]
+        kwargs = {}
+        if attachment_dir:
+            cmd += ["-dump_attachment:t", ""]  # 提取所有附件
+            kwargs['cwd'] = attachment_dir  # dump_attachment 会保存到工作目录
+        cmd += [
+            "-discard:v", "all",  # 解复用阶段直接丢弃视频包
+            "-discard:a", "all",  # 解复用阶段直接丢弃音频包
+            "-i", fullpath
+        ] + output_args
+
+        self.log(f"单次解复用 {len(planned)} 个字幕轨道{'及附件' if attachment_dir else ''}：{filename}")
+        try:
+            self.run_silently(cmd, **kwargs)
+        except Exception as e:
+            # 只导出附件时 ffmpeg 会报缺少输出文件，附件实际已经提取
+            if not planned and "At least one output file must be specified" in str(e):
+                return {}, True
+            self.log(f"⚠️ 单次解复用失败，改为逐轨道提取: {e}")
+            for idx, outpath in planned.items():
+                self._discard_demuxed_output(outpath)
+            if attachment_dir:
+                for f in os.listdir(attachment_dir):
+                    self._discard_demuxed_output(os.path.join(attachment_dir, f))
+            return {}, False
+
+        demuxed = {}
+        for idx, outpath in planned.items():
+            if os.path.exists(outpath) and os.path.getsize(outpath) > 0:
+                demuxed[idx] = outpath
+            else:
+                self._discard_demuxed_output(outpath)
+        return demuxed, bool(attachment_dir)
 
-            if subfmt == "原格式":
-                detected_formats = list({s.get("codec_name", "").lower() for s in subtitle_streams})
-                self.log(f"检测到字幕格式: {detected_formats}")
-
-            global_mapping = {}
-            font_mode = self.font_mode_var.get() if hasattr(self, 'font_mode_var') else "子集合并"
-            temp_font_dir = None
-
-            has_ass_ssa = any(s.get("codec_name", "").lower() in ("ass", "ssa") for s in subtitle_streams)
-
-            # 提前处理字体提取逻辑
-            if (font_mode == "封装字体" and subfmt in ("ass", "ssa")) or subfmt == "sup" or (
-                    subfmt == "原格式" and font_mode == "封装字体" and has_ass_ssa):
-                try:
-                    temp_font_dir = self.extract_all_fonts_to_tempdir(fullpath)
-                    self.log(f"临时字体目录已创建: {temp_font_dir}")
-                except Exception as e:
-                    self.log(f"提取临时字体失败: {e}")
-                    temp_font_dir = None
-                    had_error = True
-            elif font_mode == "封装字体":
-                self.log(f"跳过封装字体：输出格式为 {subfmt}，仅在 ass/ssa 时封装字体。")
-
-            try:
-                for stream in subtitle_streams:
-                    try:
-                        codec_name = stream.get("codec_name", "").lower()
-                        mapped = self.codec_to_subfmt.get(codec_name, codec_name)  # 映射（若无则退回 codec_name）
-                        # print(mapped)
-                        # 如果用户指定 "原格式"，就用映射后的值；否则沿用外部传进来的 subfmt
-                        cur_subfmt = mapped if subfmt == "原格式" else subfmt
-
-                        outpath, mapping = self.extract_single_subtitle(
-                            fullpath=fullpath,
-                            filename=filename,
-                            stream=stream,
-                            subfmt=cur_subfmt,
-                            outdir=outdir,
-                            font_mode=font_mode,
-                            temp_font_dir=temp_font_dir,
-                            width=width,
-                            height=height,
-                            fps=fps
-                        )
-                        if outpath:
-                            generated_subs_for_video.append(outpath)
-                        else:
-                            had_error = True
-                        global_mapping.update(mapping)
-                    except Exception as e:
-                        # 可以记录这个流的错误，但继续处理其他流
-                        self.log(f"字幕流 {stream} 处理失败: {e}")
-                        had_error = True
+    @traced("extract_native")
+    def extract_subtitles_native(self, fullpath, filename, stream_jobs, outdir):
+        """
+        原生 Matroska 引擎：不启动 ffmpeg，直接从 MKV 一次读取导出可原样 copy 的 ASS/SSA/SRT 轨道。
+        :param stream_jobs: [(stream, 目标格式), ...]
+        :return: {轨道 index: 已导出的文件路径}；无法处理的轨道不在结果中，由 ffmpeg 回退
+        """
+        def family(codec):
+            return "ass" if codec in ("ass", "ssa") else codec
+
+        candidates = []
+        for stream, subfmt in stream_jobs:
+            codec_name = stream.get('codec_name', '').lower()
+            if codec_name in MatroskaReader.TEXT_CODECS.values() and self.codec_to_subfmt.get(codec_name) == subfmt:
+                candidates.append((stream, subfmt))
+        record = self.files.get(fullpath)
+        if not candidates or record is None or not record.probe:
+            return {}
+
+        paths = {}
+        try:
+            with MatroskaReader(fullpath) as mkv:
+                # 轨道与探测结果逐一核对，对不上时按流序号导出可能取错轨道，整体交给 ffmpeg
+                tracks = mkv.probe_tracks(record.probe.streams)
+                if tracks is None:
+                    self.log(f"⚠️ MKV 轨道与探测结果不一致，改用 ffmpeg: {filename}")
+                    return {}
+                outputs = {}
+                for stream, subfmt in candidates:
+                    track = tracks.get(stream['index'])
+                    if not track or family(MatroskaReader.TEXT_CODECS.get(track["codec_id"])) != \
+                            family(stream.get('codec_name', '').lower()):
                         continue
-            finally:
-                # 无论如何，所有流处理完后都会删除缓存
-                if subfmt == "sup" and temp_font_dir:
-                    shutil.rmtree(temp_font_dir)
-
-            if subfmt == "sup":
-                # --- 根据执行情况染色 ---
-                if item_id:
-                    if had_error and not generated_subs_for_video:
-                        self.tree.item(item_id, tags=("fail",))
-                    elif had_error and generated_subs_for_video:
-                        self.tree.item(item_id, tags=("partial",))
-                    else:
-                        self.tree.item(item_id, tags=("success",))
-                continue  # sup字幕不需要后续处理
-
-            # 处理子集字体还原逻辑
-            if (font_mode == "子集合并" and subfmt in ("ass", "ssa")) or (
-                    font_mode == "子集合并" and subfmt == "原格式" and has_ass_ssa):
-                fonts_root = os.path.join(outdir or temp_outdir, "Fonts")
-                os.makedirs(fonts_root, exist_ok=True)
-                video_fonts_dir = os.path.join(fonts_root, f"{seq_num}_{os.path.splitext(filename)[0]}")
-                if os.path.exists(video_fonts_dir):
-                    shutil.rmtree(video_fonts_dir)
-                os.makedirs(video_fonts_dir, exist_ok=True)
-                try:
-                    self.extract_fonts_from_video(fullpath, fonts_root, global_mapping, seq_num)
-                    need_merge_fonts = True
-                except Exception as e:
-                    self.log(f"删除字体失败: {e}")
-                    had_error = True
-
-            # 封装字体逻辑
-            if (font_mode == "封装字体" and temp_font_dir and subfmt in ("ass", "ssa")) or (
-                    subfmt == "原格式" and has_ass_ssa):
-                try:
-                    for subfile in generated_subs_for_video:
-                        if os.path.splitext(subfile)[1].lower() in ('.ass', '.ssa'):
-                            try:
-                                self.embed_fonts_to_ass(subfile, temp_font_dir)
-                                self.log(f"字体已封装到: {os.path.basename(subfile)}")
-                            except Exception as e:
-                                self.log(f"封装字体失败: {subfile} 错误: {e}")
-                                had_error = True
-                finally:
-                    try:
-                        shutil.rmtree(temp_font_dir)
-                        self.log(f"临时字体目录已删除: {temp_font_dir}")
-                    except Exception as e:
-                        self.log(f"删除临时字体目录失败: {e}")
-                        had_error = True
-
-            # --- 根据执行情况染色 ---
-            if item_id:
-                if had_error and not generated_subs_for_video:
-                    self.tree.item(item_id, tags=("fail",))
-                elif had_error and generated_subs_for_video:
-                    self.tree.item(item_id, tags=("partial",))
-                else:
-                    self.tree.item(item_id, tags=("success",))
-
-        # 全局字体合并
-        if (self.font_mode_var.get() == "子集合并" and subfmt != "sup") or (
-                self.font_mode_var.get() == "子集合并" and subfmt == "原格式" and need_merge_fonts):
-            fonts_root = os.path.join(outdir or temp_outdir, "Fonts")
-            if os.path.exists(fonts_root):
-                self.merge_fonts(fonts_root)
-                self.log("📚 所有视频字体已合并到 Fonts 根目录")
-
-        # ✅ 若使用了临时目录，则进行导出提示
-        if used_temp_dir:
-            fonts_root = os.path.join(temp_outdir, "Fonts")
-            if os.path.exists(fonts_root):
-                export_fonts = messagebox.askyesno("导出字体", "是否导出提取的字体？")
-                if export_fonts:
-                    export_dir = filedialog.askdirectory(title="选择导出字体的目标目录")
-                    if export_dir:
-                        try:
-                            # 如果目录不存在，则回退到上级存在的目录
-                            temp_dir = export_dir
-                            while not os.path.exists(temp_dir):
-                                temp_dir = os.path.dirname(temp_dir)
-                            export_dir = temp_dir
-                            # 🟢 在导出目录中创建 Fonts 文件夹
-                            export_fonts_dir = os.path.join(export_dir, "Fonts")
-                            os.makedirs(export_fonts_dir, exist_ok=True)
-
-                            for item in os.listdir(fonts_root):
-                                src = os.path.join(fonts_root, item)
-                                dst = os.path.join(export_fonts_dir, item)
-                                if os.path.isdir(src):
-                                    shutil.copytree(src, dst, dirs_exist_ok=True)
-                                else:
-                                    shutil.copy2(src, dst)
-                            self.log(f"字体已导出到: {export_fonts_dir}")
-                        except Exception as e:
-                            self.log(f"导出字体失败: {e}")
-                # 删除临时目录
-                try:
-                    shutil.rmtree(temp_outdir)
-                    self.log(f"临时输出目录已删除: {temp_outdir}")
-                except Exception as e:
-                    self.log(f"删除临时输出目录失败: {e}")
+                    outpath = self._subtitle_outpath(fullpath, filename, stream, subfmt, outdir)
+                    outputs[track["number"]] = outpath
+                    paths[stream['index']] = outpath
+                if outputs:
+                    mkv.export_text_tracks(outputs)
+        except Exception as e:
+            self.log(f"⚠️ 原生 Matroska 读取失败，改用 ffmpeg: {e}")
+            return {}
+
+        if paths:
+            self.log(f"原生读取导出 {len(paths)} 个字幕轨道：{filename}")
+        return paths
+
+    def _discard_demuxed_output(self, outpath):
+        """删除单次解复用残留的输出（SUP 的临时 ASS 连同其临时目录一起删除）"""
+        parent = os.path.dirname(outpath)
+        if os.path.basename(parent).startswith("ass_temp_"):
+            shutil.rmtree(parent, ignore_errors=True)
+        elif os.path.exists(outpath):
+            try:
+                os.remove(outpath)
+            except Exception:
+                pass
 
-        self.log("✅ 所有文件字幕提取完成！")
-        messagebox.showinfo("完成", "所有字幕提取完成！")
-        self.restore_buttons_state()
-        self.set_treeview_clickable(True)
+    def _subtitle_outpath(self, fullpath, filename, stream, subfmt, outdir):
+        """字幕输出路径：<视频名>.<语言><轨道号>.<格式>，未指定目录时输出到视频所在目录"""
+        lang = stream.get('tags', {}).get('language', 'unknown')
+        outfilename = f"{os.path.splitext(filename)[0]}.{lang}{stream['index']}.{subfmt}"
+        # 绝对路径：合并读取时 ffmpeg 的工作目录是附件目录
+        return os.path.abspath(os.path.join(outdir or os.path.dirname(fullpath), outfilename))
 
+    @traced("extract_stream")
     def extract_single_subtitle(self, fullpath, filename, stream, subfmt, outdir,
-                                font_mode, temp_font_dir, width, height, fps):
-        """提取单个字幕轨道，逻辑统一化，SUP 仅在无法直接copy时特殊处理"""
+                                font_mode, temp_font_dir, width, height, fps, demuxed_path=None, engine=None):
+        """
+        提取单个字幕轨道，逻辑统一化，SUP 仅在无法直接copy时特殊处理
+        :param demuxed_path: 单次解复用已导出的文件，存在时跳过 ffmpeg 只做后处理
+        :param engine: 覆盖 self.subtitle_engine；为 "native" 时可 copy 的文本轨道先尝试原生 Matroska 读取
+        """
+        self._checkpoint()  # 暂停时不开始新的轨道
         idx = stream['index']
+        self._batch_thread.stream = idx
         tags = stream.get('tags', {})
         lang = tags.get('language', 'unknown')
         codec_name = stream.get('codec_name', '').lower()
 
-        outfilename = f"{os.path.splitext(filename)[0]}.{lang}{idx}.{subfmt}"
-        outpath = os.path.join(outdir, outfilename) if outdir else os.path.join(os.path.dirname(fullpath), outfilename)
+        outpath = self._subtitle_outpath(fullpath, filename, stream, subfmt, outdir)
+        outfilename = os.path.basename(outpath)
         self.log(f"提取轨道 {idx} ({lang}) → {outfilename}")
 
         original_fmt = self.codec_to_subfmt.get(codec_name)
         can_copy = (original_fmt == subfmt)
         ffmpeg_exe = self.get_ffmpeg_exe()
 
+        if not demuxed_path and can_copy and (engine or self.subtitle_engine) == "native" and \
+                MatroskaReader.is_matroska(fullpath):
+            demuxed_path = self.extract_subtitles_native(fullpath, filename, [(stream, subfmt)], outdir).get(idx)
+
         try:
-            if can_copy:
+            if demuxed_path and subfmt == "sup" and not can_copy:
+                outpath = self.handle_sup_conversion(fullpath, filename, stream, outdir, temp_font_dir, width, height,
+                                                     fps, ass_path=demuxed_path)
+                return outpath, {}
+            elif demuxed_path:
+                # ✅ 单次解复用/原生读取已完成导出
+                self.log(f"✅ 直接导出字幕: {outfilename}")
+            elif can_copy:
                 # ✅ 直接拷贝字幕轨
                 cmd = [
                     ffmpeg_exe,
@@ -749,11 +2782,10 @@ class SubtitleExtractorApp:
                     "-c:s", subfmt,
                     outpath
                 ]
-                # print(f"执行命令：{' '.join(cmd)}")
                 self.run_silently(cmd)
                 # print(original_fmt)
                 if original_fmt == "srt" and subfmt in ("ass", "ssa"):
-                    print("修改分辨率")
+                    logger.debug("修改分辨率")
                     # self.set_ass_resolution(outpath, width, height)
                 self.log(f"✅ 成功导出字幕文件: {outfilename}")
         except Exception as e:
@@ -779,11 +2811,11 @@ class SubtitleExtractorApp:
                 outpath = fallback_outpath  # 替换为备用导出路径
             except Exception as e2:
                 self.log(f"❌ 备用格式提取也失败: {e2}")
-                messagebox.showerror("提取失败", f"轨道 {idx} 文件 {outfilename} 与备用格式导出均失败。\n错误: {e2}")
+                self.report_error("提取失败", f"轨道 {idx} 文件 {outfilename} 与备用格式导出均失败。错误: {e2}")
                 return None, {}
 
         # 后处理逻辑（ASS字体修复、字体还原）
-        if self.ass_fix_var.get() and subfmt in ("ass", "ssa") and font_mode != "无":
+        if self.batch_ass_fix and subfmt in ("ass", "ssa") and font_mode != "无":
             self.fix_ass_header(outpath)
 
         if subfmt in ("ass", "ssa") and font_mode in ("子集合并", "字体名还原"):
@@ -796,36 +2828,39 @@ class SubtitleExtractorApp:
 
         return outpath, {}
 
-    def handle_sup_conversion(self, fullpath, filename, stream, outdir, temp_font_dir, width, height, fps):
-        """处理 SUP 特殊逻辑：生成临时 ASS，再转换为 SUP"""
-        ass_temp_dir = tempfile.mkdtemp(prefix="ass_temp_")
+    @traced("sup_conversion")
+    def handle_sup_conversion(self, fullpath, filename, stream, outdir, temp_font_dir, width, height, fps,
+                              ass_path=None):
+        """处理 SUP 特殊逻辑：生成临时 ASS，再转换为 SUP（ass_path 为单次解复用已生成的临时 ASS）"""
         outpath = None  # 用于返回生成的 SUP 路径
 
-        # 提取临时 ASS
-        ass_path, _ = self.extract_single_subtitle(
-            fullpath=fullpath,
-            filename=filename,
-            stream=stream,
-            subfmt="ass",
-            outdir=ass_temp_dir,
-            font_mode="无",
-            temp_font_dir=None,
-            width=width,
-            height=height,
-            fps=fps
-        )
+        if ass_path:
+            ass_temp_dir = os.path.dirname(ass_path)
+        else:
+            ass_temp_dir = self._make_temp_dir("ass_temp_")
+            # 提取临时 ASS
+            ass_path, _ = self.extract_single_subtitle(
+                fullpath=fullpath,
+                filename=filename,
+                stream=stream,
+                subfmt="ass",
+                outdir=ass_temp_dir,
+                font_mode="无",
+                temp_font_dir=None,
+                width=width,
+                height=height,
+                fps=fps
+            )
 
         if not ass_path or not os.path.exists(ass_path):
             self.log(f"❌ 无法生成临时 ASS，SUP 转换中止。")
+            # temp_font_dir 由同一视频的各轨道共用，其它轨道可能仍在使用，由 extract_video_subtitles 统一删除
             shutil.rmtree(ass_temp_dir, ignore_errors=True)
-            if temp_font_dir:
-                shutil.rmtree(temp_font_dir, ignore_errors=True)
             return None
 
         # 转为 SUP
-        lang = stream.get("tags", {}).get("language", "unknown")
-        outfilename = f"{os.path.splitext(filename)[0]}.{lang}{stream['index']}.sup"
-        outpath = os.path.join(outdir or os.path.dirname(fullpath), outfilename)
+        outpath = self._subtitle_outpath(fullpath, filename, stream, "sup", outdir)
+        outfilename = os.path.basename(outpath)
 
         try:
             success = self.generate_subtitles(
@@ -855,10 +2890,15 @@ class SubtitleExtractorApp:
 
     def prepare_environment(self, fonts_dir: str):
         """环境准备：注册缺失字体，返回临时注册的字体信息"""
+        if sys.platform != "win32":
+            self.log("⚠️ 非 Windows 系统无法临时注册字体，Spp2Pgs 只能使用系统已安装的字体。")
+            return []
+        import winreg
         fonts_dir = Path(fonts_dir)
 
         def get_font_name(font_path: Path) -> str:
             """读取字体内部名称"""
+            from fontTools.ttLib import TTFont
             try:
                 tt = TTFont(font_path)
                 name_records = tt["name"].names
@@ -921,33 +2961,41 @@ class SubtitleExtractorApp:
         user_font_dir.mkdir(parents=True, exist_ok=True)
         files = list(fonts_dir.glob("*.[ot]tf"))
         if not files:
-            print(f"字体目录为空：{fonts_dir}")
+            self.log(f"⚠️ 字体目录为空：{fonts_dir}")
             return []
 
-        installed_fonts = get_installed_fonts()
         registered = []
 
-        with winreg.OpenKey(winreg.HKEY_CURRENT_USER, reg_path, 0, winreg.KEY_SET_VALUE) as key:
+        with self._font_env_lock, \
+                winreg.OpenKey(winreg.HKEY_CURRENT_USER, reg_path, 0, winreg.KEY_SET_VALUE) as key:
+            installed_fonts = get_installed_fonts()
             for src in files:
                 font_name = get_font_name(src)
                 reg_name = f"{font_name} (TrueType)"
+                if reg_name in self._font_env_refs:
+                    # 其他并行任务已临时注册，只增加引用计数
+                    self._font_env_refs[reg_name][1] += 1
+                    registered.append((reg_name, self._font_env_refs[reg_name][0]))
+                    continue
                 if reg_name.lower() in installed_fonts:
-                    print(f"跳过已安装字体：{font_name}")
+                    logger.debug("跳过已安装字体：%s", font_name)
                     continue
                 dst = get_unique_filename(user_font_dir, src.name)
                 shutil.copy2(src, dst)
                 winreg.SetValueEx(key, reg_name, 0, winreg.REG_SZ, str(dst))
+                self._font_env_refs[reg_name] = [dst, 1]
                 registered.append((reg_name, dst))
-                print(f"注册字体：{font_name} → {dst.name}")
+                logger.debug("注册字体：%s → %s", font_name, dst.name)
 
         if registered:
             broadcast_font_change()
-            print(f"✅ 已临时注册 {len(registered)} 个字体。")
+            self.log(f"✅ 已临时注册 {len(registered)} 个字体。")
         else:
-            print("ℹ️ 所有字体均已安装，无需注册。")
+            self.log("ℹ️ 所有字体均已安装，无需注册。")
 
         return registered
 
+    @traced("spp2pgs")
     def generate_subtitles(self, ass_file: str, fonts_dir: str, out_sup: str, height: int = 1080, fps: float = 23.976):
         """字幕生成：注册字体、调用 Spp2Pgs"""
         ass_file = Path(ass_file)
@@ -955,10 +3003,10 @@ class SubtitleExtractorApp:
         out_sup = Path(out_sup)
 
         if not ass_file.exists():
-            print("❌ ASS 文件不存在：", ass_file)
+            self.log(f"❌ ASS 文件不存在：{ass_file}")
             return False
         if not fonts_dir.exists():
-            print("❌ 字体目录不存在：", fonts_dir)
+            self.log(f"❌ 字体目录不存在：{fonts_dir}")
             return False
 
         # 优先使用本地路径，其次 PATH 环境变量
@@ -967,35 +3015,38 @@ class SubtitleExtractorApp:
         # exe_path = str(self.spp2pgs_exe if self.spp2pgs_exe.exists() else shutil.which("Spp2Pgs") or shutil.which("Spp2Pgs.exe"))
 
         if not exe_path or not Path(exe_path).exists():
-            print("❌ 未找到 Spp2Pgs 可执行文件。")
+            self.log("❌ 未找到 Spp2Pgs 可执行文件。")
             # messagebox.showerror("错误", "未找到 Spp2Pgs 可执行文件。")
             return False
 
-        print("使用 Spp2Pgs 可执行：", exe_path)
+        logger.debug("使用 Spp2Pgs 可执行：%s", exe_path)
 
         registered_fonts = self.prepare_environment(fonts_dir)
 
         try:
             cmd = [exe_path, "-i", str(ass_file), "-s", str(height), "-r", str(fps), str(out_sup)]
             # print("执行命令：", " ".join(cmd))
-            # 打包后调试去掉 CREATE_NO_WINDOW
-            p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
-                               creationflags=subprocess.CREATE_NO_WINDOW)
-            print(p.stdout)
-            if "Encoding successfully completed." in p.stdout:
-                print("✅ Spp2Pgs 生成 SUP 成功：", out_sup)
+            # 输出逐行记入调试日志，不等进程结束；未启用调试级别时不回调
+            on_stdout = (lambda line: logger.debug("Spp2Pgs: %s", line)) if logger.isEnabledFor(logging.DEBUG) else None
+            p = self._run_process("spp2pgs", cmd, merge_stderr=True, on_stdout=on_stdout)
+            stdout = p.stdout.decode(locale.getpreferredencoding(False), errors="ignore")
+            if "Encoding successfully completed." in stdout:
+                self.log(f"✅ Spp2Pgs 生成 SUP 成功：{out_sup}")
                 return True
             else:
-                print("⚠️ Spp2Pgs 处理失败，请检查输出。")
+                self.log(f"⚠️ Spp2Pgs 处理失败，请检查输出：\n{stdout.strip()[-2000:]}")
                 return False
         except Exception as e:
-            print("💥 执行 Spp2Pgs 时发生异常：", e)
+            self.log(f"💥 执行 Spp2Pgs 时发生异常：{e}")
             return False
         finally:
             self.cleanup_environment(registered_fonts)
 
     def cleanup_environment(self, registered_fonts):
         """清理环境：卸载临时注册字体"""
+        if not registered_fonts:
+            return
+        import winreg
 
         def broadcast_font_change():
             HWND_BROADCAST = 0xFFFF
@@ -1006,8 +3057,16 @@ class SubtitleExtractorApp:
         reg_path = r"Software\Microsoft\Windows NT\CurrentVersion\Fonts"
         count = 0
         try:
-            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, reg_path, 0, winreg.KEY_ALL_ACCESS) as key:
+            with self._font_env_lock, \
+                    winreg.OpenKey(winreg.HKEY_CURRENT_USER, reg_path, 0, winreg.KEY_ALL_ACCESS) as key:
                 for reg_name, dst in registered_fonts:
+                    # 仍有其他并行任务在使用时只减少引用计数
+                    ref = self._font_env_refs.get(reg_name)
+                    if ref:
+                        ref[1] -= 1
+                        if ref[1] > 0:
+                            continue
+                        del self._font_env_refs[reg_name]
                     try:
                         winreg.DeleteValue(key, reg_name)
                     except FileNotFoundError:
@@ -1020,10 +3079,11 @@ class SubtitleExtractorApp:
                     count += 1
             if count:
                 broadcast_font_change()
-                print(f"🧹 已卸载 {count} 个临时字体。")
+                self.log(f"🧹 已卸载 {count} 个临时字体。")
         except Exception as e:
-            print(f"卸载字体时出错：{e}")
+            self.log(f"⚠️ 卸载字体时出错：{e}")
 
+    @traced("fix_ass_header")
     def fix_ass_header(self, filepath):
         """
         修正 ASS/SSA 字幕的 [Script Info] 头部：
@@ -1106,7 +3166,7 @@ class SubtitleExtractorApp:
         - 保留注释和其他字段顺序
         - 不影响其他区块
         """
-        print(f"width:{width}, height:{height}")
+        logger.debug("设置分辨率：%s, width:%s, height:%s", filepath, width, height)
         try:
             with open(filepath, "rb") as f:
                 content = f.read()
@@ -1177,31 +3237,45 @@ class SubtitleExtractorApp:
             self.log(f"修改分辨率失败: {e}")
 
     # ----------------- 新增：extract_all_fonts_to_tempdir（含字体重命名） -----------------
-    def extract_all_fonts_to_tempdir(self, video_path):
-        temp_dir = tempfile.mkdtemp(prefix="sub_fonts_")
+    @traced("dump_attachments")
+    def extract_all_fonts_to_tempdir(self, video_path, temp_dir=None, dumped=False):
+        """
+        提取视频字体到临时目录并只保留 .ttf/.otf
+        :param temp_dir: 目标临时目录，为 None 时新建
+        :param dumped: 附件已由合并读取导出到 temp_dir 时为 True，跳过 ffmpeg
+        """
+        if temp_dir is None:
+            temp_dir = self._make_temp_dir("sub_fonts_")
 
-        ffmpeg_exe = self.get_ffmpeg_exe()
-        old_cwd = os.getcwd()
-        try:
-            os.chdir(temp_dir)
+        # MKV：原生读取 Attachments，只把字体附件从 mmap 写出
+        if not dumped and self.subtitle_engine == "native" and MatroskaReader.is_matroska(video_path):
+            try:
+                with MatroskaReader(video_path) as mkv:
+                    for entry in mkv.font_attachments():
+                        mkv.write_attachment(entry, os.path.join(temp_dir, os.path.basename(entry["name"])))
+                dumped = True
+            except Exception as e:
+                self.log(f"⚠️ 原生读取附件失败，改用 ffmpeg: {e}")
 
-            # ✅ 构建 ffmpeg 命令
-            cmd = [
-                ffmpeg_exe,
-                "-dump_attachment:t", "",  # 提取所有附件
-                "-i", video_path
-            ]
+        if not dumped:
+            ffmpeg_exe = self.get_ffmpeg_exe()
+            try:
+                # ✅ 构建 ffmpeg 命令
+                cmd = [
+                    ffmpeg_exe,
+                    "-dump_attachment:t", "",  # 提取所有附件
+                    "-i", video_path
+                ]
 
-            # self.log(f"📦 提取字体附件: {os.path.basename(video_path)} → {temp_dir}")
-            result = self.run_silently(cmd)
-            # self.log("✅ 字体提取完成")
+                # self.log(f"📦 提取字体附件: {os.path.basename(video_path)} → {temp_dir}")
+                # dump_attachment 保存到子进程工作目录（不切换本进程目录，避免并行任务互相干扰）
+                result = self.run_silently(cmd, cwd=temp_dir)
+                # self.log("✅ 字体提取完成")
 
-        except RuntimeError as e:
-            # 如果报错信息里包含“At least one output file must be specified”，忽略
-            if "At least one output file must be specified" in str(e):
-                self.log("⚠️ 忽略 ffmpeg 报错：附件已经提取")
-        finally:
-            os.chdir(old_cwd)
+            except RuntimeError as e:
+                # 如果报错信息里包含“At least one output file must be specified”，忽略
+                if "At least one output file must be specified" in str(e):
+                    self.log("⚠️ 忽略 ffmpeg 报错：附件已经提取")
 
         # 保留 .ttf/.otf 并重命名
         for f in os.listdir(temp_dir):
@@ -1223,6 +3297,7 @@ class SubtitleExtractorApp:
         return temp_dir
 
     # ----------------- 新增：embed_fonts_to_ass -----------------
+    @traced("embed_fonts_to_ass")
     def embed_fonts_to_ass(self, ass_path, font_dir):
 
         if not os.path.exists(ass_path):
@@ -1279,6 +3354,7 @@ class SubtitleExtractorApp:
 
         return
 
+    @traced("restore_ass_fonts")
     def restore_ass_fonts(self, filepath):
         """
         批量将ASS文件中子集化字体名还原为原字体名：
@@ -1336,17 +3412,24 @@ class SubtitleExtractorApp:
 
     def normalize_to_ascii(self, name: str) -> str:
         """生成符合 PostScript 名称的 ASCII 字符串"""
+        from pypinyin import lazy_pinyin
         name = ''.join(lazy_pinyin(name))  # 中文转拼音
         name = name.replace(' ', '_')
         name = re.sub(r'[^A-Za-z0-9_\-]', '', name)
         return name
 
-    def replace_font_name_complete(self, font_path, old_name, new_name, output_path=None):
-        if not os.path.exists(font_path):
+    @traced("replace_font_name_complete")
+    def replace_font_name_complete(self, font_path, old_name, new_name, output_path=None, font_data=None):
+        """
+        替换字体 name 表中的名称
+        :param font_data: 字体二进制（如 MKV 附件的内存切片），给出时直接在内存中交给 fontTools，不读取 font_path
+        """
+        if font_data is None and not os.path.exists(font_path):
             return ""
 
+        from fontTools.ttLib import TTFont
         try:
-            font = TTFont(font_path)
+            font = TTFont(io.BytesIO(font_data)) if font_data is not None else TTFont(font_path)
             name_table = font['name']
 
             ascii_name = self.normalize_to_ascii(new_name)
@@ -1426,16 +3509,18 @@ class SubtitleExtractorApp:
             return output_path
 
         except Exception as e:
-            print("替换失败:", e)
+            self.log(f"❌ 字体名替换失败: {e}")
             return ""
 
-    def extract_fonts_from_video(self, video_path, workdir, mapping, seq_num):
+    @traced("extract_fonts_from_video")
+    def extract_fonts_from_video(self, video_path, workdir, mapping, seq_num, dumped=False):
         """
         使用 ffmpeg.exe 提取视频附件到工作目录，并重命名字体文件
         :param video_path: 视频路径
         :param workdir: 工作目录 Fonts/
         :param mapping: 子集名->原名映射
         :param seq_num: 当前视频序号
+        :param dumped: 附件已由合并读取导出到视频字体目录时为 True，跳过 ffmpeg
         :return: 视频字体目录路径
         """
 
@@ -1444,28 +3529,36 @@ class SubtitleExtractorApp:
         os.makedirs(video_dir, exist_ok=True)
 
         # === 1️⃣ 提取附件 ===
-        ffmpeg_exe = self.get_ffmpeg_exe()
-        # 切换到输出目录（因为 dump_attachment 会保存到当前工作目录）
-        old_cwd = os.getcwd()
-        os.chdir(video_dir)
+        # MKV：原生读取字体附件，匹配到映射的字体直接在内存中改名后保存，不再先写出再重命名
+        if not dumped and self.subtitle_engine == "native" and MatroskaReader.is_matroska(video_path):
+            try:
+                renamed_count = self._export_fonts_native(video_path, video_dir, mapping)
+                self.log(f"🔤 字体重命名完成：共 {renamed_count} 个字体文件")
+                return video_dir
+            except Exception as e:
+                self.log(f"⚠️ 原生读取附件失败，改用 ffmpeg: {e}")
+                for f in os.listdir(video_dir):
+                    self._discard_demuxed_output(os.path.join(video_dir, f))
 
-        cmd = [
-            ffmpeg_exe,
-            "-dump_attachment:t", "",  # 提取所有附件
-            "-i", video_path
-        ]
+        if not dumped:
+            ffmpeg_exe = self.get_ffmpeg_exe()
 
-        self.log(f"📦 提取附件：{video_name} -> {video_dir}")
-        try:
-            result = self.run_silently(cmd)
-        except Exception as e:
-            # 如果报错信息里包含“At least one output file must be specified”，忽略
-            if "At least one output file must be specified" in str(e):
-                self.log("⚠️ 忽略 ffmpeg 报错：附件已经提取")
-            else:
-                self.log(f"❌ 附件提取失败：{video_name} 错误: {e}")
-        finally:
-            os.chdir(old_cwd)
+            cmd = [
+                ffmpeg_exe,
+                "-dump_attachment:t", "",  # 提取所有附件
+                "-i", video_path
+            ]
+
+            self.log(f"📦 提取附件：{video_name} -> {video_dir}")
+            try:
+                # dump_attachment 会保存到工作目录：只设置子进程的 cwd，不切换本进程目录
+                result = self.run_silently(cmd, cwd=video_dir)
+            except Exception as e:
+                # 如果报错信息里包含“At least one output file must be specified”，忽略
+                if "At least one output file must be specified" in str(e):
+                    self.log("⚠️ 忽略 ffmpeg 报错：附件已经提取")
+                else:
+                    self.log(f"❌ 附件提取失败：{video_name} 错误: {e}")
 
         # === 2️⃣ 重命名字体 ===
         renamed_count = 0
@@ -1475,53 +3568,72 @@ class SubtitleExtractorApp:
             if ext.lower() not in [".ttf", ".otf"]:
                 continue
 
-            # 拆分文件名为多段（以 . 分隔）
-            name_parts = fname.split(".")
-            matched = False
-
-            # 1️⃣ 先逐段匹配 mapping 的 key
-            for part in name_parts:
-                upper_part = part.upper()
-                for sub, real in mapping.items():
-                    if sub.upper() in upper_part:
-                        new_file_path = os.path.join(video_dir, f"{real}{ext}")
-                        os.rename(file_path, new_file_path)
-
-                        normalized_path = new_file_path.replace("\\", "/")
-                        self.replace_font_name_complete(normalized_path, part, real, output_path=normalized_path)
-
-                        renamed_count += 1
-                        matched = True
-                        break
-                if matched:
-                    break
-
-            # 2️⃣ 如果没有任何部分匹配上，再尝试使用全名模糊匹配 mapping 的 key
-            if not matched:
-                upper_fullname = fname.upper()
-                for sub, real in mapping.items():
-                    if sub.upper() in upper_fullname:
-                        new_file_path = os.path.join(video_dir, f"{real}{ext}")
-                        os.rename(file_path, new_file_path)
-
-                        normalized_path = new_file_path.replace("\\", "/")
-                        self.replace_font_name_complete(normalized_path, fname, real, output_path=normalized_path)
+            match = self._match_font_mapping(fname, mapping)
+            if match:
+                old_name, real = match
+                new_file_path = os.path.join(video_dir, f"{real}{ext}")
+                os.rename(file_path, new_file_path)
 
-                        renamed_count += 1
-                        matched = True
-                        break
+                # 内部字体名替换：确保路径用原始字符串或用 / 分隔
+                normalized_path = new_file_path.replace("\\", "/")
+                self.replace_font_name_complete(normalized_path, old_name, real, output_path=normalized_path)
 
-            # 如果仍然没有匹配上，就保留原文件名，不重命名
-            if not matched:
+                renamed_count += 1
+            else:
+                # 如果没有匹配上，就保留原文件名，不重命名
                 self.log(f"⚠️ 未匹配到映射：{file}")
 
         self.log(f"🔤 字体重命名完成：共 {renamed_count} 个字体文件")
         return video_dir
 
+    def _match_font_mapping(self, fname, mapping):
+        """
+        按文件名匹配子集名映射（有的字体是 8A905FBC.XCJVKWC5.ttf）
+        :return: (文件名中被匹配的部分, 原字体名)，未匹配返回 None
+        """
+        # 1️⃣ 先逐段匹配 mapping 的 key
+        for part in fname.split("."):
+            upper_part = part.upper()
+            for sub, real in mapping.items():
+                if sub.upper() in upper_part:
+                    return part, real
+
+        # 2️⃣ 如果没有任何部分匹配上，再尝试使用全名模糊匹配 mapping 的 key
+        upper_fullname = fname.upper()
+        for sub, real in mapping.items():
+            if sub.upper() in upper_fullname:
+                return fname, real
+        return None
+
+    def _export_fonts_native(self, video_path, video_dir, mapping):
+        """原生读取 MKV 字体附件到视频字体目录，返回按映射改名的字体数量"""
+        renamed_count = 0
+        with MatroskaReader(video_path) as mkv:
+            for entry in mkv.font_attachments():
+                file = os.path.basename(entry["name"])
+                fname, ext = os.path.splitext(file)
+                match = self._match_font_mapping(fname, mapping)
+                if not match:
+                    mkv.write_attachment(entry, os.path.join(video_dir, file))
+                    self.log(f"⚠️ 未匹配到映射：{file}")
+                    continue
+
+                old_name, real = match
+                normalized_path = os.path.join(video_dir, f"{real}{ext}").replace("\\", "/")
+                with mkv.attachment_data(entry) as data:
+                    saved = self.replace_font_name_complete(normalized_path, old_name, real,
+                                                            output_path=normalized_path, font_data=data)
+                if not saved:
+                    # 改名失败时与 ffmpeg 流程一致，保留改名后的原始字体
+                    mkv.write_attachment(entry, normalized_path)
+                renamed_count += 1
+        return renamed_count
+
     def fix_name_table_with_records(self, font_path, name_records):
         """
         使用已记录的 name 表信息修复字体
         """
+        from fontTools.ttLib import TTFont
         font = TTFont(font_path)
         name_table = font['name']
 
@@ -1562,14 +3674,10 @@ class SubtitleExtractorApp:
             return cwd_ff_path
 
         # 优先级3：系统PATH
-        try:
-            result = subprocess.run(['where', 'fontforge'], capture_output=True, text=True)
-            if result.returncode == 0:
-                ff_path = result.stdout.strip().split('\n')[0]
-                self.log(f"✅ 使用系统PATH中的FontForge: {ff_path}")
-                return ff_path
-        except:
-            pass
+        ff_path = shutil.which("fontforge")
+        if ff_path:
+            self.log(f"✅ 使用系统PATH中的FontForge: {ff_path}")
+            return ff_path
 
         # 优先级4：常见安装路径
         common_paths = [
@@ -1586,6 +3694,7 @@ class SubtitleExtractorApp:
         self.log("❌ 未找到FontForge可执行文件")
         return None
 
+    @traced("fontforge_script")
     def _run_fontforge_script(self, script_path):
         ff_path = self._find_fontforge_executable()
         if not ff_path:
@@ -1594,15 +3703,15 @@ class SubtitleExtractorApp:
 
         try:
             self.log(f"🔄 执行FontForge脚本: {os.path.basename(script_path)}")
-            result = subprocess.run([
+            result = self._run_process("fontforge", [
                 ff_path, '-lang=py', '-script', script_path
-            ], capture_output=True, text=True, timeout=600, encoding='utf-8', creationflags=subprocess.CREATE_NO_WINDOW)
+            ], timeout=600)
 
-            stdout = result.stdout.strip()
-            stderr = result.stderr.strip()
+            stdout = result.stdout.decode('utf-8', errors='ignore').strip()
+            stderr = result.stderr.decode('utf-8', errors='ignore').strip()
 
             if stdout:
-                self.log(f"📄 FontForge输出:\n{stdout}")
+                logger.debug("📄 FontForge输出:\n%s", stdout)
             if stderr:
                 self.log(f"⚠️ FontForge警告/错误:\n{stderr}")
 
@@ -1624,6 +3733,7 @@ class SubtitleExtractorApp:
             except:
                 pass
 
+    @traced("merge_fonts")
     def merge_fonts(self, workdir):
         """
         将 Fonts 子文件夹下的所有视频文件夹内的 TTF/OTF 字体合并到 Fonts 根目录。
@@ -1707,140 +3817,838 @@ class SubtitleExtractorApp:
             except Exception as e:
                 self.log(f"❌ 字体处理失败: {base_name} 错误: {e}")
 
-        # --- 清空总表格 ---
-        self.font_name_registry.clear()
-        self.log("🧹 已清空 font_name_registry")
-        self.log(f"🎨 字体处理完成: {success_count}/{total_count} 个字体组处理成功")
+        # --- 清空总表格 ---
+        self.font_name_registry.clear()
+        self.log("🧹 已清空 font_name_registry")
+        self.log(f"🎨 字体处理完成: {success_count}/{total_count} 个字体组处理成功")
+
+    def _create_fontforge_merge_script(self, font_files, output_path):
+        """
+        创建FontForge合并脚本（修正版）
+        使用 importOutlines() 安全复制字形，避免 'glyph' 无 copy 方法错误
+        """
+        # 构建输入文件列表
+        input_files_str = "[\n        " + ",\n        ".join([f'r"{f}"' for f in font_files]) + "\n    ]"
+
+        # 脚本内容
+        script_content = f'''# -*- coding: utf-8 -*-
+import fontforge
+import os
+import sys
+import tempfile
+import traceback
+
+def main():
+    merged_font = fontforge.font()
+    merged_font.encoding = 'UnicodeFull'
+    total_glyphs = 0
+
+    input_files = {input_files_str}
+    output_file = r"{output_path}"
+
+    print("=== 字体合并开始 ===")
+    print(f"输入文件: {{input_files}}")
+    print(f"输出文件: {{output_file}}")
+
+    for i, font_path in enumerate(input_files):
+        print(f"\\n--- 处理第 {{i+1}}/{{len(input_files)}} 个字体 ---")
+        print(f"字体路径: {{font_path}}")
+
+        if not os.path.exists(font_path):
+            print(f"❌ 文件不存在: {{font_path}}")
+            continue
+
+        try:
+            font = fontforge.open(font_path)
+            all_glyphs = list(font.glyphs())
+            print(f"✅ 打开字体成功: {{font.fontname}}")
+            print(f"字体 {{font.fontname}} 共包含 {{len(all_glyphs)}} 个字形")
+
+            if i == 0:
+                try:
+                    merged_font.fontname = font.fontname
+                    merged_font.familyname = font.familyname
+                    merged_font.fullname = font.fullname
+                    print(f"设置字体元信息: {{font.fontname}} / {{font.familyname}}")
+                except Exception as e:
+                    print(f"⚠️ 设置字体元信息失败: {{e}}")
+
+            glyph_count = 0
+            for glyph in all_glyphs:
+                name = glyph.glyphname
+                if not glyph.isWorthOutputting() or name in merged_font:
+                    continue
+                try:
+                    new_glyph = merged_font.createChar(glyph.encoding, name)
+                    tmp_svg = tempfile.NamedTemporaryFile(delete=False, suffix=".svg")
+                    tmp_svg.close()
+                    glyph.export(tmp_svg.name)
+                    new_glyph.importOutlines(tmp_svg.name)
+                    new_glyph.width = glyph.width
+                    os.unlink(tmp_svg.name)
+                    glyph_count += 1
+                    total_glyphs += 1
+                except Exception as e:
+                    print(f"⚠️ 复制字形失败: {{name}} -> {{e}}")
+
+            print(f"✅ 完成字体 {{font.fontname}}，成功复制 {{glyph_count}} 个字形")
+            font.close()
+
+        except Exception as e:
+            print(f"⚠️ 打开或处理字体失败: {{font_path}} -> {{e}}")
+            traceback.print_exc()
+
+    print(f"\\n=== 合并完成，共合并 {{total_glyphs}} 个字形 ===")
+
+    if total_glyphs == 0:
+        print("❌ 没有成功合并任何字形")
+        return False
+
+    # 🔧 修正字体元信息
+    if not merged_font.fontname:
+        merged_font.fontname = os.path.splitext(os.path.basename(output_file))[0].replace(" ", "_")
+
+    if not merged_font.familyname:
+        try:
+            first_font = fontforge.open(input_files[0])
+            merged_font.familyname = first_font.familyname or merged_font.fontname
+            merged_font.fullname = first_font.fullname or merged_font.fontname
+            first_font.close()
+        except Exception:
+            merged_font.familyname = merged_font.fontname
+            merged_font.fullname = merged_font.fontname
+
+    merged_font.sfnt_names = (
+        ("English (US)", "Family", merged_font.familyname),
+        ("English (US)", "Fullname", merged_font.fullname),
+        ("English (US)", "PostScriptName", merged_font.fontname),
+    )
+
+    try:
+        print("💾 保存合并后的字体...")
+        ext = os.path.splitext(output_file.lower())[1]
+        if ext == '.otf':
+            merged_font.generate(output_file, flags=('opentype',))
+        else:  # .ttf 或其他
+            merged_font.generate(output_file)  # 不加 flags
+        merged_font.close()
+        print(f"✅ 字体保存成功: {{output_file}}")
+        return True
+    except Exception as e:
+        print(f"❌ 字体保存失败: {{e}}")
+        traceback.print_exc()
+        return False
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
+'''
+
+        # 创建临时脚本文件
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
+            f.write(script_content)
+            return f.name
+
+    def log(self, msg, level=None):
+        """记录一条日志；未指定级别时按前缀推断（见 log_level_of）"""
+        msg = str(msg)
+        logger.log(log_level_of(msg) if level is None else level, msg)
+
+
+class SubtitleExtractorApp(SubtitleEngine):
+    def __init__(self, root):
+        # 日志不输出到控制台：界面日志面板读取环形缓冲，文件由后台线程写入；级别用 SUBEXP_LOG_LEVEL 调整
+        log_file = os.environ.get("SUBEXP_LOG_FILE") or os.path.join(
+            _cache_dir(Path(__file__).parent), "logs", "subtitle_exporter.log")
+        self.log_ring = configure_logging(os.environ.get("SUBEXP_LOG_LEVEL", "INFO"), log_file, console=False)
+        self._log_seq = 0  # 日志面板已显示到的序号
+        self.log_pane_lines = 1000  # 日志面板最多保留的行数
+
+        super().__init__()
+        self.root = root
+        self.root.title("批量字幕提取工具")
+        # 获取 DPI 缩放比例
+        self.scale = get_monitor_dpi(self.root.winfo_id())
+
+        # 动态设置窗口大小
+        base_width, base_height = 600, 520
+        self.root.geometry(f"{int(base_width * self.scale)}x{int(base_height * self.scale)}")
+        self.root.minsize(width=int(550 * self.scale), height=int(200 * self.scale))
+        self.files.subscribe(self._on_files_changed)  # Treeview 按变更事件增量更新
+        self.original_files = []  # 用来存储原始文件名，便于还原
+        self.renamed_files = []  # 用来保存重命名后的文件与原始文件的映射
+
+        self._probing_paths = set()  # 正在探测的文件（导入线程添加，主线程移除），读写都持有 _probing_lock
+        self._probing_lock = threading.Lock()
+        self._closing = threading.Event()  # 窗口已关闭：导入线程不再开始新的探测
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # 文件数超过该值时切换为虚拟列表：Treeview 只保留可见的行，滚动时从文件列表重新取数据
+        self.virtual_list_threshold = 2000
+        self._virtual = False
+        self._virtual_offset = 0  # 可见区域第一行在文件列表中的序号
+        self._virtual_rows = 20  # 可见行数，随 Treeview 高度更新
+        self._virtual_selection = set()  # 虚拟列表模式下的选中行（全路径），不依赖 Treeview 的行
+        self._virtual_render_pending = False
+
+        # 界面更新队列：工作线程不直接调用 Tk，主线程每 ui_drain_interval 毫秒统一处理一次
+        self.ui_drain_interval = 50
+        self._ui_queue = queue.SimpleQueue()  # 待在主线程执行的 (函数, 参数)
+
+        self.create_widgets()
+        self.root.after(self.ui_drain_interval, self._drain_ui_queue)
+
+    def create_widgets(self):
+        style = ttk.Style()
+        # 按钮、控件大小缩放
+        self.padx = int(10 * self.scale)
+        self.pady = int(10 * self.scale)
+        self.ipady = int(round(1 * self.scale))
+        self.scrollbar_width = int(16 * self.scale)
+        self.line_height = int(20 * self.scale)
+        self.parameter_width = int(50 * self.scale)
+        style.configure("Treeview", rowheight=self.line_height)
+
+        button_frame = tk.Frame(self.root)
+        button_frame.pack(fill=tk.X, pady=self.pady)
+        button_frame.columnconfigure(3, weight=1)  # 让按钮间隔可调整
+        button_frame.columnconfigure(4, weight=1)  # 让按钮间隔可调整
+
+        self.import_btn = ttk.Button(button_frame, text="导入文件", command=self.import_files)
+        self.import_btn.grid(row=0, column=0, padx=(self.padx, self.padx), ipady=self.ipady)
+
+        # 新增 删除按钮
+        self.delete_btn = ttk.Button(button_frame, text="删除", command=self.delete_selected, width=5)
+        self.delete_btn.grid(row=0, column=1, padx=(0, self.padx), ipady=self.ipady)
+
+        self.clear_btn = ttk.Button(button_frame, text="清空", command=self.clear_all, width=5)
+        self.clear_btn.grid(row=0, column=2, padx=(0, self.padx), ipady=self.ipady)
+
+        self.subfmt_frame = ttk.Frame(button_frame)
+        self.subfmt_frame.columnconfigure(1, weight=1)
+        self.subfmt_frame.grid(row=0, column=3, sticky="e")
+        ttk.Label(self.subfmt_frame, text="格式:").grid(row=0, column=0, padx=(0, 5), sticky="e")
+        self.subfmt_var = tk.StringVar(value="ass")
+        self.subfmt_cb = ttk.Combobox(self.subfmt_frame, textvariable=self.subfmt_var, width=5, state="readonly")
+        self.subfmt_cb.grid(row=0, column=1, padx=(0, 0), ipady=self.ipady, sticky="e")
+
+        self.load_subtitle_formats()
+
+        self.ass_fix_var = tk.BooleanVar(value=False)
+        self.ass_fix_cb = ttk.Checkbutton(button_frame, text="清空头部", variable=self.ass_fix_var)
+        self.ass_fix_cb.grid(row=0, column=4, padx=(self.padx, 0), sticky="w")
+
+        # 绑定事件：当字幕格式变化时更新 ass_fix_cb 显示状态
+        self.subfmt_cb.bind("<<ComboboxSelected>>", lambda e: self.update_ass_fix_visibility())
+
+        # 将原来的 restore_font_cb 改为下拉栏：子集合并 / 封装字体
+        self.font_mode_var = tk.StringVar(value="封装字体")
+        self.font_mode_frame = ttk.Frame(button_frame)
+        self.font_mode_frame.grid(row=0, column=5, sticky="w")
+        ttk.Label(self.font_mode_frame, text="").grid(row=0, column=0, padx=(0, 0), sticky="e")
+        self.font_mode_cb = ttk.Combobox(self.font_mode_frame, textvariable=self.font_mode_var,
+                                         values=("封装字体", "子集合并", "字体名还原", "无处理"), width=8,
+                                         state="readonly")
+        self.font_mode_cb.grid(row=0, column=1, padx=(0, self.padx), ipady=self.ipady, sticky="w")
+
+        # 强制重新导出：忽略导出清单，已是最新的轨道也重新提取
+        self.force_var = tk.BooleanVar(value=False)
+        self.force_cb = ttk.Checkbutton(self.font_mode_frame, text="强制", variable=self.force_var)
+        self.force_cb.grid(row=0, column=2, padx=(0, self.padx), sticky="w")
+
+        self.extract_btn = ttk.Button(button_frame, text="提取字幕", command=self.extract_subtitles_clicked)
+        self.extract_btn.grid(row=0, column=6, padx=(0, self.scrollbar_width), ipady=self.ipady, sticky="e")
+
+        # 批处理控制：提取过程中替换“提取字幕”按钮
+        self.batch_frame = ttk.Frame(button_frame)
+        self.batch_frame.grid(row=0, column=6, padx=(0, self.scrollbar_width), sticky="e")
+        self.pause_btn = ttk.Button(self.batch_frame, text="暂停", command=self.toggle_pause_batch, width=5)
+        self.pause_btn.grid(row=0, column=0, padx=(0, self.padx), ipady=self.ipady)
+        self.cancel_btn = ttk.Button(self.batch_frame, text="取消", command=self.cancel_batch, width=5)
+        self.cancel_btn.grid(row=0, column=1, ipady=self.ipady)
+        self.batch_frame.grid_remove()
+
+        # 初始显示状态，根据默认值判断
+        self.update_ass_fix_visibility()
+
+        # 日志面板先占住窗口底部，文件列表填充剩余空间
+        self.create_log_pane()
+
+        # --- 把 Treeview 和 Scrollbar 放在一个 Frame 里 ---
+        tree_frame = tk.Frame(self.root)
+        tree_frame.pack(fill=tk.BOTH, expand=True, padx=(self.padx, 0), pady=(0, self.pady))
+
+        # Treeview with checkbox column
+        columns = ("Check", "filename", "width", "height", "fps")
+        self.tree = ttk.Treeview(tree_frame, columns=columns, show="headings", selectmode="extended")
+        self.tree.heading("Check", text="☑", command=self.toggle_all_selection)
+        self.tree.heading("filename", text="文件名")
+        self.tree.heading("width", text="宽度")
+        self.tree.heading("height", text="高度")
+        self.tree.heading("fps", text="刷新率")
+
+        self.tree.column("Check", width=self.line_height, anchor="center", stretch=False)
+        self.tree.column("filename", width=200)
+        self.tree.column("width", width=self.parameter_width, anchor="center", stretch=False)
+        self.tree.column("height", width=self.parameter_width, anchor="center", stretch=False)
+        self.tree.column("fps", width=self.parameter_width, anchor="center", stretch=False)
+
+        # 批处理染色标签
+        self.tree.tag_configure("success", background="#c8e6c9")  # 绿色
+        self.tree.tag_configure("partial", background="#fff9c4")  # 黄色
+        self.tree.tag_configure("fail", background="#ffcdd2")  # 红色
+        self.tree.tag_configure("processing", background="#e0e0e0")  # 灰色
+
+        # y 方向滚动条
+        self.yscroll = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.yscroll.set)
+
+        # 布局：Treeview 左，纵向滚动条右
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.yscroll.grid(row=0, column=1, sticky="ns")
+
+        # 虚拟列表：根据高度计算可见行数，自行处理滚轮与选中
+        self.tree.bind("<Configure>", self.on_tree_configure, add="+")
+        self.tree.bind("<<TreeviewSelect>>", self.on_tree_select, add="+")
+        for ev in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(ev, self.on_tree_wheel, add="+")
+
+        tree_frame.rowconfigure(0, weight=1)
+        tree_frame.columnconfigure(0, weight=1)
+
+        # 拖拽支持
+        from tkinterdnd2 import DND_FILES
+        self.tree.drop_target_register(DND_FILES)
+        self.tree.dnd_bind('<<Drop>>', lambda event: self.on_files_dropped(event))
+
+        # 绑定点击事件处理复选框切换
+        self.tree.bind("<Button-1>", self.on_tree_click)
+        self.enable_treeview_edit(self.tree)
+
+        # 绑定
+        def block_resize(event):
+            region = self.tree.identify_region(event.x, event.y)
+            # 只阻止列标题边界（separator）拖拽
+            if region == "separator":
+                return "break"
+            # 点击其他区域（row, cell, heading）正常处理
+
+        self.tree.bind("<Button-1>", block_resize, add="+")
+
+    def create_log_pane(self):
+        """底部日志面板：只读文本框 + 日志级别选择，内容由 _drain_ui_queue 从环形缓冲增量追加"""
+        log_frame = tk.Frame(self.root)
+        log_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=(self.padx, 0), pady=(0, self.pady))
+
+        header = tk.Frame(log_frame)
+        header.grid(row=0, column=0, columnspan=2, sticky="ew")
+        ttk.Label(header, text="日志").pack(side=tk.LEFT)
+        self.log_level_var = tk.StringVar(value=logging.getLevelName(logger.getEffectiveLevel()))
+        self.log_level_cb = ttk.Combobox(header, textvariable=self.log_level_var, values=LOG_LEVELS,
+                                         state="readonly", width=9)
+        self.log_level_cb.pack(side=tk.RIGHT, padx=(0, self.scrollbar_width))
+        self.log_level_cb.bind("<<ComboboxSelected>>", lambda e: logger.setLevel(self.log_level_var.get()))
+
+        self.log_text = tk.Text(log_frame, height=6, wrap="none", state="disabled")
+        self.log_text.tag_configure("warning", foreground="#b26a00")
+        self.log_text.tag_configure("error", foreground="#c62828")
+        self.log_text.tag_configure("debug", foreground="#757575")
+        log_scroll = ttk.Scrollbar(log_frame, orient="vertical", command=self.log_text.yview)
+        self.log_text.configure(yscrollcommand=log_scroll.set)
+        self.log_text.grid(row=1, column=0, sticky="nsew")
+        log_scroll.grid(row=1, column=1, sticky="ns")
+        log_frame.columnconfigure(0, weight=1)
+
+    def _append_logs(self, entries):
+        """主线程：把新日志追加到日志面板，超过 log_pane_lines 行时删除最早的行"""
+        at_bottom = self.log_text.yview()[1] >= 0.999
+        self.log_text.configure(state="normal")
+        for level, line in entries:
+            if level >= logging.ERROR:
+                tag = "error"
+            elif level >= logging.WARNING:
+                tag = "warning"
+            elif level < logging.INFO:
+                tag = "debug"
+            else:
+                tag = ()
+            self.log_text.insert("end", line + "\n", tag)
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - self.log_pane_lines
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+        self.log_text.configure(state="disabled")
+        if at_bottom:  # 用户向上翻看时不自动滚动
+            self.log_text.see("end")
+
+    def load_subtitle_formats(self):
+        formats = [
+            "ass",  # Advanced SubStation Alpha
+            "srt",  # SubRip Subtitle
+            "ssa",  # SubStation Alpha
+            # "sub",  # MicroDVD, VobSub, DVD subtitles (图片字幕但常作为subtitle格式名)
+            # "vtt",  # WebVTT
+            "sup",  # SubPicture Subtitle
+            "原格式",
+            # "lrc",
+            # "mov_text",  # QuickTime text subtitles (比如mp4里的字幕)
+            # "pgs",  # Presentation Graphic Stream (Blu-ray)
+            # "dvdsub",  # DVD subtitles (图像字幕)
+            # "xsub",  # XVid subtitles
+            # "hdmv_pgs_subtitle",  # 高清多媒体播放机PGS字幕
+            # "webvtt"  # Web Video Text Tracks (类似vtt)
+        ]
+
+        self.subfmt_cb['values'] = formats
+        self.subfmt_var.set("ass")
+
+    def set_treeview_clickable(self, enabled: bool):
+        """
+        控制 Treeview 是否允许点击交互。
+        关闭点击时，会屏蔽鼠标事件；
+        重新开启时，会恢复之前绑定的所有事件。
+        """
+        events = ["<Button-1>", "<ButtonRelease-1>", "<B1-Motion>", "<Double-1>", "<Motion>"]
+
+        if not hasattr(self, "_tree_bind_backup"):
+            self._tree_bind_backup = {}
+
+        if not enabled:
+            # 保存当前绑定函数
+            for ev in events:
+                func = self.tree.bind(ev)
+                if func:
+                    self._tree_bind_backup[ev] = func
+                # 阻止所有点击事件
+                self.tree.bind(ev, lambda e: "break")
+        else:
+            # 恢复之前保存的绑定函数
+            for ev in events:
+                if ev in self._tree_bind_backup:
+                    self.tree.bind(ev, self._tree_bind_backup[ev])
+                else:
+                    # 没有备份的事件，解除阻止
+                    self.tree.unbind(ev)
+
+    def update_ass_fix_visibility(self):
+        fmt = self.subfmt_var.get().lower()
+        if fmt in ("ass", "ssa", "原格式"):
+            self.ass_fix_cb.config(state="normal")
+            self.font_mode_cb.config(state="normal")
+        else:
+            self.ass_fix_cb.config(state="disabled")
+            self.font_mode_cb.config(state="disabled")
+
+    def import_files(self):
+        paths = filedialog.askopenfilenames(title="选择视频文件")
+        if not paths:
+            return
+        # self.add_files(paths)
+        t = threading.Thread(target=self.add_files, args=(paths,), daemon=True)
+        t.start()
+
+    def on_close(self):
+        """关闭窗口：取消尚未开始的探测，避免退出时等待整批导入完成"""
+        self._closing.set()
+        self.root.destroy()
+
+    def add_files(self, paths):
+        """导入文件：先插入“探测中”占位行，再用线程池并行探测，每个结果返回后立即填充对应行"""
+        records = {}
+        for p in paths:
+            p = p.strip("'\"")
+            if os.path.isfile(p) and p not in self.files and p not in records:
+                # 宽高/帧率/probe 在探测完成后填充
+                records[p] = FileRecord(p)
+
+            else:
+                if not os.path.isfile(p):
+                    self.log(f"⚠️ 无效的文件路径: {p}")
+                else:
+                    logger.debug("文件已存在: %s", p)
+
+        # 先标记为探测中，再一次性加入列表：Treeview 收到 add 事件后插入占位行，不锁定按钮
+        # （add_many 会同步回调 _row_values，调用期间不能持有 _probing_lock）
+        with self._probing_lock:
+            self._probing_paths.update(records)
+        added = self.files.add_many(records.values())
+        with self._probing_lock:
+            self._probing_paths.difference_update(set(records) - {record.fullpath for record in added})
+        if not added:
+            return
+        new_paths = [record.fullpath for record in added]
+        self.original_files.extend((p, os.path.basename(p)) for p in new_paths)
+
+        with ThreadPoolExecutor(max_workers=self.probe_workers, thread_name_prefix="probe") as pool:
+            futures = {pool.submit(self.probe_file, p): p for p in new_paths}
+            for future in as_completed(futures):
+                if self._closing.is_set():
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    return
+                self.post_ui(self._apply_probe_result, futures[future], *future.result())
+        self.log(f"📥 已导入 {len(new_paths)} 个文件")
+
+    def _apply_probe_result(self, path, width, height, fps, probe):
+        """主线程：填充单个文件的探测结果（文件在探测期间被删除时忽略）"""
+        with self._probing_lock:
+            self._probing_paths.discard(path)
+        self.files.update(path, width=width, height=height, fps=fps, probe=probe)
+
+    def clear_list(self):
+        self.files.clear()
+
+    def _row_values(self, record):
+        with self._probing_lock:
+            probing = record.fullpath in self._probing_paths
+        width = "探测中…" if probing else record.width
+        chk = "☑" if record.checked else "☐"
+        return chk, record.filename, width, record.height, record.fps
+
+    def _insert_row(self, record):
+        status = self._row_status.get(record.fullpath)
+        self.tree.insert("", tk.END, iid=record.fullpath, tags=(status,) if status else (),
+                         values=self._row_values(record))
+
+    def _on_files_changed(self, kind, payload):
+        """文件列表变更回调：主线程中直接更新 Treeview，其他线程交给主线程"""
+        if threading.current_thread() is threading.main_thread():
+            self._apply_files_change(kind, payload)
+        else:
+            self.post_ui(self._apply_files_change, kind, payload)
+
+    def _apply_files_change(self, kind, payload):
+        """
+        主线程：只对变化的行执行插入/更新/删除
+        事件可能晚于后续变更到达，因此插入前确认记录仍在列表中，更新前确认行存在
+        """
+        if kind in ("remove", "clear"):
+            with self._row_status_lock:
+                for path in (payload if kind == "remove" else list(self._row_status)):
+                    self._row_status.pop(path, None)
+            if kind == "remove":
+                self._virtual_selection.difference_update(payload)
+            else:
+                self._virtual_selection.clear()
+
+        virtual = len(self.files) > self.virtual_list_threshold
+        if virtual != self._virtual:
+            self._switch_list_mode(virtual)
+        elif self._virtual:
+            # 虚拟列表：可见行直接更新，结构变化合并为一次重新渲染
+            if kind == "update":
+                for record in payload:
+                    if self.tree.exists(record.fullpath):
+                        self.tree.item(record.fullpath, values=self._row_values(record))
+            else:
+                self._schedule_virtual_render()
+        elif kind == "add":
+            for record in payload:
+                if record.fullpath in self.files and not self.tree.exists(record.fullpath):
+                    self._insert_row(record)
+        elif kind == "update":
+            for record in payload:
+                if self.tree.exists(record.fullpath):
+                    self.tree.item(record.fullpath, values=self._row_values(record))
+        elif kind == "remove":
+            self.tree.delete(*[path for path in payload if self.tree.exists(path)])
+        elif kind == "clear":
+            self.tree.delete(*self.tree.get_children())
+        elif kind == "refresh":
+            for record in self.files:
+                if self.tree.exists(record.fullpath):
+                    self.tree.item(record.fullpath, values=self._row_values(record))
+        self.update_header_checkbox()
+
+    def refresh_tree(self):
+        """按文件列表全量重建 Treeview（常规变更由 _apply_files_change 增量处理）"""
+        if self._virtual:
+            self._render_virtual()
+            return
+        self.tree.delete(*self.tree.get_children())
+        for record in self.files:
+            self._insert_row(record)
+        self.update_header_checkbox()
+
+    def _switch_list_mode(self, virtual):
+        """在普通列表与虚拟列表之间切换，保留选中行"""
+        if virtual:
+            self._virtual_selection = set(self.tree.selection())
+            self._virtual_offset = 0
+            self.yscroll.configure(command=self.on_virtual_scroll)
+            self.tree.configure(yscrollcommand="")
+        else:
+            self.yscroll.configure(command=self.tree.yview)
+            self.tree.configure(yscrollcommand=self.yscroll.set)
+        self._virtual = virtual
+        self.refresh_tree()
+        if not virtual:
+            self.tree.selection_set([p for p in self._virtual_selection if self.tree.exists(p)])
+            self._virtual_selection.clear()
+
+    def _schedule_virtual_render(self):
+        if not self._virtual_render_pending:
+            self._virtual_render_pending = True
+            self.root.after_idle(self._render_virtual)
+
+    def _render_virtual(self):
+        """只插入可见区域的行，并按模型恢复这些行的选中状态"""
+        self._virtual_render_pending = False
+        if not self._virtual:
+            return
+        total = len(self.files)
+        self._virtual_offset = max(0, min(self._virtual_offset, total - self._virtual_rows))
+        records = self.files.slice(self._virtual_offset, self._virtual_offset + self._virtual_rows)
+        self.tree.delete(*self.tree.get_children())
+        for record in records:
+            self._insert_row(record)
+        self.tree.selection_set([r.fullpath for r in records if r.fullpath in self._virtual_selection])
 
-    def _create_fontforge_merge_script(self, font_files, output_path):
-        """
-        创建FontForge合并脚本（修正版）
-        使用 importOutlines() 安全复制字形，避免 'glyph' 无 copy 方法错误
-        """
-        # 构建输入文件列表
-        input_files_str = "[\n        " + ",\n        ".join([f'r"{f}"' for f in font_files]) + "\n    ]"
+        if total:
+            self.yscroll.set(self._virtual_offset / total, min(1.0, (self._virtual_offset + len(records)) / total))
+        else:
+            self.yscroll.set(0.0, 1.0)
+        self.update_header_checkbox()
 
-        # 脚本内容
-        script_content = f'''# -*- coding: utf-8 -*-
-import fontforge
-import os
-import sys
-import tempfile
-import traceback
+    def _scroll_virtual(self, offset):
+        offset = max(0, min(int(offset), len(self.files) - self._virtual_rows))
+        if offset != self._virtual_offset:
+            self._virtual_offset = offset
+            self._render_virtual()
+
+    def on_virtual_scroll(self, *args):
+        """虚拟列表模式下的滚动条命令（moveto / scroll）"""
+        if args[0] == "moveto":
+            self._scroll_virtual(float(args[1]) * len(self.files))
+        elif args[0] == "scroll":
+            step = self._virtual_rows if args[2] == "pages" else 1
+            self._scroll_virtual(self._virtual_offset + int(args[1]) * step)
+
+    def on_tree_wheel(self, event):
+        if not self._virtual:
+            return None
+        if event.num == 4:
+            delta = -3
+        elif event.num == 5:
+            delta = 3
+        else:
+            delta = -3 if event.delta > 0 else 3
+        self._scroll_virtual(self._virtual_offset + delta)
+        return "break"
+
+    def on_tree_configure(self, event):
+        # 减去表头一行
+        rows = max(1, event.height // self.line_height - 1)
+        if rows != self._virtual_rows:
+            self._virtual_rows = rows
+            if self._virtual:
+                self._schedule_virtual_render()
+
+    def on_tree_select(self, event):
+        """虚拟列表模式下把可见行的选中状态同步到模型"""
+        if not self._virtual:
+            return
+        selected = set(self.tree.selection())
+        for iid in self.tree.get_children():
+            if iid in selected:
+                self._virtual_selection.add(iid)
+            else:
+                self._virtual_selection.discard(iid)
 
-def main():
-    merged_font = fontforge.font()
-    merged_font.encoding = 'UnicodeFull'
-    total_glyphs = 0
+    def selected_paths(self):
+        """当前选中的行（虚拟列表模式下包含已滚出可见区域的行）"""
+        if self._virtual:
+            return [record.fullpath for record in self.files.slice(0, None)
+                    if record.fullpath in self._virtual_selection]
+        return list(self.tree.selection())
 
-    input_files = {input_files_str}
-    output_file = r"{output_path}"
+    def delete_selected(self):
+        selected_items = self.selected_paths()
+        if not selected_items:
+            messagebox.showinfo("提示", "请先选中要删除的文件行")
+            return
 
-    print("=== 字体合并开始 ===")
-    print(f"输入文件: {{input_files}}")
-    print(f"输出文件: {{output_file}}")
+        # 删除 self.files 中对应项（Treeview 通过 remove 事件删除对应行）
+        self.files.remove(selected_items)
 
-    for i, font_path in enumerate(input_files):
-        print(f"\\n--- 处理第 {{i+1}}/{{len(input_files)}} 个字体 ---")
-        print(f"字体路径: {{font_path}}")
+    """def ask_output_directory(self):
+        dialog = OutputDirDialog(self.root, title="字幕提取目标目录")
+        return dialog.result"""
 
-        if not os.path.exists(font_path):
-            print(f"❌ 文件不存在: {{font_path}}")
-            continue
+    def extract_subtitles_clicked(self):
+        if not self.files:
+            messagebox.showwarning("提示", "请先导入视频文件")
+            return
 
-        try:
-            font = fontforge.open(font_path)
-            all_glyphs = list(font.glyphs())
-            print(f"✅ 打开字体成功: {{font.fontname}}")
-            print(f"字体 {{font.fontname}} 共包含 {{len(all_glyphs)}} 个字形")
+        with self._probing_lock:
+            probing = len(self._probing_paths)
+        if probing:
+            messagebox.showwarning("提示", f"仍有 {probing} 个文件正在分析，请稍后再提取")
+            return
 
-            if i == 0:
-                try:
-                    merged_font.fontname = font.fontname
-                    merged_font.familyname = font.familyname
-                    merged_font.fullname = font.fullname
-                    print(f"设置字体元信息: {{font.fontname}} / {{font.familyname}}")
-                except Exception as e:
-                    print(f"⚠️ 设置字体元信息失败: {{e}}")
+        # ✅ 直接从 self.files 获取 fullpath、filename、height、fps
+        selected_files = [(record.fullpath, record.filename) for record in self.files.checked()]
 
-            glyph_count = 0
-            for glyph in all_glyphs:
-                name = glyph.glyphname
-                if not glyph.isWorthOutputting() or name in merged_font:
-                    continue
-                try:
-                    new_glyph = merged_font.createChar(glyph.encoding, name)
-                    tmp_svg = tempfile.NamedTemporaryFile(delete=False, suffix=".svg")
-                    tmp_svg.close()
-                    glyph.export(tmp_svg.name)
-                    new_glyph.importOutlines(tmp_svg.name)
-                    new_glyph.width = glyph.width
-                    os.unlink(tmp_svg.name)
-                    glyph_count += 1
-                    total_glyphs += 1
-                except Exception as e:
-                    print(f"⚠️ 复制字形失败: {{name}} -> {{e}}")
+        if not selected_files:
+            messagebox.showwarning("提示", "请先勾选要提取字幕的文件")
+            return
 
-            print(f"✅ 完成字体 {{font.fontname}}，成功复制 {{glyph_count}} 个字形")
-            font.close()
+        subfmt = self.subfmt_var.get().lower()
+        if not subfmt:
+            messagebox.showerror("错误", "请选择字幕格式")
+            return
 
-        except Exception as e:
-            print(f"⚠️ 打开或处理字体失败: {{font_path}} -> {{e}}")
-            traceback.print_exc()
+        # 使用 askyesnocancel 代替原来的 askquestion
+        choice = messagebox.askyesnocancel(
+            "字幕提取目标目录",
+            "字幕默认会被提取到各个视频所在的目录！\n选择“是”继续操作；\n选择“否”指定提取目录。"
+        )
 
-    print(f"\\n=== 合并完成，共合并 {{total_glyphs}} 个字形 ===")
+        if choice is None:
+            return  # 用户点击取消或关闭窗口
 
-    if total_glyphs == 0:
-        print("❌ 没有成功合并任何字形")
-        return False
+        if choice:  # Yes → 原目录
+            outdir = None
+        else:  # No → 指定目录
+            outdir = filedialog.askdirectory(title="选择字幕保存目录")
+            if not outdir:  # 用户在选择目录时点了取消
+                return
 
-    # 🔧 修正字体元信息
-    if not merged_font.fontname:
-        merged_font.fontname = os.path.splitext(os.path.basename(output_file))[0].replace(" ", "_")
+            # 如果目录不存在，则回退到上级存在的目录
+            temp_dir = outdir
+            while not os.path.exists(temp_dir):
+                temp_dir = os.path.dirname(temp_dir)
+            outdir = temp_dir
 
-    if not merged_font.familyname:
-        try:
-            first_font = fontforge.open(input_files[0])
-            merged_font.familyname = first_font.familyname or merged_font.fontname
-            merged_font.fullname = first_font.fullname or merged_font.fontname
-            first_font.close()
-        except Exception:
-            merged_font.familyname = merged_font.fontname
-            merged_font.fullname = merged_font.fontname
+            # 尝试创建最终目录
+            try:
+                os.makedirs(outdir, exist_ok=True)
+            except Exception as e:
+                messagebox.showerror("错误", f"无法创建目录：\n{outdir}\n\n错误信息：{e}")
+                return
 
-    merged_font.sfnt_names = (
-        ("English (US)", "Family", merged_font.familyname),
-        ("English (US)", "Fullname", merged_font.fullname),
-        ("English (US)", "PostScriptName", merged_font.fontname),
-    )
+        # 工作线程不读取 Tk 变量，开始前在主线程取好选项
+        font_mode = self.font_mode_var.get()
+        self.batch_ass_fix = self.ass_fix_var.get()
+        self.force_rebuild = self.force_var.get()
 
-    try:
-        print("💾 保存合并后的字体...")
-        ext = os.path.splitext(output_file.lower())[1]
-        if ext == '.otf':
-            merged_font.generate(output_file, flags=('opentype',))
-        else:  # .ttf 或其他
-            merged_font.generate(output_file)  # 不加 flags
-        merged_font.close()
-        print(f"✅ 字体保存成功: {{output_file}}")
-        return True
-    except Exception as e:
-        print(f"❌ 字体保存失败: {{e}}")
-        traceback.print_exc()
-        return False
+        self.save_and_disable_buttons()
+        self.set_treeview_clickable(False)
+        self._show_batch_controls(True)
+        threading.Thread(target=self.extract_subtitles_all, args=(subfmt, selected_files, outdir, font_mode),
+                         daemon=True).start()
 
-if __name__ == "__main__":
-    success = main()
-    sys.exit(0 if success else 1)
-'''
+    def extract_subtitles_all(self, subfmt, selected_files, outdir=None, font_mode="子集合并"):
+        """
+        工作线程：运行批处理，导出提示、完成汇总与按钮恢复都需要对话框，交给主线程执行
+        批处理抛出异常时也要恢复界面，异常记入错误汇总
+        """
+        result = {"cancelled": False, "temp_outdir": None}
+        try:
+            result = self.run_batch(subfmt, selected_files, outdir, font_mode)
+        except Exception as e:
+            logger.debug("批处理异常退出", exc_info=True)
+            self.report_error("批处理异常退出", str(e))
+        finally:
+            self.post_ui(self._finish_batch, result["temp_outdir"], result["cancelled"])
 
-        # 创建临时脚本文件
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
-            f.write(script_content)
-            return f.name
+    def _finish_batch(self, temp_outdir, cancelled=False):
+        """主线程：批次结束后的字体导出提示、临时目录清理、错误汇总与界面恢复"""
+        # ✅ 若使用了临时目录，则进行导出提示
+        if temp_outdir:
+            fonts_root = os.path.join(temp_outdir, "Fonts")
+            if os.path.exists(fonts_root):
+                export_fonts = messagebox.askyesno("导出字体", "是否导出提取的字体？")
+                if export_fonts:
+                    export_dir = filedialog.askdirectory(title="选择导出字体的目标目录")
+                    if export_dir:
+                        try:
+                            self.export_fonts(fonts_root, export_dir)
+                        except Exception as e:
+                            self.log(f"导出字体失败: {e}")
+                # 删除临时目录
+                try:
+                    shutil.rmtree(temp_outdir)
+                    self.log(f"临时输出目录已删除: {temp_outdir}")
+                except Exception as e:
+                    self.log(f"删除临时输出目录失败: {e}")
+
+        with self._state_lock:
+            errors, self._batch_errors = self._batch_errors, []
+        if cancelled:
+            self.log("⏹️ 字幕提取已取消")
+            messagebox.showinfo("已取消", "字幕提取已取消，已完成的视频输出已保留。")
+        elif errors:
+            self.log("✅ 所有文件字幕提取完成！")
+            shown = "\n".join(f"• {title}: {message}" for title, message in errors[:10])
+            more = f"\n… 另有 {len(errors) - 10} 个错误，详见日志" if len(errors) > 10 else ""
+            messagebox.showwarning("完成", f"字幕提取完成，但有 {len(errors)} 个错误：\n{shown}{more}")
+        else:
+            self.log("✅ 所有文件字幕提取完成！")
+            messagebox.showinfo("完成", "所有字幕提取完成！")
+        self._show_batch_controls(False)
+        self.restore_buttons_state()
+        self.set_treeview_clickable(True)
 
-    def log(self, msg):
-        print(msg)  # 你可以改为写入GUI的文本框或者日志窗口
+    def _show_batch_controls(self, running):
+        """批处理期间用“暂停/取消”替换“提取字幕”按钮"""
+        if running:
+            self.extract_btn.grid_remove()
+            self.pause_btn.config(text="暂停", state="normal")
+            self.cancel_btn.config(text="取消", state="normal")
+            self.batch_frame.grid()
+        else:
+            self.batch_frame.grid_remove()
+            self.extract_btn.grid()
+
+    def toggle_pause_batch(self):
+        """暂停：不再开始新的视频/轨道，已在运行的继续完成；再次点击继续"""
+        if not self.paused:
+            self.pause()
+            self.pause_btn.config(text="继续")
+            self.log("⏸️ 已暂停，正在运行的任务完成后不再开始新任务")
+        else:
+            self.resume()
+            self.pause_btn.config(text="暂停")
+            self.log("▶️ 继续处理")
+
+    def cancel_batch(self):
+        """取消：未开始的任务不再执行，正在运行的子进程被结束"""
+        self.cancel()
+        self.pause_btn.config(state="disabled")
+        self.cancel_btn.config(text="取消中…", state="disabled")
+        self.log("⏹️ 正在取消，等待正在运行的任务退出…")
+
+    def _apply_row_status(self, fullpath, status):
+        """主线程：把状态标签应用到对应行（行已被删除时忽略）"""
+        if self.tree.exists(fullpath):
+            self.tree.item(fullpath, tags=(status,) if status else ())
+
+    def post_ui(self, fn, *args):
+        """从任意线程提交需要在主线程执行的界面操作"""
+        self._ui_queue.put((fn, args))
+
+    def _drain_ui_queue(self):
+        """主线程定时执行：依次处理排队的界面操作，再合并刷新行状态与日志"""
+        try:
+            while True:
+                try:
+                    fn, args = self._ui_queue.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    fn(*args)
+                except Exception as e:
+                    self.log(f"⚠️ 界面更新失败: {e}")
+
+            with self._row_status_lock:
+                rows = [(path, self._row_status.get(path)) for path in self._dirty_rows]
+                self._dirty_rows.clear()
+            for path, status in rows:
+                self._apply_row_status(path, status)
+            self._log_seq, logs = self.log_ring.since(self._log_seq)
+            if logs:
+                self._append_logs(logs)
+        finally:
+            self.root.after(self.ui_drain_interval, self._drain_ui_queue)
 
     def set_buttons_state(self, state):
         """统一设置所有按钮的状态"""
@@ -1851,6 +4659,7 @@ if __name__ == "__main__":
         self.extract_btn.config(state=state)
         self.ass_fix_cb.config(state=state)
         self.font_mode_cb.config(state=state)
+        self.force_cb.config(state=state)  # 批次运行中读取 force_rebuild，不能中途切换
         # self.tree.config(state=state)
 
     def save_and_disable_buttons(self):
@@ -1863,6 +4672,7 @@ if __name__ == "__main__":
             'extract_btn': self.extract_btn['state'],
             'ass_fix_cb': self.ass_fix_cb['state'],
             'font_mode_cb': self.font_mode_cb['state'],
+            'force_cb': self.force_cb['state'],
             # 'tree': self.tree['state']
         }
         self.set_buttons_state('disabled')
@@ -1879,24 +4689,16 @@ if __name__ == "__main__":
         self.extract_btn.config(state=self._original_states.get('extract_btn', 'normal'))
         self.ass_fix_cb.config(state=self._original_states.get('ass_fix_cb', 'normal'))
         self.font_mode_cb.config(state=self._original_states.get('font_mode_cb', 'normal'))
+        self.force_cb.config(state=self._original_states.get('force_cb', 'normal'))
         # self.tree.config(state=self._original_states.get('tree', 'normal'))
 
     def toggle_all_selection(self):
         self.header_checked = not self.header_checked
-        for idx, file_tuple in enumerate(self.files):
-            file_info = dict(zip(self.file_fields, file_tuple))
-            # 更新 checked 状态
-            file_info["checked"] = self.header_checked
-            # 保留其他字段
-            self.files[idx] = tuple(file_info[field] for field in self.file_fields)
-            self.tree.set(file_info["fullpath"], "Check", "☑" if self.header_checked else "☐")
+        self.files.set_all_checked(self.header_checked)
         self.update_header_checkbox()
 
     def update_header_checkbox(self):
-        if self.files and all(dict(zip(self.file_fields, f)).get("checked") for f in self.files):
-            self.header_checked = True
-        else:
-            self.header_checked = False
+        self.header_checked = self.files.all_checked()
         self.tree.heading(
             "Check",
             text="☑" if self.header_checked else "☐",
@@ -1904,14 +4706,10 @@ if __name__ == "__main__":
         )
 
     def get_selected_files(self):
-        return [fullpath for checked, fullpath, _ in self.items.values() if checked]
+        return [record.fullpath for record in self.files.checked()]
 
     def clear_all(self):
-        self.tree.delete(*self.tree.get_children())
         self.files.clear()
-        self.items.clear()
-        self.update_header_checkbox()
-        self.refresh_tree()
 
     def on_tree_click(self, event):
         region = self.tree.identify("region", event.x, event.y)
@@ -1925,19 +4723,8 @@ if __name__ == "__main__":
         if not item:
             return
 
-        # 切换选中状态
-        for i, file_tuple in enumerate(self.files):
-            file_info = dict(zip(self.file_fields, file_tuple))
-            fullpath = file_info.get("fullpath")
-            if fullpath == item:
-                # 切换 checked 状态
-                file_info["checked"] = not file_info.get("checked", False)
-                # 将 dict 转回 tuple，保持字段顺序
-                self.files[i] = tuple(file_info[field] for field in self.file_fields)
-                self.tree.set(item, "Check", "☑" if file_info["checked"] else "☐")
-                break
-
-        self.update_header_checkbox()
+        # 切换选中状态（行与表头由 update 事件刷新）
+        self.files.toggle(item)
         return "break"  # 阻止默认行选中
 
     def enable_treeview_edit(self, tree):
@@ -1966,20 +4753,19 @@ if __name__ == "__main__":
         # 获取列显示索引
         display_col_index = int(column.replace("#", "")) - 1
 
-        # 显示列 -> file_fields 索引映射
-        display_to_filefield_idx = {
-            0: 2,  # Check -> checked
-            1: 1,  # Filename -> filename
-            2: 3,  # Width -> width
-            3: 4,  # Height -> height
-            4: 5,  # FPS -> fps
+        # 显示列 -> FileRecord 字段
+        display_to_field = {
+            0: "checked",
+            1: "filename",
+            2: "width",
+            3: "height",
+            4: "fps",
         }
 
-        if display_col_index not in display_to_filefield_idx:
+        if display_col_index not in display_to_field:
             return
 
-        file_field_index = display_to_filefield_idx[display_col_index]
-        field_name = self.file_fields[file_field_index]
+        field_name = display_to_field[display_col_index]
 
         # ---- 禁止编辑文件名列 ----
         if field_name == "filename":
@@ -2005,12 +4791,7 @@ if __name__ == "__main__":
             entry.destroy()
 
             # 更新 self.files
-            for i, file_tuple in enumerate(self.files):
-                file_info = dict(zip(self.file_fields, file_tuple))
-                if file_info.get("fullpath") == row:
-                    file_info[field_name] = new_value
-                    self.files[i] = tuple(file_info.get(f, "") for f in self.file_fields)
-                    break
+            self.files.update(row, **{field_name: new_value})
 
             # 编辑 checked 列时刷新表头状态
             if field_name == "checked":
@@ -2031,7 +4812,7 @@ if __name__ == "__main__":
     def on_files_dropped(self, event):
         # self.set_buttons_state("disabled")  # 禁用按钮
 
-        print(event.data)
+        logger.debug("拖放数据：%s", event.data)
         files_data = event.data
 
         files_data = files_data.replace(r'\{', '{').replace(r'\}', '}').replace(r'\ ', ' ')
@@ -2039,7 +4820,6 @@ if __name__ == "__main__":
         # Step 1: 处理外部的{}，将内部的空格替换为|
         # 这个正则表达式匹配外部的{}并替换其中的空格
         files_data = re.sub(r'\{([^{}]+)\}', lambda m: '{' + m.group(1).replace(' ', '|') + '}', files_data)
-        print(files_data)
 
         # Step 2: 使用空格分隔文件路径
         files = files_data.split()
@@ -2049,7 +4829,6 @@ if __name__ == "__main__":
 
         for i, file in enumerate(files):
             file = file.strip()  # 去掉两端空格
-            print(f"当前分段路径：{file}")
             is_renamed = False
 
             # Step 3: 对于被{}符号包裹的路径，恢复{}符号
@@ -2061,7 +4840,6 @@ if __name__ == "__main__":
 
             # 检查文件是否存在
             if os.path.isfile(file):
-                print("分段文件路径存在")
                 if buffer:  # 如果有缓冲路径，且当前路径存在，将缓冲路径和当前路径添加到final_files
                     if buffer.startswith("{") and buffer.endswith("}"):
                         buffer = buffer[1:-1]
@@ -2073,24 +4851,19 @@ if __name__ == "__main__":
                     final_files.append(f"'{file}'")
             else:
                 if buffer:  # 如果当前路径不存在且buffer有路径，拼接它们
-                    print("分段文件路径不存在正在拼接")
                     if is_renamed:
                         file = "{" + file + "}"  # 在这里给file的前后加上{}符号
                     buffer += " " + file  # 将当前路径加入到缓冲区
-                    print(f"buffer内容：{buffer}")
                 else:
-                    print("分段文件路径不存在写入第一段")
                     if is_renamed:
                         file = "{" + file + "}"  # 在这里给file的前后加上{}符号
                     buffer = file  # 如果缓冲区为空，则将当前路径存入缓冲区
-                    print(f"buffer内容：{buffer}")
 
         # 如果缓冲区最后仍有路径，表示最后一段路径是无效的，我们将它添加到final_files
         if buffer:
             final_files.append(f"'{buffer}'")
 
-        # 打印最终文件路径列表（可选）
-        print(", ".join(final_files))
+        logger.debug("拖放解析结果：%s", final_files)
 
         # Step 4: 在Treeview中添加文件
         t = threading.Thread(target=self.add_files, args=(final_files,), daemon=True)
@@ -2104,7 +4877,443 @@ if __name__ == "__main__":
         # self.refresh_tree()
 
 
+def _expand_inputs(patterns):
+    """展开命令行输入：通配符（支持 **）与目录（递归包含其中所有文件），保持顺序并去重"""
+    paths = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        for match in sorted(matches):
+            if os.path.isdir(match):
+                paths.extend(sorted(p for p in glob.glob(os.path.join(match, "**", "*"), recursive=True)
+                                    if os.path.isfile(p)))
+            else:
+                paths.append(match)
+    return [os.path.abspath(p) for p in dict.fromkeys(paths)]
+
+
+def _run_interruptible(work, cancel):
+    """
+    在工作线程中运行 work()，主线程等待以便 Ctrl+C 时调用 cancel() 结束正在运行的子进程
+    被中断时等待 work() 结束后重新抛出 KeyboardInterrupt，否则返回 work() 的结果
+    """
+    done = []
+    finished = threading.Event()
+
+    def run():
+        try:
+            done.append(work())
+        finally:
+            finished.set()
+
+    # 用 Event 等待而不是 Thread.join：join 被 Ctrl+C 打断后，线程可能在仍在运行时就被标记为已结束（bpo-45274）
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        while not finished.wait(0.2):
+            pass
+    except KeyboardInterrupt:
+        logger.info("⏹️ 收到中断，正在取消…")
+        cancel()
+        finished.wait()
+        raise
+    return done[0] if done else None
+
+
+def _load_files_interruptible(engine, paths):
+    """并行探测；Ctrl+C 时结束正在运行的 ffprobe，不再开始新的探测"""
+    cancel_event = threading.Event()
+
+    def cancel():
+        cancel_event.set()
+        engine.process_runner.cancel_all()
+
+    return _run_interruptible(lambda: engine.load_files(paths, cancel_event=cancel_event), cancel)
+
+
+def _run_batch_interruptible(engine, subfmt, selected_files, outdir, font_mode):
+    """
+    批处理；Ctrl+C 时取消批次，等待取消完成（已完成的视频保留输出，结果可由 batch_results() 读取）
+    后重新抛出 KeyboardInterrupt
+    """
+    return _run_interruptible(lambda: engine.run_batch(subfmt, selected_files, outdir, font_mode), engine.cancel)
+
+
+def _write_batch_results(out, engine, paths, probe_failed, cancelled):
+    """每个视频输出一行 JSON（path/status/outputs），返回 (各状态计数, 错误列表)"""
+    results = {path: (status, outputs) for path, status, outputs in engine.batch_results()}
+    counts = {"success": 0, "partial": 0, "fail": 0, "skipped": 0}
+    for path in paths:
+        if path in probe_failed:
+            status, outputs = "fail", []
+        else:
+            status, outputs = results.get(path, (None, []))
+            status = status or ("cancelled" if cancelled else "skipped")
+        counts[status] = counts.get(status, 0) + 1
+        out.write(json.dumps({"path": path, "status": status, "outputs": outputs}, ensure_ascii=False) + "\n")
+    with engine._state_lock:
+        errors = [{"title": title, "message": message} for title, message in engine._batch_errors]
+    errors.extend({"title": "探测失败", "message": path} for path in probe_failed)
+    out.flush()
+    return counts, errors
+
+
+def cli_main(argv=None):
+    """
+    命令行批处理：python -m sub0_2_1_5 cli <输入...> [-o 输出目录] [-f 格式] [--font-mode 模式] [-j 并行数]
+    日志输出到 stderr；stdout 每个视频输出一行 JSON（path/status/outputs），最后一行为汇总（summary）
+    退出码：0 全部成功，1 有失败或部分失败，2 参数错误或没有可处理的文件，130 被中断
+    """
+    parser = argparse.ArgumentParser(prog="sub0_2_1_5 cli", description="批量提取视频内封字幕（无界面模式）")
+    parser.add_argument("inputs", nargs="+", help="视频文件、目录或通配符（支持 **）")
+    parser.add_argument("-o", "--outdir", help="字幕输出目录，默认输出到各视频所在目录")
+    parser.add_argument("-f", "--format", dest="subfmt", default="ass",
+                        choices=("ass", "srt", "ssa", "sup", "原格式"), help="目标字幕格式（默认 ass）")
+    parser.add_argument("--font-mode", default="封装字体",
+                        choices=("封装字体", "子集合并", "字体名还原", "无处理"), help="字体处理方式（默认 封装字体）")
+    parser.add_argument("--fonts-dir", help="未指定输出目录时，把合并后的字体导出到该目录")
+    parser.add_argument("-j", "--workers", type=int, help="并行处理的视频数量")
+    parser.add_argument("--ass-fix", action="store_true", help="修正 ASS 头部")
+    parser.add_argument("--retry-quarantined", action="store_true", help="解除这些文件的隔离（多次崩溃或超时）后重试")
+    parser.add_argument("--force", action="store_true", help="忽略导出清单，重新导出所有轨道")
+    parser.add_argument("--trace", metavar="FILE", help="记录各阶段耗时，导出 Chrome trace JSON 并输出汇总表")
+    parser.add_argument("--log-level", default="INFO", type=str.upper, choices=LOG_LEVELS, help="日志级别（默认 INFO）")
+    parser.add_argument("--log-file", help="同时把日志写入该文件（后台线程写入，按 10 MB 轮换）")
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level, args.log_file)
+
+    paths = _expand_inputs(args.inputs)
+    if not paths:
+        parser.error("没有匹配到任何文件")
+    if args.outdir:
+        args.outdir = os.path.abspath(args.outdir)
+        os.makedirs(args.outdir, exist_ok=True)
+
+    out = sys.stdout
+    cancelled = False
+    with contextlib.redirect_stdout(sys.stderr):  # 引擎的日志与子进程输出不混入 JSON 结果
+        engine = SubtitleEngine(journal_name="cli", trace_path=args.trace)
+        if args.workers:
+            engine.max_workers = max(1, args.workers)
+        engine.batch_ass_fix = args.ass_fix
+        engine.force_rebuild = args.force
+        if args.retry_quarantined and engine.journal is not None:
+            engine.journal.clear_failures(paths)
+        try:
+            probe_failed = []
+            result = {"cancelled": False, "temp_outdir": None}
+            try:
+                # 探测与批处理都可以用 Ctrl+C 中断：未完成的视频输出为 cancelled，退出码 130
+                records, probe_failed = _load_files_interruptible(engine, paths)
+                selected_files = [(record.fullpath, record.filename) for record in records]
+                if selected_files:
+                    result = _run_batch_interruptible(engine, args.subfmt, selected_files, args.outdir,
+                                                      args.font_mode)
+            except KeyboardInterrupt:
+                result = {"cancelled": True, "temp_outdir": None}
+            cancelled = result["cancelled"]
+
+            temp_outdir = result["temp_outdir"]
+            fonts_export = None
+            if temp_outdir:
+                fonts_root = os.path.join(temp_outdir, "Fonts")
+                if args.fonts_dir and os.path.exists(fonts_root):
+                    try:
+                        fonts_export = engine.export_fonts(fonts_root, args.fonts_dir)
+                    except Exception as e:
+                        engine.report_error("导出字体失败", str(e))
+                shutil.rmtree(temp_outdir, ignore_errors=True)
+        finally:
+            engine.close()
+
+    counts, errors = _write_batch_results(out, engine, paths, probe_failed, cancelled)
+    out.write(json.dumps({"summary": dict(counts, total=len(paths), cancelled=cancelled, fonts_dir=fonts_export,
+                                          errors=errors)}, ensure_ascii=False) + "\n")
+    out.flush()
+
+    if cancelled:
+        return 130
+    return 1 if counts["fail"] or counts["partial"] or errors else 0
+
+
+def _watch_profiles_path():
+    """监视模式的配置方案保存在用户配置目录"""
+    if os.name == "nt":
+        root = os.environ.get("APPDATA")
+    else:
+        root = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.path.join(root or str(Path(__file__).parent), "SubtitleExporter", "watch_profiles.json")
+
+
+def _load_watch_profiles():
+    try:
+        with open(_watch_profiles_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_watch_profile(name, profile):
+    profiles = _load_watch_profiles()
+    profiles[name] = profile
+    path = _watch_profiles_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _watch_pending_path(engine):
+    """监视模式退出时尚未处理完的文件列表，与批处理日志放在一起"""
+    if engine.journal is None:
+        return None
+    return os.path.join(engine.journal.directory, "watch_pending.json")
+
+
+def _take_watch_pending(engine):
+    """读取并删除上次退出时保存的未完成文件"""
+    path = _watch_pending_path(engine)
+    if path is None:
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            paths = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return []
+    os.remove(path)
+    return [p for p in paths if os.path.isfile(p)]
+
+
+def _save_watch_pending(engine, paths):
+    path = _watch_pending_path(engine)
+    if path is None or not paths:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(paths, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def watch_main(argv=None):
+    """
+    监视模式：python -m sub0_2_1_5 watch <目录...> [--profile 方案] [选项]
+    新视频落地并稳定后自动探测、提取，每个输出目录的 Fonts 在每批之后重新合并；日志输出到 stderr，
+    stdout 每个视频输出一行 JSON（与 cli 模式相同）。Ctrl+C 退出：正在运行的批次会被取消，
+    未处理完与仍在等待稳定的文件保存下来，下次启动监视时重新加入队列
+    输出布局：beside 输出到视频所在目录；mirror 在 --outdir 下按监视目录的相对路径重建子目录
+    """
+    defaults = {"format": "ass", "font_mode": "子集合并", "layout": "beside", "outdir": None, "ass_fix": False,
+                "extensions": list(VIDEO_EXTENSIONS), "settle": 5.0, "poll_interval": 2.0}
+    parser = argparse.ArgumentParser(prog="sub0_2_1_5 watch", description="监视目录，新视频落地后自动提取字幕")
+    parser.add_argument("dirs", nargs="+", help="要监视的目录（含子目录）")
+    parser.add_argument("--profile", help="使用已保存的配置方案，命令行给出的选项优先")
+    parser.add_argument("--save-profile", metavar="NAME", help="把本次的选项保存为配置方案")
+    parser.add_argument("-f", "--format", choices=("ass", "srt", "ssa", "sup", "原格式"))
+    parser.add_argument("--font-mode", choices=("封装字体", "子集合并", "字体名还原", "无处理"))
+    parser.add_argument("--layout", choices=("beside", "mirror"))
+    parser.add_argument("-o", "--outdir", help="mirror 布局的输出根目录")
+    parser.add_argument("--ass-fix", action="store_true", default=None, help="修正 ASS 头部")
+    parser.add_argument("--settle", type=float, help="文件大小与修改时间保持不变多少秒后才处理（默认 5）")
+    parser.add_argument("--poll-interval", type=float, help="轮询模式的扫描间隔（秒，默认 2）")
+    parser.add_argument("--include-existing", action="store_true", help="启动时也处理目录中已有的视频")
+    parser.add_argument("--polling", action="store_true", help="不使用 inotify，始终定时扫描")
+    parser.add_argument("-j", "--workers", type=int, help="并行处理的视频数量")
+    parser.add_argument("--trace", metavar="FILE", help="每批结束后导出 Chrome trace JSON（覆盖）并输出汇总表")
+    parser.add_argument("--log-level", default="INFO", type=str.upper, choices=LOG_LEVELS, help="日志级别（默认 INFO）")
+    parser.add_argument("--log-file", help="同时把日志写入该文件（后台线程写入，按 10 MB 轮换）")
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level, args.log_file)
+
+    profile = dict(defaults)
+    if args.profile:
+        profiles = _load_watch_profiles()
+        if args.profile not in profiles:
+            parser.error(f"配置方案不存在: {args.profile}（{_watch_profiles_path()}）")
+        profile.update(profiles[args.profile])
+    for key in defaults:
+        value = getattr(args, key, None)
+        if value is not None:
+            profile[key] = value
+    if profile["layout"] == "mirror" and not profile["outdir"]:
+        parser.error("mirror 布局需要 --outdir")
+    if profile["outdir"]:
+        profile["outdir"] = os.path.abspath(profile["outdir"])
+    dirs = [os.path.abspath(d) for d in args.dirs]
+    for d in dirs:
+        if not os.path.isdir(d):
+            parser.error(f"目录不存在: {d}")
+    if args.save_profile:
+        _save_watch_profile(args.save_profile, profile)
+        print(f"配置方案已保存: {args.save_profile}", file=sys.stderr)
+
+    def output_dir(path):
+        folder = os.path.dirname(path)
+        if profile["layout"] == "beside":
+            return folder
+        root = max((d for d in dirs if os.path.commonpath([d, folder]) == d), key=len)
+        return os.path.normpath(os.path.join(profile["outdir"], os.path.basename(root), os.path.relpath(folder, root)))
+
+    out = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):  # 引擎的日志与子进程输出不混入 JSON 结果
+        engine = SubtitleEngine(journal_name="watch", trace_path=args.trace)
+        if args.workers:
+            engine.max_workers = max(1, args.workers)
+        engine.batch_ass_fix = profile["ass_fix"]
+        watcher = FolderWatcher(dirs, profile["extensions"], profile["settle"], profile["poll_interval"],
+                                include_existing=args.include_existing, use_inotify=not args.polling)
+        engine.log(f"👀 正在监视（{watcher.mode}）: {', '.join(dirs)}")
+        unfinished = _take_watch_pending(engine)
+        if unfinished:
+            engine.log(f"♻️ 上次退出时有 {len(unfinished)} 个视频未处理完，已重新加入队列")
+            watcher.requeue(unfinished)
+        unfinished = []  # 已从 watcher 取出、尚未处理完的文件
+        try:
+            while True:
+                ready = watcher.poll(1.0)
+                if not ready:
+                    continue
+                unfinished = list(ready)
+                # 重新写入的文件按新文件处理；处理完后从列表移除，长时间运行不累积
+                engine.files.remove(ready)
+                records, probe_failed = _load_files_interruptible(engine, ready)
+                groups = {}
+                for record in records:
+                    groups.setdefault(output_dir(record.fullpath), []).append((record.fullpath, record.filename))
+                if probe_failed:
+                    _write_batch_results(out, engine, probe_failed, probe_failed, False)
+                    unfinished = [p for p in unfinished if p not in probe_failed]
+                for outdir, selected_files in groups.items():
+                    engine.log(f"📥 处理 {len(selected_files)} 个新视频 → {outdir}")
+                    os.makedirs(outdir, exist_ok=True)
+                    paths = [path for path, _ in selected_files]
+                    # 输出目录下的 Fonts 累积所有已处理视频的字体，run_batch 每批结束后重新合并
+                    try:
+                        _run_batch_interruptible(engine, profile["format"], selected_files, outdir,
+                                                 profile["font_mode"])
+                    except KeyboardInterrupt:
+                        _write_batch_results(out, engine, paths, [], True)
+                        finished = {path for path, status, _ in engine.batch_results()
+                                    if status in ("success", "partial", "fail")}
+                        unfinished = [p for p in unfinished if p not in finished]
+                        raise
+                    _write_batch_results(out, engine, paths, [], False)
+                    unfinished = [p for p in unfinished if p not in paths]
+                engine.files.remove([record.fullpath for record in records])
+                unfinished = []
+        except KeyboardInterrupt:
+            pending = unfinished + watcher.pending()
+            _save_watch_pending(engine, pending)
+            engine.log(f"⏹️ 监视已停止（{len(pending)} 个视频未处理完，下次启动时继续）" if pending else "⏹️ 监视已停止")
+        finally:
+            watcher.close()
+            engine.close()
+    return 0
+
+
+# 启动时不应导入的模块：只在处理字体或打开窗口后才需要
+STARTUP_DEFERRED_MODULES = ("fontTools", "pypinyin", "tkinterdnd2")
+
+
+def startup_check(argv=None):
+    """
+    冷启动检查：在新的解释器中用 -X importtime 导入本模块，再创建主窗口（Tk()、create_widgets）并执行第一次
+    update_idletasks，统计模块导入耗时与窗口出现前的耗时，并确认字体/拼音模块没有被提前导入
+    没有图形界面（如无 DISPLAY 的 Linux）时只检查模块导入耗时，并明确提示窗口耗时未测量
+    多次运行取最快的一次以减少磁盘缓存的影响；超出预算或提前导入时返回 1（可用于 CI）
+    """
+    parser = argparse.ArgumentParser(prog="sub0_2_1_5 startup-check", description="检查启动耗时是否超出预算")
+    parser.add_argument("--budget", type=float, default=0.3, help="模块导入耗时预算（秒，默认 0.3）")
+    parser.add_argument("--window-budget", type=float, default=0.8, help="窗口出现前的耗时预算（秒，默认 0.8）")
+    parser.add_argument("--runs", type=int, default=3, help="运行次数，取最快的一次（默认 3）")
+    parser.add_argument("--top", type=int, default=10, help="列出累计耗时最多的模块数量")
+    args = parser.parse_args(argv)
+
+    module_dir = str(Path(__file__).resolve().parent)
+    module_name = Path(__file__).stem
+    # 计时从导入本模块开始；提前导入检查在创建窗口之前进行（窗口本身需要 tkinterdnd2）
+    code = f"""
+import time
+t0 = time.perf_counter()
+import {module_name} as app_module, sys, json
+report = {{"eager": [m for m in {STARTUP_DEFERRED_MODULES!r} if m in sys.modules], "window": None, "no_window": None}}
+try:
+    app_module.enable_dpi_awareness()
+    from tkinterdnd2 import TkinterDnD
+    root = TkinterDnD.Tk()
+    app = app_module.SubtitleExtractorApp(root)
+    root.update_idletasks()
+    report["window"] = time.perf_counter() - t0
+    root.destroy()
+    app.close()
+except Exception as e:
+    report["no_window"] = f"{{type(e).__name__}}: {{e}}"
+print(json.dumps(report, ensure_ascii=False))
+"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [module_dir, os.environ.get("PYTHONPATH")])))
+
+    best = None
+    for _ in range(max(1, args.runs)):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True,
+                                text=True, encoding="utf-8", env=env, cwd=module_dir)
+        if result.returncode != 0:
+            print(f"❌ 导入 {module_name} 失败:\n{result.stderr[-2000:]}")
+            return 1
+        # 每行格式：import time: self [us] | cumulative | imported package，子模块先于父模块输出，每层缩进两格
+        # 本模块的累计耗时即启动导入耗时，其中缩进两格的是它直接导入的模块
+        imports, total = [], 0.0
+        for line in result.stderr.splitlines():
+            m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)", line)
+            if not m:
+                continue
+            if m.group(4) == module_name and not m.group(3):
+                total = int(m.group(2)) / 1e6
+                break
+            if len(m.group(3)) == 2:
+                imports.append((int(m.group(2)), m.group(4)))
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        key = report["window"] if report["window"] is not None else total
+        if best is None or key < best[0]:
+            best = (key, total, imports, report)
+
+    _, total, imports, report = best
+    print(f"模块导入耗时: {total * 1000:.1f} ms（预算 {args.budget * 1000:.0f} ms，{args.runs} 次中最快）")
+    for cumulative, name in sorted(imports, reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    window = report["window"]
+    if window is not None:
+        print(f"窗口出现耗时: {window * 1000:.1f} ms（含导入、Tk()、create_widgets 与首次 update_idletasks，"
+              f"预算 {args.window_budget * 1000:.0f} ms）")
+    else:
+        print(f"⚠️ 无法创建窗口（{report['no_window']}），只测量了模块导入耗时，窗口出现耗时未检查")
+
+    ok = True
+    if report["eager"]:
+        print(f"❌ 启动时提前导入了: {', '.join(report['eager'])}")
+        ok = False
+    if total > args.budget:
+        print(f"❌ 模块导入耗时超出预算 {(total - args.budget) * 1000:.1f} ms")
+        ok = False
+    if window is not None and window > args.window_budget:
+        print(f"❌ 窗口出现耗时超出预算 {(window - args.window_budget) * 1000:.1f} ms")
+        ok = False
+    if ok:
+        print("✅ 冷启动检查通过" if window is not None else "✅ 模块导入检查通过（窗口耗时未检查）")
+    return 0 if ok else 1
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "cli":
+        sys.exit(cli_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "watch":
+        sys.exit(watch_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        from bench.benchmark import benchmark_main  # 基准测试在 bench/ 目录，不随程序打包
+        sys.exit(benchmark_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "startup-check":
+        sys.exit(startup_check(sys.argv[2:]))
+
+    enable_dpi_awareness()
+    from tkinterdnd2 import TkinterDnD
+
     root = TkinterDnD.Tk()
     app = SubtitleExtractorApp(root)
     root.mainloop()
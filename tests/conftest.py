@@ -0,0 +1,113 @@
+import _thread
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# 测试直接导入仓库根目录下的 sub0_2_1_5 与 bench
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StandinBatch:
+    """用 bench 的替身程序运行真实的探测与批处理流程，并统计替身 ffmpeg 的调用"""
+
+    def __init__(self, root, calls_log, config_path):
+        from sub0_2_1_5 import SubtitleEngine
+
+        self.root = root
+        self.calls_log = calls_log
+        self.config_path = config_path
+        self.engine = SubtitleEngine(journal_name="test")
+        self.engine.base_dir = Path(root)  # 不使用程序目录下的真实工具
+        self.engine.max_workers = 1  # 日志中的记录顺序固定
+
+    def make_videos(self, *names):
+        paths = []
+        for name in names:
+            path = os.path.join(self.root, "videos", name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(name.encode() + bytes(range(256)) * 4)  # 非 Matroska，走 ffmpeg 流程
+            paths.append(path)
+        return paths
+
+    def run(self, videos, subfmt="srt", font_mode="无处理", outdir=None):
+        """导入并处理 videos，返回 { 全路径: (状态, [输出文件]) }"""
+        self.engine.files.clear()
+        records, failed = self.engine.load_files(videos)
+        assert not failed
+        outdir = outdir or os.path.join(self.root, "out")
+        os.makedirs(outdir, exist_ok=True)
+        self.engine.run_batch(subfmt, [(r.fullpath, r.filename) for r in records], outdir, font_mode)
+        return {path: (status, outputs) for path, status, outputs in self.engine.batch_results()}
+
+    def configure(self, **fields):
+        """修改替身程序的配置（如 subs 字幕轨道数），对之后启动的调用生效"""
+        with open(self.config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        config.update(fields)
+        with open(self.config_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False)
+
+    def set_latency(self, **latency_ms):
+        """修改替身程序的固定延迟（毫秒）"""
+        self.configure(latency_ms=latency_ms)
+
+    def wait_for_call(self, tool, path, timeout=30):
+        """等待替身程序 tool 开始处理 path（不清空调用记录），供其它线程在处理中途取消或中断"""
+        prefix = json.dumps([tool])[:-1]
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if os.path.exists(self.calls_log):
+                with open(self.calls_log, "r", encoding="utf-8") as f:
+                    # 替身程序可能正在写入最后一行，只看完整的行
+                    if any(line.endswith("\n") and line.startswith(prefix) and path in json.loads(line)
+                           for line in f):
+                        return True
+            time.sleep(0.02)
+        return False
+
+    def interrupt_when_called(self, tool, path):
+        """替身程序 tool 开始处理 path 时向主线程发送 KeyboardInterrupt（相当于在终端按下 Ctrl+C）"""
+        def wait():
+            if self.wait_for_call(tool, path):
+                _thread.interrupt_main()
+
+        threading.Thread(target=wait, daemon=True).start()
+
+    def calls(self, tool):
+        """自上次读取以来替身程序 tool 的各次参数（读取后清空全部调用记录）"""
+        if not os.path.exists(self.calls_log):
+            return []
+        with open(self.calls_log, "r", encoding="utf-8") as f:
+            calls = [json.loads(line) for line in f]
+        os.remove(self.calls_log)
+        return [args for name, *args in calls if name == tool]
+
+    def ffmpeg_calls(self):
+        return self.calls("ffmpeg")
+
+    def ffmpeg_inputs(self):
+        """自上次调用以来替身 ffmpeg 处理过的输入文件（排序）"""
+        return sorted(args[args.index("-i") + 1] for args in self.ffmpeg_calls())
+
+
+@pytest.fixture
+def standin_batch(tmp_path, monkeypatch):
+    if os.name == "nt":
+        pytest.skip("替身程序的启动脚本需要 POSIX 系统")
+    from bench.benchmark import install_standins
+
+    calls_log = str(tmp_path / "calls.jsonl")
+    bin_dir, config_path = install_standins(str(tmp_path / "standins"), subs=2, lines=5, calls_log=calls_log)
+    monkeypatch.setenv("PATH", bin_dir + os.pathsep + os.environ.get("PATH", ""))
+    monkeypatch.setenv("SUBEXP_BENCH_CONFIG", config_path)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))  # 探测缓存、导出清单与批处理日志
+    monkeypatch.delenv("SUBEXP_TRACE", raising=False)
+    batch = StandinBatch(str(tmp_path), calls_log, config_path)
+    yield batch
+    batch.engine.close()
@@ -0,0 +1,56 @@
+"""界面的批处理收尾（不创建窗口）：工作线程结束时总会把 _finish_batch 交给主线程"""
+import pytest
+
+from sub0_2_1_5 import SubtitleEngine, SubtitleExtractorApp
+
+
+@pytest.fixture
+def app(standin_batch, monkeypatch):
+    app = SubtitleExtractorApp.__new__(SubtitleExtractorApp)  # 只初始化引擎部分
+    SubtitleEngine.__init__(app, journal_name="test")
+    app.posted = []
+    monkeypatch.setattr(app, "post_ui", lambda fn, *args: app.posted.append((fn.__name__, args)))
+    yield app
+    app.close()
+
+
+def test_finish_batch_posted_when_run_batch_raises(app, monkeypatch):
+    def broken(*args):
+        raise RuntimeError("磁盘已满")
+
+    monkeypatch.setattr(app, "run_batch", broken)
+    app.extract_subtitles_all("ass", [("/v/a.mkv", "a.mkv")], "/out", "无处理")
+    assert app.posted == [("_finish_batch", (None, False))]
+    assert app._batch_errors == [("批处理异常退出", "磁盘已满")]
+
+
+def test_finish_batch_posted_with_batch_result(app, monkeypatch):
+    monkeypatch.setattr(app, "run_batch", lambda *args: {"cancelled": True, "temp_outdir": "/tmp/subs_extract_1"})
+    app.extract_subtitles_all("ass", [("/v/a.mkv", "a.mkv")], None, "无处理")
+    assert app.posted == [("_finish_batch", ("/tmp/subs_extract_1", True))]
+
+
+class FakeWidget:
+    """只记录 state 的控件替身"""
+
+    def __init__(self, state="normal"):
+        self.state = state
+
+    def config(self, state):
+        self.state = state
+
+    def __getitem__(self, key):
+        assert key == "state"
+        return self.state
+
+
+def test_batch_disables_and_restores_option_widgets(app):
+    names = ("import_btn", "delete_btn", "clear_btn", "subfmt_cb", "extract_btn", "ass_fix_cb", "font_mode_cb",
+             "force_cb")
+    for name in names:
+        setattr(app, name, FakeWidget())
+    app.ass_fix_cb.state = "disabled"
+    app.save_and_disable_buttons()
+    assert {name: getattr(app, name).state for name in names} == dict.fromkeys(names, "disabled")
+    app.restore_buttons_state()
+    assert app.force_cb.state == "normal" and app.ass_fix_cb.state == "disabled"
@@ -0,0 +1,200 @@
+"""批处理的并行、子进程并发限制、暂停与取消，以及跟踪统计（bench 替身程序）"""
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from sub0_2_1_5 import AsyncProcessRunner
+
+
+@pytest.fixture
+def batch(standin_batch):
+    """在后台线程中运行批处理：start(videos) 后由测试线程暂停/取消，join() 返回 run_batch 的结果"""
+
+    class Batch:
+        outdir = os.path.join(standin_batch.root, "out")
+
+        def start(self, videos, outdir=outdir):
+            engine = standin_batch.engine
+            records, failed = engine.load_files(videos)
+            assert not failed
+            self.outdir = outdir
+            if outdir:
+                os.makedirs(outdir, exist_ok=True)
+            self.result = None
+            self.thread = threading.Thread(target=self._run, args=([(r.fullpath, r.filename) for r in records],),
+                                           daemon=True)
+            self.thread.start()
+
+        def _run(self, selected):
+            self.result = standin_batch.engine.run_batch("srt", selected, self.outdir, "无处理")
+
+        def join(self):
+            self.thread.join(60)
+            assert not self.thread.is_alive()
+            return self.result
+
+        def outputs(self):
+            folder = self.outdir or os.path.join(standin_batch.root, "videos")
+            return sorted(name for name in os.listdir(folder) if name.endswith(".srt"))
+
+    return Batch()
+
+
+def journal_temps(engine):
+    with open(engine.journal.path, "r", encoding="utf-8") as f:
+        return [entry["path"] for entry in map(json.loads, f) if entry["ev"] == "temp"]
+
+
+def limit_ffmpeg(engine, limit):
+    """同时运行的 ffmpeg 数量（默认等于 CPU 数，测试中固定下来）"""
+    engine.max_stream_workers = limit
+    engine.process_runner.limits["ffmpeg"] = limit
+
+
+def test_cancel_mid_batch_keeps_finished_videos(standin_batch, batch):
+    a, b, c = standin_batch.make_videos("a.mp4", "b.mp4", "c.mp4")
+    engine = standin_batch.engine
+    standin_batch.set_latency(ffmpeg=1000)
+    batch.start([a, b, c], outdir=None)  # 未指定输出目录：字幕写在视频旁边，另建合并字体用的临时目录
+    assert standin_batch.wait_for_call("ffmpeg", b)
+    engine.cancel()
+
+    assert batch.join() == {"cancelled": True, "temp_outdir": None}
+    results = {path: (status, outputs) for path, status, outputs in engine.batch_results()}
+    assert list(results) == [a] and results[a][0] == "success"  # 未完成的视频不染色
+    assert all(os.path.exists(p) for p in results[a][1])
+    assert batch.outputs() == ["a.chi1.srt", "a.eng2.srt"]
+    assert standin_batch.ffmpeg_inputs() == [a, b]  # c 没有开始
+    temps = journal_temps(engine)
+    assert temps and not any(os.path.exists(p) for p in temps)
+
+
+def test_pause_holds_next_video_until_resume(standin_batch, batch):
+    a, b = standin_batch.make_videos("a.mp4", "b.mp4")
+    engine = standin_batch.engine
+    standin_batch.set_latency(ffmpeg=300)
+    batch.start([a, b])
+    assert standin_batch.wait_for_call("ffmpeg", a)
+    engine.pause()
+    assert engine.paused
+
+    # a 中已在运行的子进程照常完成，b 在暂停期间不开始
+    assert not standin_batch.wait_for_call("ffmpeg", b, timeout=1.5)
+    assert batch.outputs() == ["a.chi1.srt", "a.eng2.srt"]
+    engine.resume()
+    assert batch.join() == {"cancelled": False, "temp_outdir": None}
+    assert [status for _, status, _ in engine.batch_results()] == ["success", "success"]
+    assert standin_batch.ffmpeg_inputs() == [a, b]
+
+
+def test_cancel_while_paused_does_not_start_waiting_videos(standin_batch, batch):
+    a, b = standin_batch.make_videos("a.mp4", "b.mp4")
+    engine = standin_batch.engine
+    standin_batch.set_latency(ffmpeg=300)
+    batch.start([a, b])
+    assert standin_batch.wait_for_call("ffmpeg", a)
+    engine.pause()
+    engine.cancel()
+    assert batch.join()["cancelled"]
+    assert not engine.paused
+    assert standin_batch.ffmpeg_inputs() == [a]
+
+
+def test_videos_run_in_parallel_up_to_max_workers(standin_batch, batch):
+    a, b, c = standin_batch.make_videos("a.mp4", "b.mp4", "c.mp4")
+    engine = standin_batch.engine
+    engine.max_workers = 2
+    limit_ffmpeg(engine, 2)
+    standin_batch.set_latency(ffmpeg=3000)
+    batch.start([a, b, c])
+    # a、b 的 ffmpeg 都已启动时还没有任何输出：两个视频同时在处理，c 排队
+    assert standin_batch.wait_for_call("ffmpeg", a) and standin_batch.wait_for_call("ffmpeg", b)
+    assert batch.outputs() == []
+    assert not standin_batch.wait_for_call("ffmpeg", c, timeout=0.5)
+    assert batch.join() == {"cancelled": False, "temp_outdir": None}
+    assert [status for _, status, _ in engine.batch_results()] == ["success"] * 3
+
+
+def test_ffmpeg_limit_queues_processes_across_videos(standin_batch, batch):
+    a, b = standin_batch.make_videos("a.mp4", "b.mp4")
+    engine = standin_batch.engine
+    engine.max_workers = 2
+    limit_ffmpeg(engine, 1)
+    standin_batch.set_latency(ffmpeg=500)
+    batch.start([a, b])
+    # 两个视频同时在处理，但 b 的 ffmpeg 在 a 的结束后才启动
+    assert standin_batch.wait_for_call("ffmpeg", b)
+    assert batch.outputs() == ["a.chi1.srt", "a.eng2.srt"]
+    assert batch.join() == {"cancelled": False, "temp_outdir": None}
+
+
+def sleeper(log, seconds):
+    """启动时与结束时各向 log 追加一行的子进程"""
+    code = (f"import sys, time\nopen(sys.argv[1], 'a').write('+\\n')\ntime.sleep({seconds})\n"
+            f"open(sys.argv[1], 'a').write('-\\n')")
+    return [sys.executable, "-c", code, log]
+
+
+def max_running(log):
+    running = peak = 0
+    with open(log, "r", encoding="utf-8") as f:
+        for line in f:
+            running += 1 if line.strip() == "+" else -1
+            peak = max(peak, running)
+    return peak
+
+
+def test_process_runner_limits_each_tool(tmp_path):
+    runner = AsyncProcessRunner(limits={"ffmpeg": 1}, default_limit=3)
+    ffmpeg_log, other_log = str(tmp_path / "ffmpeg.log"), str(tmp_path / "other.log")
+    futures = [runner.submit("ffmpeg", sleeper(ffmpeg_log, 0.2)) for _ in range(3)]
+    futures += [runner.submit("fontforge", sleeper(other_log, 0.5)) for _ in range(5)]
+    assert all(f.result(60).returncode == 0 for f in futures)
+    assert max_running(ffmpeg_log) == 1
+    assert 1 < max_running(other_log) <= 3  # 不受 ffmpeg 排队影响，但不超过默认上限
+
+
+def test_process_runner_cancel_all_kills_running_and_queued(tmp_path):
+    runner = AsyncProcessRunner(limits={"ffmpeg": 1})
+    log = str(tmp_path / "ffmpeg.log")
+    running = runner.submit("ffmpeg", sleeper(log, 60))
+    queued = runner.submit("ffmpeg", sleeper(log, 60))
+    deadline = time.monotonic() + 30
+    while not os.path.exists(log) and time.monotonic() < deadline:
+        time.sleep(0.02)
+
+    start = time.monotonic()
+    runner.cancel_all()
+    for future in (running, queued):
+        with pytest.raises(CancelledError):
+            future.result(30)
+    assert time.monotonic() - start < 30
+    with open(log, "r", encoding="utf-8") as f:
+        assert f.read() == "+\n"  # 排队的进程没有启动，运行中的被结束
+    cancel_event = threading.Event()
+    cancel_event.set()
+    with pytest.raises(CancelledError):
+        runner.submit("ffmpeg", sleeper(log, 60), cancel_event=cancel_event)
+
+
+def test_trace_stats_cover_probing_and_batch(standin_batch, tmp_path):
+    a, b = standin_batch.make_videos("a.mp4", "b.mp4")
+    engine = standin_batch.engine
+    engine.tracer.enabled = True
+    engine.trace_path = str(tmp_path / "trace.json")
+    standin_batch.run([a, b])
+
+    stats = engine.last_trace_stats
+    assert stats["batch"][0] == 1
+    assert stats["probe"][0] == 2 and stats["video"][0] == 2
+    assert stats["proc:ffprobe"][0] == 2 and stats["proc:ffmpeg"][0] == 2
+    assert engine.tracer.aggregate() == {}  # 每批结束后清空
+    with open(engine.trace_path, "r", encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+    videos = {e["args"].get("video") for e in events if e["name"] == "proc:ffmpeg"}
+    assert videos == {"a.mp4", "b.mp4"}
@@ -0,0 +1,154 @@
+"""BatchJournal：截断的末行、崩溃后恢复与 quarantine.json 的隔离阈值"""
+import json
+import os
+
+import pytest
+
+from sub0_2_1_5 import BatchJournal
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "a.mkv"
+    path.write_bytes(b"video")
+    return str(path)
+
+
+def touch_later(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_recover_ignores_truncated_trailing_line(tmp_path):
+    journal = BatchJournal(tmp_path, "batch")
+    journal.begin({"subfmt": "ass"})
+    journal.record("temp", path="/tmp/subs_a")
+    journal.record("video_start", path="/v/a.mkv")
+    journal.record("video_done", path="/v/a.mkv", status="success", outputs=[])
+    journal.record("video_start", path="/v/b.mkv")
+    journal.record("temp", path="/tmp/subs_b")
+    journal.record("keep", path="/tmp/subs_b")
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"ev": "video_done", "path": "/v/b.m')  # 写到一半时断电
+
+    previous = BatchJournal(tmp_path, "batch").recover()
+    assert previous["params"] == {"subfmt": "ass"}
+    assert list(previous["done"]) == ["/v/a.mkv"]
+    assert previous["unfinished"] == ["/v/b.mkv"]
+    assert previous["temps"] == ["/tmp/subs_a"]
+
+
+def test_recover_returns_none_without_an_unfinished_batch(tmp_path):
+    journal = BatchJournal(tmp_path, "batch")
+    assert journal.recover() is None
+    journal.begin({"subfmt": "ass"})
+    journal.record("video_start", path="/v/a.mkv")
+    journal.end()
+    assert journal.recover() is None
+
+    with open(journal.path, "w", encoding="utf-8") as f:
+        f.write('{"ev": "sta')  # 连开始记录都没写完
+    assert journal.recover() is None
+
+
+def test_begin_replaces_previous_batch(tmp_path):
+    journal = BatchJournal(tmp_path, "batch")
+    journal.begin({"n": 1})
+    journal.record("video_start", path="/v/a.mkv")
+    journal.begin({"n": 2})
+    assert journal.recover() == {"params": {"n": 2}, "done": {}, "unfinished": [], "temps": []}
+    with open(journal.path, "r", encoding="utf-8") as f:
+        assert [json.loads(line)["ev"] for line in f] == ["start"]
+
+
+def test_quarantine_threshold(tmp_path, video):
+    journal = BatchJournal(tmp_path, "batch", quarantine_after=2)
+    assert journal.add_failure(video, "处理中途退出") == 1
+    assert journal.quarantined(video) is None
+    assert journal.add_failure(video, "子进程超时") == 2
+    assert journal.quarantined(video) == "子进程超时"
+
+    # quarantine.json 在各批处理日志之间共享，重新打开后仍然有效
+    assert BatchJournal(tmp_path, "cli", quarantine_after=2).quarantined(video) == "子进程超时"
+    with open(tmp_path / "quarantine.json", "r", encoding="utf-8") as f:
+        assert json.load(f)[video]["count"] == 2
+
+
+def test_quarantine_released_when_source_changes_or_cleared(tmp_path, video):
+    journal = BatchJournal(tmp_path, "batch", quarantine_after=2)
+    journal.add_failure(video, "处理中途退出")
+    journal.add_failure(video, "处理中途退出")
+    touch_later(video)
+    assert journal.quarantined(video) is None
+    assert journal.add_failure(video, "处理中途退出") == 1  # 新版本的文件重新计数
+
+    journal.add_failure(video, "处理中途退出")
+    assert journal.quarantined(video)
+    journal.clear_failures([video])
+    assert journal.quarantined(video) is None
+    assert journal.add_failure(video, "处理中途退出") == 1
+    journal.clear_failures()
+    with open(tmp_path / "quarantine.json", "r", encoding="utf-8") as f:
+        assert json.load(f) == {}
+
+
+def simulate_crash(journal_path, unfinished, leftover_temp):
+    """把正常结束的批次日志改成处理 unfinished 时崩溃的样子：去掉 end 与它的 video_done，末行写到一半"""
+    with open(journal_path, "r", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    entries = [e for e in entries if e["ev"] != "end" and not (e["ev"] == "video_done" and e["path"] == unfinished)]
+    entries.append({"ev": "temp", "path": leftover_temp})
+    with open(journal_path, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in entries)
+        f.write('{"ev": "video_done", "pa')
+
+
+def test_engine_resumes_after_crash(standin_batch, tmp_path):
+    a, b = standin_batch.make_videos("a.mp4", "b.mp4")
+    engine = standin_batch.engine
+    engine.force_rebuild = True  # 不让导出清单跳过，只看批处理日志的恢复
+    first = standin_batch.run([a, b])
+    assert [first[p][0] for p in (a, b)] == ["success", "success"]
+    assert standin_batch.ffmpeg_inputs() == [a, b]
+
+    leftover = tmp_path / "subs_extract_leftover"
+    leftover.mkdir()
+    simulate_crash(engine.journal.path, b, str(leftover))
+
+    second = standin_batch.run([a, b])
+    assert standin_batch.ffmpeg_inputs() == [b]  # a 上次已完成，直接沿用结果
+    assert second[a] == first[a]
+    assert second[b][0] == "success"
+    assert not leftover.exists()
+    assert engine.journal.recover() is None
+
+
+def test_engine_quarantines_repeated_crashes(standin_batch):
+    a, b = standin_batch.make_videos("a.mp4", "b.mp4")
+    engine = standin_batch.engine
+    engine.force_rebuild = True
+    engine.journal.quarantine_after = 1
+    standin_batch.run([a, b])
+    standin_batch.ffmpeg_inputs()
+    simulate_crash(engine.journal.path, b, os.path.join(standin_batch.root, "missing_temp"))
+
+    result = standin_batch.run([a, b])
+    assert standin_batch.ffmpeg_inputs() == []
+    assert result[b][0] == "fail"
+    assert engine.journal.quarantined(b) == "处理中途退出"
+
+
+def test_video_without_subtitles_is_finished_not_unfinished(standin_batch):
+    """没有字幕轨道的视频也写入 video_done：批次之后崩溃时不会被当作处理中途退出而隔离"""
+    a, b = standin_batch.make_videos("a.mp4", "b.mp4")
+    engine = standin_batch.engine
+    engine.journal.quarantine_after = 1
+    standin_batch.configure(subs=0)
+    assert standin_batch.run([a, b]) == {a: ("fail", []), b: ("fail", [])}
+    assert standin_batch.ffmpeg_inputs() == []
+
+    simulate_crash(engine.journal.path, None, os.path.join(standin_batch.root, "missing_temp"))
+    previous = engine.journal.recover()
+    assert sorted(previous["done"]) == [a, b] and previous["unfinished"] == []
+    standin_batch.run([a, b])
+    assert engine.journal.quarantined(a) is None and engine.journal._load_failures() == {}
@@ -0,0 +1,57 @@
+"""命令行模式：stdout 的 JSON 结果与退出码（0 成功 / 1 有失败 / 130 被中断），Ctrl+C 在探测或批处理中途都有效"""
+import json
+
+import pytest
+
+import sub0_2_1_5
+
+
+@pytest.fixture
+def cli(standin_batch, capsys):
+    """运行 cli_main，返回 (退出码, { 路径: 状态 }, 汇总)"""
+    def run(*args):
+        code = sub0_2_1_5.cli_main([*args, "-f", "srt", "--font-mode", "无处理", "-j", "1", "--log-level", "WARNING"])
+        lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        summary = lines.pop()["summary"]
+        return code, {line["path"]: line["status"] for line in lines}, summary
+
+    return run
+
+
+def test_all_success_exits_0(standin_batch, cli):
+    a, b = standin_batch.make_videos("a.mp4", "b.mp4")
+    code, statuses, summary = cli(a, b)
+    assert code == 0
+    assert statuses == {a: "success", b: "success"}
+    assert summary["success"] == 2 and summary["total"] == 2 and not summary["cancelled"]
+
+
+def test_failure_exits_1(standin_batch, cli):
+    a, = standin_batch.make_videos("a.mp4")
+    standin_batch.configure(subs=0)  # 没有字幕轨道
+    code, statuses, summary = cli(a)
+    assert code == 1
+    assert statuses == {a: "fail"} and summary["fail"] == 1
+
+
+def test_interrupt_during_batch_exits_130(standin_batch, cli):
+    a, b = standin_batch.make_videos("a.mp4", "b.mp4")
+    standin_batch.set_latency(ffmpeg=1000)
+    standin_batch.interrupt_when_called("ffmpeg", b)
+    code, statuses, summary = cli(a, b)
+    assert code == 130
+    assert statuses == {a: "success", b: "cancelled"}
+    assert summary["cancelled"]
+
+
+def test_interrupt_during_probing_exits_130(standin_batch, cli):
+    videos = standin_batch.make_videos(*(f"v{n:02d}.mp4" for n in range(20)))
+    standin_batch.set_latency(ffprobe=1000)
+    standin_batch.interrupt_when_called("ffprobe", videos[0])
+    code, statuses, summary = cli(*videos)
+    assert code == 130
+    assert statuses == dict.fromkeys(videos, "cancelled")
+    assert summary["cancelled"]
+    # 中断后不再开始新的探测（并行探测 8 个），也不开始批处理
+    calls = standin_batch.calls("ffprobe")
+    assert 0 < len(calls) <= 8
@@ -0,0 +1,126 @@
+"""FileRegistry：勾选计数与变更通知（Treeview 增量刷新依赖这两者）"""
+import threading
+
+import pytest
+
+from sub0_2_1_5 import FileRecord, FileRegistry
+
+
+@pytest.fixture
+def registry():
+    registry = FileRegistry()
+    registry.events = []
+    registry.subscribe(lambda kind, payload: registry.events.append((kind, payload)))
+    return registry
+
+
+def paths(records):
+    return [record.fullpath for record in records]
+
+
+def assert_counts(registry, checked):
+    """维护的勾选数量与逐条统计一致"""
+    assert len(registry.checked()) == checked
+    assert registry._checked_count == checked
+    assert registry.all_checked() == (bool(registry) and checked == len(registry))
+
+
+def test_add_many_skips_existing_and_notifies_once(registry):
+    added = registry.add_many([FileRecord("/v/a.mkv"), FileRecord("/v/b.mkv", checked=False)])
+    assert paths(added) == ["/v/a.mkv", "/v/b.mkv"]
+    assert registry.events == [("add", added)]
+
+    again = registry.add_many([FileRecord("/v/a.mkv"), FileRecord("/v/c.mkv")])
+    assert paths(again) == ["/v/c.mkv"]
+    assert registry.events[-1] == ("add", again)
+    assert registry.add(FileRecord("/v/c.mkv")) is False
+    assert len(registry.events) == 2  # 没有新增时不通知
+
+    assert paths(registry) == ["/v/a.mkv", "/v/b.mkv", "/v/c.mkv"]
+    assert_counts(registry, checked=2)
+
+
+def test_checked_counts_follow_every_mutation(registry):
+    registry.add_many([FileRecord(f"/v/{n}.mkv") for n in "abcd"])
+    assert_counts(registry, checked=4)
+
+    registry.toggle("/v/a.mkv")
+    assert_counts(registry, checked=3)
+    registry.update("/v/b.mkv", checked=False)
+    registry.update("/v/b.mkv", checked=False)  # 重复设置不重复计数
+    assert_counts(registry, checked=2)
+
+    registry.remove(["/v/a.mkv"])  # 删除未勾选的
+    assert_counts(registry, checked=2)
+    registry.remove(["/v/c.mkv"])  # 删除已勾选的
+    assert_counts(registry, checked=1)
+
+    registry.set_all_checked(True)
+    assert_counts(registry, checked=2)
+    registry.set_all_checked(False)
+    assert_counts(registry, checked=0)
+
+    registry.clear()
+    assert_counts(registry, checked=0)
+    assert not registry.all_checked()
+
+
+def test_change_events(registry):
+    a, b = registry.add_many([FileRecord("/v/a.mkv"), FileRecord("/v/b.mkv")])
+    registry.events.clear()
+
+    assert registry.update("/v/a.mkv", width=1920, height=1080) is a
+    assert (a.width, a.height) == (1920, 1080)
+    assert registry.toggle("/v/b.mkv") is b
+    assert registry.update("/v/missing.mkv", width=1) is None
+    assert registry.toggle("/v/missing.mkv") is None
+    assert registry.events == [("update", [a]), ("update", [b])]
+
+    registry.set_all_checked(True)
+    assert registry.events[-1] == ("refresh", None)
+
+    removed = registry.remove(["/v/missing.mkv", "/v/a.mkv"])
+    assert removed == [a]
+    assert registry.events[-1] == ("remove", ["/v/a.mkv"])
+    event_count = len(registry.events)
+    registry.remove(["/v/missing.mkv"])
+    assert len(registry.events) == event_count
+
+    registry.clear()
+    assert registry.events[-1] == ("clear", None)
+
+
+def test_slice_follows_import_order_after_changes(registry):
+    registry.add_many([FileRecord(f"/v/{n}.mkv") for n in "abcde"])
+    assert paths(registry.slice(1, 3)) == ["/v/b.mkv", "/v/c.mkv"]
+    registry.remove(["/v/b.mkv"])
+    assert paths(registry.slice(1, 3)) == ["/v/c.mkv", "/v/d.mkv"]
+    registry.add(FileRecord("/v/f.mkv"))
+    assert paths(registry.slice(3, 10)) == ["/v/e.mkv", "/v/f.mkv"]
+
+
+def test_iteration_is_a_snapshot(registry):
+    registry.add_many([FileRecord("/v/a.mkv"), FileRecord("/v/b.mkv")])
+    seen = []
+    for record in registry:
+        seen.append(record.fullpath)
+        registry.remove([record.fullpath])
+    assert seen == ["/v/a.mkv", "/v/b.mkv"]
+    assert not registry
+
+
+def test_listeners_run_outside_the_lock(registry):
+    """回调在锁外执行：回调中等待另一个线程修改列表不会死锁"""
+    registry.add(FileRecord("/v/a.mkv"))
+
+    def on_change(kind, payload):
+        if kind == "update":
+            worker = threading.Thread(target=registry.add, args=(FileRecord("/v/b.mkv"),))
+            worker.start()
+            worker.join(timeout=5)
+            assert not worker.is_alive()
+
+    registry.subscribe(on_change)
+    registry.toggle("/v/a.mkv")
+    assert "/v/b.mkv" in registry
+    assert registry.events[-1][0] == "add"
@@ -0,0 +1,276 @@
+"""MatroskaReader：用合成的 MKV 检查 EBML 解析、zlib 压缩、Cues 直达与 Cluster 遍历、字幕重建和附件筛选"""
+import os
+import zlib
+
+import pytest
+
+from sub0_2_1_5 import MatroskaReader as M
+
+
+# ----------------- 合成 MKV -----------------
+def _id(eid):
+    return eid.to_bytes((eid.bit_length() + 7) // 8, "big")
+
+
+def el(eid, *children):
+    """元素尺寸统一写成 8 字节变长整数，位置计算不受内容长度影响"""
+    payload = b"".join(children)
+    return _id(eid) + b"\x01" + len(payload).to_bytes(7, "big") + payload
+
+
+def uint(eid, value):
+    return el(eid, value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big"))
+
+
+def string(eid, value):
+    return el(eid, value.encode("utf-8"))
+
+
+def block_payload(track, rel_timecode, data):
+    return bytes([0x80 | track]) + rel_timecode.to_bytes(2, "big", signed=True) + b"\x00" + data
+
+
+ASS_HEADER = ("[Script Info]\r\nScriptType: v4.00+\r\nPlayResX: 1920\r\nPlayResY: 1080\r\n\r\n"
+              "[V4+ Styles]\r\nFormat: Name, Fontname, Fontsize\r\nStyle: Default,Arial,60\r\n\r\n"
+              "[Events]\r\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\r\n")
+
+ASS_UID, SRT_UID = 102, 103
+
+# (Cluster 时间码, [(轨道号, 相对时间, 时长, 数据)])，时间单位 ms（TimecodeScale = 1000000）
+# ASS 块数据以 ReadOrder 开头：第二个 Cluster 的行 ReadOrder 为 0，重建后排在前面
+CLUSTERS = [
+    (0, [(1, 0, None, b"\x00" * 4096),
+         (2, 1000, 1500, "1,0,Default,,0,0,0,,你好，世界".encode("utf-8")),
+         (3, 1200, 800, b"Hello")]),
+    (5000, [(1, 0, None, b"\x01" * 4096),
+            (2, 250, 2000, b"0,0,Default,,0,0,0,,{\\i1}second line{\\i0}"),
+            (3, 0, 1000, b"Line one\nLine two")]),
+]
+
+EXPECTED_ASS = (ASS_HEADER.rstrip("\r\n") + "\r\n"
+                "Dialogue: 0,0:00:05.25,0:00:07.25,Default,,0,0,0,,{\\i1}second line{\\i0}\r\n"
+                "Dialogue: 0,0:00:01.00,0:00:02.50,Default,,0,0,0,,你好，世界\r\n").encode("utf-8")
+
+EXPECTED_SRT = (b"1\n00:00:01,200 --> 00:00:02,000\nHello\n\n"
+                b"2\n00:00:05,000 --> 00:00:06,000\nLine one\nLine two\n\n")
+
+ATTACHMENTS = [("Sub.TTF", "font/ttf", b"\x00\x01\x00\x00ttf-data"),
+               ("cover.jpg", "image/jpeg", b"\xff\xd8jpeg"),
+               ("extra.otf", "font/otf", b"OTTOotf-data")]
+
+
+def build_mkv(path, compressed=False, cues=False, tags=False, extra_tracks=()):
+    """extra_tracks: 插在视频轨道之后的其它 TrackEntry（没有数据块）"""
+    def pack(data):
+        return zlib.compress(data) if compressed else data
+
+    encodings = b""
+    if compressed:
+        encodings = el(M.ID_CONTENTENCODINGS, el(
+            M.ID_CONTENTENCODING, uint(M.ID_CONTENTENCODINGORDER, 0), uint(M.ID_CONTENTENCODINGSCOPE, 3),
+            uint(M.ID_CONTENTENCODINGTYPE, 0), el(M.ID_CONTENTCOMPRESSION, uint(M.ID_CONTENTCOMPALGO, 0))))
+
+    info = el(M.ID_INFO, uint(M.ID_TIMECODESCALE, 1000000))
+    tracks = el(
+        M.ID_TRACKS,
+        el(M.ID_TRACKENTRY, uint(M.ID_TRACKNUMBER, 1), uint(M.ID_TRACKUID, 101), uint(M.ID_TRACKTYPE, 0x01),
+           string(M.ID_CODECID, "V_MPEG4/ISO/AVC")),
+        *extra_tracks,
+        el(M.ID_TRACKENTRY, uint(M.ID_TRACKNUMBER, 2), uint(M.ID_TRACKUID, ASS_UID), uint(M.ID_TRACKTYPE, 0x11),
+           string(M.ID_CODECID, "S_TEXT/ASS"), el(M.ID_CODECPRIVATE, pack(ASS_HEADER.encode("utf-8"))),
+           string(M.ID_LANGUAGE, "chi"), encodings),
+        el(M.ID_TRACKENTRY, uint(M.ID_TRACKNUMBER, 3), uint(M.ID_TRACKUID, SRT_UID), uint(M.ID_TRACKTYPE, 0x11),
+           string(M.ID_CODECID, "S_TEXT/UTF8"), encodings),
+    )
+    attachments = el(M.ID_ATTACHMENTS, *[
+        el(M.ID_ATTACHEDFILE, string(M.ID_FILENAME, name), string(M.ID_FILEMIMETYPE, mime), el(M.ID_FILEDATA, data))
+        for name, mime, data in ATTACHMENTS])
+
+    def seekhead(cues_pos, tags_pos):
+        def seek(eid, pos):
+            return el(M.ID_SEEK, el(M.ID_SEEKID, _id(eid)), el(M.ID_SEEKPOSITION, pos.to_bytes(8, "big")))
+        entries = [seek(M.ID_INFO, 0)]
+        if cues_pos is not None:
+            entries.append(seek(M.ID_CUES, cues_pos))
+        if tags_pos is not None:
+            entries.append(seek(M.ID_TAGS, tags_pos))
+        return el(M.ID_SEEKHEAD, *entries)
+
+    # 先用占位位置计算 SeekHead 的长度（SeekPosition 固定 8 字节，长度与位置无关）
+    offset = len(seekhead(0 if cues else None, 0 if tags else None)) + len(info) + len(tracks) + len(attachments)
+    clusters, cue_points = [], []
+    for timecode, blocks in CLUSTERS:
+        children = [uint(M.ID_TIMECODE, timecode)]
+        for track, rel, duration, data in blocks:
+            relative = sum(len(c) for c in children)
+            if duration is None:
+                children.append(el(M.ID_SIMPLEBLOCK, block_payload(track, rel, data)))
+            else:
+                children.append(el(M.ID_BLOCKGROUP, el(M.ID_BLOCK, block_payload(track, rel, pack(data))),
+                                   uint(M.ID_BLOCKDURATION, duration)))
+                cue_points.append(el(M.ID_CUEPOINT, uint(0xB3, timecode + rel), el(
+                    M.ID_CUETRACKPOSITIONS, uint(M.ID_CUETRACK, track), uint(M.ID_CUECLUSTERPOSITION, offset),
+                    uint(M.ID_CUERELATIVEPOSITION, relative))))
+        cluster = el(M.ID_CLUSTER, *children)
+        clusters.append(cluster)
+        offset += len(cluster)
+
+    tail, cues_pos, tags_pos = b"", None, None
+    if cues:
+        cues_pos = offset + len(tail)
+        tail += el(M.ID_CUES, *cue_points)
+    if tags:
+        tags_pos = offset + len(tail)
+        tail += el(M.ID_TAGS, *[
+            el(M.ID_TAG, el(M.ID_TARGETS, uint(M.ID_TAGTRACKUID, uid)),
+               el(M.ID_SIMPLETAG, string(M.ID_TAGNAME, "NUMBER_OF_FRAMES"), string(M.ID_TAGSTRING, "2")))
+            for uid in (ASS_UID, SRT_UID)])
+
+    segment = seekhead(cues_pos, tags_pos) + info + tracks + attachments + b"".join(clusters) + tail
+    with open(path, "wb") as f:
+        f.write(el(M.ID_EBML, string(M.ID_DOCTYPE, "matroska")) + el(M.ID_SEGMENT, segment))
+    return path
+
+
+# ----------------- 测试 -----------------
+LAYOUTS = {
+    "plain": dict(),
+    "zlib": dict(compressed=True),
+    "cued": dict(cues=True, tags=True),
+    "cued_zlib": dict(compressed=True, cues=True, tags=True),
+    "cues_without_tags": dict(cues=True),
+}
+
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+def test_export_text_tracks_byte_for_byte(tmp_path, layout):
+    path = build_mkv(tmp_path / "video.mkv", **LAYOUTS[layout])
+    ass_out, srt_out = tmp_path / "out.ass", tmp_path / "out.srt"
+    with M(str(path)) as reader:
+        reader.export_text_tracks({2: str(ass_out), 3: str(srt_out)})
+    assert ass_out.read_bytes() == EXPECTED_ASS
+    assert srt_out.read_bytes() == EXPECTED_SRT
+
+
+def test_cues_used_only_when_frame_count_tags_cover_track(tmp_path):
+    with M(str(build_mkv(tmp_path / "cued.mkv", cues=True, tags=True))) as reader:
+        cued = reader._cued_blocks({2, 3})
+        assert cued is not None and {n: len(b) for n, b in cued.items()} == {2: 2, 3: 2}
+    # 没有 NUMBER_OF_FRAMES 标签时无法确认 Cues 覆盖全部字幕块，回退到遍历 Cluster
+    with M(str(build_mkv(tmp_path / "untagged.mkv", cues=True))) as reader:
+        assert reader._cued_blocks({2, 3}) is None
+    with M(str(build_mkv(tmp_path / "plain.mkv"))) as reader:
+        assert reader._cued_blocks({2, 3}) is None
+
+
+def test_tracks_and_stream_mapping(tmp_path):
+    with M(str(build_mkv(tmp_path / "video.mkv", compressed=True))) as reader:
+        assert [(t["number"], t["codec_id"], t["language"]) for t in reader.tracks] == [
+            (1, "V_MPEG4/ISO/AVC", "eng"), (2, "S_TEXT/ASS", "chi"), (3, "S_TEXT/UTF8", "eng")]
+        assert reader.timecode_scale == 1000000
+        # ffprobe 的流序号：0 为视频，字幕从 1 开始
+        assert reader.stream_track(1)["number"] == 2
+        assert reader.stream_track(2)["number"] == 3
+        assert reader.stream_track(3) is None
+        with pytest.raises(RuntimeError):
+            reader.export_text_tracks({1: str(tmp_path / "video.ass")})
+
+
+def test_font_attachments_filtered_and_written(tmp_path):
+    with M(str(build_mkv(tmp_path / "video.mkv"))) as reader:
+        assert [e["name"] for e in reader.attachments()] == ["Sub.TTF", "cover.jpg", "extra.otf"]
+        fonts = reader.font_attachments()
+        assert [(e["name"], e["mime"], e["size"]) for e in fonts] == [
+            ("Sub.TTF", "font/ttf", len(ATTACHMENTS[0][2])), ("extra.otf", "font/otf", len(ATTACHMENTS[2][2]))]
+        for entry, expected in zip(fonts, (ATTACHMENTS[0][2], ATTACHMENTS[2][2])):
+            out = tmp_path / entry["name"]
+            reader.write_attachment(entry, str(out))
+            assert out.read_bytes() == expected
+
+
+def test_rejects_non_matroska(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"\x00\x00\x00\x18ftypmp42" + b"\x00" * 64)
+    assert not M.is_matroska(str(path))
+    assert M.is_matroska(str(build_mkv(tmp_path / "video.mkv")))
+
+
+def test_native_reader_not_tried_for_other_containers(standin_batch, monkeypatch):
+    """MP4/TS 等输入不调用原生读取器（不会产生读取失败的警告与多余的打开）"""
+    engine = standin_batch.engine
+    assert engine.subtitle_engine == "native"
+    calls = []
+    monkeypatch.setattr(engine, "extract_subtitles_native", lambda *args: calls.append(args) or {})
+    a, = standin_batch.make_videos("a.mp4")
+    result = standin_batch.run([a], subfmt="srt")
+    assert result[a][0] == "success"
+
+    stream = engine.files.get(a).probe.subtitle_streams()[0]
+    outpath, _ = engine.extract_single_subtitle(a, "a.mp4", stream, "ass", os.path.join(standin_batch.root, "out"), "无处理",
+                                                None, 1920, 1080, 23.976)
+    assert os.path.exists(outpath)
+    assert calls == []
+
+
+
+# 混合轨道：音频（jpn）、ffmpeg 不建流的控制轨道与没有 CodecID 的轨道、另一条没有内容的 ASS 轨道（jpn）
+# 插在视频与字幕之间
+MIXED_TRACKS = (
+    el(M.ID_TRACKENTRY, uint(M.ID_TRACKNUMBER, 4), uint(M.ID_TRACKUID, 104), uint(M.ID_TRACKTYPE, 0x02),
+       string(M.ID_CODECID, "A_AAC"), string(M.ID_LANGUAGE, "jpn")),
+    el(M.ID_TRACKENTRY, uint(M.ID_TRACKNUMBER, 5), uint(M.ID_TRACKUID, 105), uint(M.ID_TRACKTYPE, 0x20),
+       string(M.ID_CODECID, "X_CONTROL")),
+    el(M.ID_TRACKENTRY, uint(M.ID_TRACKNUMBER, 6), uint(M.ID_TRACKUID, 106), uint(M.ID_TRACKTYPE, 0x11)),
+    el(M.ID_TRACKENTRY, uint(M.ID_TRACKNUMBER, 7), uint(M.ID_TRACKUID, 107), uint(M.ID_TRACKTYPE, 0x11),
+       string(M.ID_CODECID, "S_TEXT/ASS"), el(M.ID_CODECPRIVATE, ASS_HEADER.encode("utf-8")),
+       string(M.ID_LANGUAGE, "jpn")),
+)
+MIXED_STREAMS = [("video", "h264", "eng"), ("audio", "aac", "jpn"), ("subtitle", "ass", "jpn"),
+                 ("subtitle", "ass", "chi"), ("subtitle", "subrip", "eng")]
+
+
+def probe_streams(skip=(), languages=None):
+    """混合轨道 MKV 对应的 ffprobe 流（不含附件）；skip 中的位置模拟 ffmpeg 没有为其建流"""
+    streams = []
+    for position, (codec_type, codec_name, language) in enumerate(MIXED_STREAMS):
+        if position in skip:
+            continue
+        language = (languages or {}).get(position, language)
+        streams.append({"index": len(streams), "codec_type": codec_type, "codec_name": codec_name,
+                        "tags": {"language": language}})
+    return streams
+
+
+def test_probe_tracks_checks_mixed_tracks_against_probe(tmp_path):
+    with M(str(build_mkv(tmp_path / "mixed.mkv", extra_tracks=MIXED_TRACKS))) as reader:
+        tracks = reader.probe_tracks(probe_streams())
+        assert {index: track["number"] for index, track in tracks.items()} == {0: 1, 1: 4, 2: 7, 3: 2, 4: 3}
+        # ffmpeg 没有为音频建流：只按位置对应会把 jpn 的 ASS 轨道当成 chi 的导出
+        assert reader.stream_track(2)["number"] == 7
+        assert reader.probe_tracks(probe_streams(skip=(1,))) is None
+        assert reader.probe_tracks(probe_streams(languages={3: "eng"})) is None
+        swapped = probe_streams()
+        swapped[1]["codec_type"] = "subtitle"
+        assert reader.probe_tracks(swapped) is None
+
+
+@pytest.mark.parametrize("skip", [(), (1,)])
+def test_native_export_falls_back_when_probe_disagrees(standin_batch, tmp_path, skip):
+    from sub0_2_1_5 import FileRecord, ProbeSummary
+
+    engine = standin_batch.engine
+    path = str(build_mkv(tmp_path / "mixed.mkv", extra_tracks=MIXED_TRACKS))
+    summary = ProbeSummary.from_probe({"streams": probe_streams(skip)})
+    engine.files.add(FileRecord(path, probe=summary))
+    outdir = tmp_path / "out"
+    outdir.mkdir()
+    jobs = [(stream, "srt" if stream["codec_name"] == "subrip" else "ass") for stream in summary.subtitle_streams()
+            if stream["tags"]["language"] != "jpn"]
+    exported = engine.extract_subtitles_native(path, "mixed.mkv", jobs, str(outdir))
+    if skip:
+        assert exported == {}  # 交给 ffmpeg，不会把错误的轨道写到正确的文件名下
+        assert not any(outdir.iterdir())
+    else:
+        assert sorted(exported) == [3, 4]
+        assert open(exported[3], "rb").read() == EXPECTED_ASS
+        assert open(exported[4], "rb").read() == EXPECTED_SRT
@@ -0,0 +1,66 @@
+"""导出清单的跳过：未变化的轨道不再调用 ffmpeg，设置或源文件变化时重新导出（bench 替身程序）"""
+import os
+
+import pytest
+
+
+def exported(calls):
+    """各次 ffmpeg 调用写出的字幕文件名（排序）"""
+    return sorted(os.path.basename(arg) for args in calls for arg in args
+                  if os.path.splitext(arg)[1] in (".ass", ".srt"))
+
+
+@pytest.fixture
+def first_run(standin_batch):
+    """a、b 两个视频各两条 ASS 轨道已导出一次"""
+    videos = standin_batch.make_videos("a.mp4", "b.mp4")
+    result = standin_batch.run(videos, subfmt="ass")
+    assert exported(standin_batch.ffmpeg_calls()) == ["a.chi1.ass", "a.eng2.ass", "b.chi1.ass", "b.eng2.ass"]
+    return videos, result
+
+
+def test_unchanged_tracks_are_skipped(standin_batch, first_run):
+    videos, result = first_run
+    again = standin_batch.run(videos, subfmt="ass")
+    assert standin_batch.ffmpeg_calls() == []
+    assert again == result  # 跳过的轨道仍报告为成功并给出原输出
+
+
+def test_deleted_output_re_exports_only_that_track(standin_batch, first_run):
+    videos, result = first_run
+    a = videos[0]
+    os.remove(result[a][1][1])
+    again = standin_batch.run(videos, subfmt="ass")
+    assert exported(standin_batch.ffmpeg_calls()) == ["a.eng2.ass"]
+    assert again[a][0] == "success" and sorted(again[a][1]) == sorted(result[a][1])
+
+
+def test_changed_source_re_exports_that_video(standin_batch, first_run):
+    videos, _ = first_run
+    a = videos[0]
+    st = os.stat(a)
+    os.utime(a, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    standin_batch.run(videos, subfmt="ass")
+    assert standin_batch.ffmpeg_inputs() == [a]
+
+
+@pytest.mark.parametrize("change", ["ass_fix", "format", "outdir"])
+def test_changed_settings_re_export(standin_batch, first_run, change):
+    videos, _ = first_run
+    kwargs = {"subfmt": "ass"}
+    if change == "ass_fix":
+        standin_batch.engine.batch_ass_fix = True
+    elif change == "format":
+        kwargs["subfmt"] = "srt"
+    else:
+        kwargs["outdir"] = os.path.join(standin_batch.root, "other")
+    result = standin_batch.run(videos, **kwargs)
+    assert standin_batch.ffmpeg_inputs() == sorted(videos)
+    assert all(status == "success" for status, _ in result.values())
+
+
+def test_force_rebuild_re_exports_everything(standin_batch, first_run):
+    videos, _ = first_run
+    standin_batch.engine.force_rebuild = True
+    standin_batch.run(videos, subfmt="ass")
+    assert exported(standin_batch.ffmpeg_calls()) == ["a.chi1.ass", "a.eng2.ass", "b.chi1.ass", "b.eng2.ass"]
@@ -0,0 +1,198 @@
+"""ProbeCache 的失效与淘汰、OutputManifest 的“是否仍是最新”判断（临时 SQLite 文件）"""
+import json
+import os
+import zlib
+
+import pytest
+
+import sub0_2_1_5
+from sub0_2_1_5 import OutputManifest, ProbeCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可控的 time.time()：last_used 严格递增，淘汰顺序确定"""
+    now = [1000.0]
+
+    def tick():
+        now[0] += 1
+        return now[0]
+
+    monkeypatch.setattr(sub0_2_1_5.time, "time", tick)
+    return now
+
+
+def make_file(path, data=b"video"):
+    path.write_bytes(data)
+    return str(path)
+
+
+def bump_mtime(path, ns=1_000_000_000):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + ns))
+
+
+# ----------------- ProbeCache -----------------
+def test_probe_cache_hit_and_scopes(tmp_path):
+    cache = ProbeCache(tmp_path / "cache" / "probe.sqlite3")
+    video = make_file(tmp_path / "a.mkv")
+    st = os.stat(video)
+    cache.put(video, st, {"streams": [1]}, scope="lean")
+    assert cache.get(video, st, scope="lean") == {"streams": [1]}
+    assert cache.get(video, st, scope="full") is None
+    # 相对路径与绝对路径是同一个键
+    assert cache.get(os.path.relpath(video), st, scope="lean") == {"streams": [1]}
+    cache.close()
+
+
+def test_probe_cache_invalidated_by_size_or_mtime(tmp_path):
+    cache = ProbeCache(tmp_path / "probe.sqlite3")
+    video = make_file(tmp_path / "a.mkv")
+    cache.put(video, os.stat(video), {"v": 1})
+
+    bump_mtime(video)
+    assert cache.get(video, os.stat(video)) is None
+
+    cache.put(video, os.stat(video), {"v": 2})
+    assert cache.get(video, os.stat(video)) == {"v": 2}
+    st = os.stat(video)
+    with open(video, "ab") as f:
+        f.write(b"more")
+    os.utime(video, ns=(st.st_atime_ns, st.st_mtime_ns))  # 只改大小
+    assert cache.get(video, os.stat(video)) is None
+    cache.close()
+
+
+def test_probe_cache_persists_across_reopen(tmp_path):
+    db = tmp_path / "probe.sqlite3"
+    video = make_file(tmp_path / "a.mkv")
+    cache = ProbeCache(db)
+    cache.put(video, os.stat(video), {"v": 1})
+    cache.close()
+    cache = ProbeCache(db)
+    assert cache.get(video, os.stat(video)) == {"v": 1}
+    cache.close()
+
+
+def test_probe_cache_evicts_least_recently_used(tmp_path, clock):
+    videos = [make_file(tmp_path / f"{name}.mkv") for name in "abc"]
+    # 随机数据压缩后大小几乎不变；上限为 2.5 条时，第三条写入后淘汰最久未使用的一条
+    infos = [{"blob": os.urandom(1000).hex()} for _ in videos]
+    entry_bytes = max(len(zlib.compress(json.dumps(info, separators=(",", ":")).encode())) for info in infos)
+    cache = ProbeCache(tmp_path / "probe.sqlite3", max_bytes=int(entry_bytes * 2.5))
+    a, b, c = videos
+    cache.put(a, os.stat(a), infos[0])
+    cache.put(b, os.stat(b), infos[1])
+    assert cache.get(a, os.stat(a)) == infos[0]  # a 变为最近使用
+    cache.put(c, os.stat(c), infos[2])
+
+    assert cache.get(b, os.stat(b)) is None
+    assert cache.get(a, os.stat(a)) == infos[0]
+    assert cache.get(c, os.stat(c)) == infos[2]
+    cache.close()
+
+
+# ----------------- OutputManifest -----------------
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = OutputManifest(tmp_path / "outputs.sqlite3")
+    yield manifest
+    manifest.close()
+
+
+@pytest.fixture
+def exported(tmp_path, manifest):
+    """一个视频的轨道 2 已导出为 out/a.chi2.ass 并记入清单"""
+    video = make_file(tmp_path / "a.mkv")
+    outdir = tmp_path / "out"
+    outdir.mkdir()
+    outpath = make_file(outdir / "a.chi2.ass", b"[Script Info]\n")
+    target = OutputManifest.target("ass", str(outdir))
+    manifest.put(video, os.stat(video), [(2, target, "font_mode=无处理;ass_fix=0", outpath)])
+    return video, target, outpath
+
+
+def test_manifest_uptodate(manifest, exported):
+    video, target, outpath = exported
+    assert manifest.lookup(video, os.stat(video), 2, target, "font_mode=无处理;ass_fix=0") == outpath
+
+
+def test_manifest_target_normalizes_outdir(tmp_path):
+    outdir = str(tmp_path / "out")
+    assert OutputManifest.target("ass", os.path.join(outdir, "..", "out")) == OutputManifest.target("ass", outdir)
+    assert OutputManifest.target("ass", outdir) != OutputManifest.target("srt", outdir)
+    assert OutputManifest.target("ass", None) == "ass|"
+
+
+@pytest.mark.parametrize("change", ["options", "stream", "format", "outdir"])
+def test_manifest_stale_when_settings_change(tmp_path, manifest, exported, change):
+    video, target, _ = exported
+    stream, options = 2, "font_mode=无处理;ass_fix=0"
+    if change == "options":
+        options = "font_mode=无处理;ass_fix=1"
+    elif change == "stream":
+        stream = 3
+    elif change == "format":
+        target = OutputManifest.target("srt", str(tmp_path / "out"))
+    else:
+        target = OutputManifest.target("ass", str(tmp_path / "other"))
+    assert manifest.lookup(video, os.stat(video), stream, target, options) is None
+
+
+def test_manifest_stale_when_source_changes(manifest, exported):
+    video, target, _ = exported
+    bump_mtime(video)
+    assert manifest.lookup(video, os.stat(video), 2, target, "font_mode=无处理;ass_fix=0") is None
+
+
+def test_manifest_stale_when_output_modified_or_deleted(manifest, exported):
+    video, target, outpath = exported
+    options = "font_mode=无处理;ass_fix=0"
+    with open(outpath, "ab") as f:
+        f.write(b"edited")
+    assert manifest.lookup(video, os.stat(video), 2, target, options) is None
+
+    manifest.put(video, os.stat(video), [(2, target, options, outpath)])
+    assert manifest.lookup(video, os.stat(video), 2, target, options) == outpath
+    os.remove(outpath)
+    assert manifest.lookup(video, os.stat(video), 2, target, options) is None
+
+
+def test_manifest_requires_recorded_fonts_dir(tmp_path, manifest, exported):
+    video, target, outpath = exported
+    options = "font_mode=子集合并;ass_fix=0"
+    fonts_dir = tmp_path / "out" / "Fonts"
+    fonts_dir.mkdir()
+    manifest.put(video, os.stat(video), [(2, target, options, outpath)], fonts_dir=str(fonts_dir))
+    assert manifest.lookup(video, os.stat(video), 2, target, options) == outpath
+    fonts_dir.rmdir()
+    assert manifest.lookup(video, os.stat(video), 2, target, options) is None
+
+
+def test_manifest_skips_missing_outputs(tmp_path, manifest):
+    video = make_file(tmp_path / "a.mkv")
+    target = OutputManifest.target("srt", None)
+    manifest.put(video, os.stat(video), [(2, target, "", str(tmp_path / "missing.srt"))])
+    assert manifest.lookup(video, os.stat(video), 2, target, "") is None
+
+
+# ----------------- 引擎的精简探测 -----------------
+def test_lean_probe_requests_only_needed_entries_and_caches_per_scope(standin_batch):
+    a, = standin_batch.make_videos("a.mp4")
+    engine = standin_batch.engine
+
+    def probe_args():
+        engine.files.clear()
+        records, failed = engine.load_files([a])
+        assert len(records) == 1 and not failed
+        return standin_batch.calls("ffprobe")
+
+    args, = probe_args()
+    assert args[args.index("-show_entries") + 1] == engine.lean_probe_entries
+    assert "-show_streams" not in args and args[-1] == a
+    assert probe_args() == []  # 未修改的文件直接来自缓存
+
+    engine.lean_probe = False  # 完整探测与精简探测分开缓存
+    args, = probe_args()
+    assert "-show_streams" in args and "-show_entries" not in args
+    assert probe_args() == []
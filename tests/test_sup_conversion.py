@@ -0,0 +1,29 @@
+"""SUP 转换：单个轨道失败时只清理自己的临时 ASS，不删除同一视频各轨道共用的字体目录"""
+import os
+import tempfile
+
+
+def test_failed_stream_keeps_shared_font_dir(standin_batch, tmp_path):
+    engine = standin_batch.engine
+    fonts = tmp_path / "sub_fonts_shared"
+    fonts.mkdir()
+    (fonts / "Font.ttf").write_bytes(b"ttf")
+    ass_temp = tmp_path / "ass_temp_1"
+    ass_temp.mkdir()
+    stream = {"index": 1, "codec_type": "subtitle", "codec_name": "ass", "tags": {"language": "chi"}}
+
+    outpath = engine.handle_sup_conversion("/v/a.mkv", "a.mkv", stream, str(tmp_path), str(fonts), 1920, 1080,
+                                           23.976, ass_path=str(ass_temp / "missing.ass"))
+    assert outpath is None
+    assert not ass_temp.exists()
+    assert os.listdir(fonts) == ["Font.ttf"]
+
+
+def test_sup_batch_removes_font_dir_after_all_streams(standin_batch, tmp_path, monkeypatch):
+    temp_root = tmp_path / "tmp"
+    temp_root.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(temp_root))
+    a, = standin_batch.make_videos("a.mp4")
+    result = standin_batch.run([a], subfmt="sup")
+    assert result[a][0] == "success" and len(result[a][1]) == 2
+    assert os.listdir(temp_root) == []  # 各轨道的临时 ASS 与共用的字体目录都已删除
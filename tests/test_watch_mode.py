@@ -0,0 +1,105 @@
+"""监视模式：Ctrl+C 取消正在运行的批次并退出，未处理完的文件在下次启动时重新加入队列（bench 替身程序）"""
+import json
+import os
+import sys
+import time
+
+import pytest
+
+import sub0_2_1_5
+from sub0_2_1_5 import FolderWatcher
+
+
+@pytest.fixture
+def watch(standin_batch, capsys):
+    """运行 watch_main，返回 stdout 中每个视频的结果 { 路径: 状态 }"""
+    folder = os.path.join(standin_batch.root, "videos")
+
+    def run(*extra):
+        args = [folder, "--polling", "--poll-interval", "0.05", "--settle", "0", "-f", "srt", "--font-mode", "无处理",
+                "-j", "1", "--log-level", "WARNING", *extra]
+        assert sub0_2_1_5.watch_main(args) == 0
+        lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        return {line["path"]: line["status"] for line in lines}
+
+    return run
+
+
+def pending_file(standin_batch):
+    return os.path.join(standin_batch.engine.journal.directory, "watch_pending.json")
+
+
+def stop_when_idle(monkeypatch, expected):
+    """expected 中的视频都输出结果后，下一次等待新文件时模拟 Ctrl+C"""
+    written = set()
+    write_batch_results = sub0_2_1_5._write_batch_results
+    poll = FolderWatcher.poll
+
+    def record(out, engine, paths, *args):
+        written.update(paths)
+        return write_batch_results(out, engine, paths, *args)
+
+    def poll_until_done(self, timeout=1.0):
+        if written >= set(expected):
+            raise KeyboardInterrupt
+        return poll(self, timeout)
+
+    monkeypatch.setattr(sub0_2_1_5, "_write_batch_results", record)
+    monkeypatch.setattr(FolderWatcher, "poll", poll_until_done)
+
+
+def test_interrupt_cancels_batch_and_requeues_unfinished(standin_batch, watch, monkeypatch):
+    a, b = standin_batch.make_videos("a.mp4", "b.mp4")
+    standin_batch.set_latency(ffmpeg=1000)
+    standin_batch.interrupt_when_called("ffmpeg", b)
+    assert watch("--include-existing") == {a: "success", b: "cancelled"}
+    with open(pending_file(standin_batch), "r", encoding="utf-8") as f:
+        assert json.load(f) == [b]
+
+    # 重新启动（不处理已有文件）：只有上次未完成的 b 被处理
+    standin_batch.set_latency()
+    standin_batch.ffmpeg_calls()
+    stop_when_idle(monkeypatch, [b])
+    assert watch() == {b: "success"}
+    assert standin_batch.ffmpeg_inputs() == [b]
+    assert not os.path.exists(pending_file(standin_batch))
+
+
+def test_interrupt_while_idle_keeps_unsettled_files(standin_batch, watch, monkeypatch):
+    a, = standin_batch.make_videos("a.mp4")
+    poll = FolderWatcher.poll
+
+    def interrupted_poll(self, timeout=1.0):
+        self.settle = 3600  # 文件还没有稳定时退出
+        poll(self, 0)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(FolderWatcher, "poll", interrupted_poll)
+    assert watch("--include-existing") == {}
+    with open(pending_file(standin_batch), "r", encoding="utf-8") as f:
+        assert json.load(f) == [a]
+
+
+@pytest.mark.parametrize("use_inotify", [False, pytest.param(True, marks=pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="inotify 只在 Linux 上可用"))])
+def test_watcher_returns_files_once_they_settle(tmp_path, use_inotify):
+    watcher = FolderWatcher([str(tmp_path)], settle=0.5, poll_interval=0, use_inotify=use_inotify)
+    try:
+        video = tmp_path / "a.mkv"
+        video.write_bytes(b"part")
+        (tmp_path / "notes.txt").write_text("不是视频")
+        assert watcher.poll(0.1) == []
+        assert watcher.pending() == [str(video)]
+
+        # 仍在写入：每次变化都重新开始计时
+        time.sleep(0.3)
+        with open(video, "ab") as f:
+            f.write(b" more")
+        time.sleep(0.3)
+        assert watcher.poll(0.1) == []
+
+        time.sleep(0.6)
+        assert watcher.poll(0.1) == [str(video)]
+        assert watcher.poll(0.1) == [] and watcher.pending() == []
+    finally:
+        watcher.close()